@@ -0,0 +1,205 @@
+import json
+import os
+import time
+import uuid
+
+from generate import GENERATION_PARAMS, MODEL, PARSE_STATS, STRUCTURED_PARAMS, parse_answer, summary_messages
+from ledger import BATCH_DISCOUNT
+
+# Batch files and the state of the batch in flight, so an interrupted run can pick it up again
+BATCH_DIR = os.environ.get(
+    "AI_SUMMARY_BATCH_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "batches"),
+)
+STATE_FILE = "state.json"
+TERMINAL_STATES = ("completed", "failed", "expired", "cancelled")
+COMPLETIONS_URL = "/v1/chat/completions"
+INGEST_BATCH_SIZE = 500
+
+
+class LocalBatchClient:
+    """
+    Runs a batch file in this process, one request at a time, through
+    `respond(body)`, which returns a chat completion response as a dict.
+    Output files live in `directory`, so a restarted process still finds the
+    results. Stands in for the batch API in tests and when none is available.
+    """
+    # Its requests are ordinary API calls, billed at the usual price
+    discount = 1.0
+
+    def __init__(self, directory, respond):
+        self.directory = directory
+        self.respond = respond
+
+    def _output_path(self, batch_id):
+        return os.path.join(self.directory, f"{batch_id}.output.jsonl")
+
+    def submit(self, path):
+        batch_id = f"local-{uuid.uuid4().hex}"
+        tmp_path = self._output_path(batch_id) + ".tmp"
+        with open(path) as requests, open(tmp_path, "w") as out:
+            for line in requests:
+                request = json.loads(line)
+                try:
+                    result = {"response": {"status_code": 200, "body": self.respond(request["body"])}, "error": None}
+                except Exception as e:
+                    result = {"response": None, "error": {"message": str(e)}}
+                out.write(json.dumps({"custom_id": request["custom_id"], **result}) + "\n")
+        os.replace(tmp_path, self._output_path(batch_id))
+        return batch_id
+
+    def status(self, batch_id):
+        return "completed" if os.path.exists(self._output_path(batch_id)) else "failed"
+
+    def results(self, batch_id):
+        with open(self._output_path(batch_id)) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+class OpenAIBatchClient:
+    """The OpenAI Batch API: the file is uploaded and run within 24 hours at a discount."""
+    discount = BATCH_DISCOUNT
+
+    def __init__(self, client):
+        self.client = client
+
+    def _request(self, method, url, params=None):
+        requestor = self.client.api_requestor.APIRequestor()
+        response, _, _ = requestor.request(method, url, params)
+        return response.data
+
+    def submit(self, path):
+        with open(path, "rb") as f:
+            upload = self.client.File.create(file=f, purpose="batch")
+        batch = self._request("post", "/batches", {
+            "input_file_id": upload["id"],
+            "endpoint": COMPLETIONS_URL,
+            "completion_window": "24h",
+        })
+        return batch["id"]
+
+    def status(self, batch_id):
+        return self._request("get", f"/batches/{batch_id}")["status"]
+
+    def results(self, batch_id):
+        batch = self._request("get", f"/batches/{batch_id}")
+        lines = []
+        # Requests that failed are reported in a separate error file
+        for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+            if file_id:
+                content = self.client.File.download(file_id).decode("utf-8")
+                lines.extend(json.loads(line) for line in content.splitlines() if line.strip())
+        return lines
+
+
+def load_state(directory):
+    """The batch a previous run submitted but hasn't ingested yet, or None."""
+    try:
+        with open(os.path.join(directory, STATE_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_state(directory, state):
+    tmp_path = os.path.join(directory, STATE_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, os.path.join(directory, STATE_FILE))
+
+
+def batch_request(custom_id, outcome_name, outcome_description, all_comments):
+    """One line of a batch file: the same request generate_summary_parts() sends."""
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": COMPLETIONS_URL,
+        "body": {
+            "model": MODEL,
+            "messages": summary_messages(outcome_name, outcome_description, all_comments),
+            **GENERATION_PARAMS,
+            **STRUCTURED_PARAMS,
+        },
+    }
+
+
+def submit_batch(client, directory, outcomes):
+    """
+    Write a batch file for `outcomes` (outcome_name, outcome_id, description,
+    comments, input_hash), submit it and record the batch in the state file.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"requests-{int(time.time())}.jsonl")
+    summaries = {}
+    with open(path, "w") as f:
+        for number, (outcome_name, outcome_id, outcome_description, all_comments, summary_hash) in enumerate(outcomes):
+            custom_id = f"outcome-{number}"
+            summaries[custom_id] = [outcome_name, outcome_id, outcome_description, summary_hash]
+            f.write(json.dumps(batch_request(custom_id, outcome_name, outcome_description, all_comments)) + "\n")
+
+    state = {"batch_id": client.submit(path), "input_file": path, "submitted_at": time.time(), "summaries": summaries}
+    _save_state(directory, state)
+    return state
+
+
+def wait_for_batch(client, state, poll_interval=60.0, sleep=time.sleep):
+    """Poll until the batch is finished one way or another and return its final status."""
+    while True:
+        status = client.status(state["batch_id"])
+        if status in TERMINAL_STATES:
+            return status
+        print(f"⏳ Batch {state['batch_id']} is {status}; checking again in {poll_interval:g}s")
+        sleep(poll_interval)
+
+
+def summary_rows(state, results, ledger=None, discount=1.0):
+    """
+    Turn batch results into rows for store_summaries(); returns (rows, failed).
+    Each result is also recorded in `ledger` (a UsageLedger) when given.
+    """
+    rows = []
+    for result in results:
+        summary = state["summaries"].get(result.get("custom_id"))
+        if summary is None:
+            continue
+        outcome_name, outcome_id, outcome_description, summary_hash = summary
+        response = result.get("response") or {}
+        body = response.get("body") or {}
+        if result.get("error") or response.get("status_code") != 200:
+            status = "error"
+            reason = (result.get("error") or {}).get("message") or f"status {response.get('status_code')}"
+        else:
+            try:
+                # No retry here: an unusable answer's outcome is simply in the next run's batch again
+                strengths, improvement = parse_answer(body["choices"][0]["message"], PARSE_STATS)
+                status = "ok"
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                status, reason = "unparseable", e
+        if ledger is not None:
+            usage = body.get("usage") or {}
+            ledger.record("batch", body.get("model", MODEL), usage.get("prompt_tokens"), usage.get("completion_tokens"),
+                          None, status, discount, outcome=outcome_name)
+        if status != "ok":
+            print(f"❌ Error for {outcome_name}: {reason}")
+            continue
+        rows.append((outcome_name, outcome_id, outcome_description, strengths, improvement, summary_hash))
+    # Requests the batch never got to (expired or cancelled) count as failed too
+    return rows, len(state["summaries"]) - len(rows)
+
+
+def finish_batch(client, directory, state, store, poll_interval=60.0, sleep=time.sleep, ledger=None):
+    """
+    Wait for the batch in `state`, store every summary it produced with
+    `store(rows)` and clear the state. Returns (written, failed). If the
+    process stops before this returns, the next run resumes from the state file.
+    The requests' usage is recorded in `ledger` when given.
+    """
+    status = wait_for_batch(client, state, poll_interval, sleep)
+    if status != "completed":
+        print(f"⚠️ Batch {state['batch_id']} {status}; keeping the summaries it finished.")
+    rows, failed = summary_rows(state, client.results(state["batch_id"]) if status != "failed" else [],
+                                ledger, client.discount)
+    for start in range(0, len(rows), INGEST_BATCH_SIZE):
+        store(rows[start:start + INGEST_BATCH_SIZE])
+    os.remove(os.path.join(directory, STATE_FILE))
+    return len(rows), failed
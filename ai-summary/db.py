@@ -1,9 +1,63 @@
 import sqlite3
 import os
+import queue
+import sys
+import threading
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 db_path = os.path.abspath(os.path.join(script_dir, "..", "backend", "data.db"))
 
+# Share the backend's query wrapper so slow statements here land in the same slow-query log
+root_dir = os.path.dirname(script_dir)
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
+from backend.queries import run_many, run_query
+# Writes hold the lock a sync's publish takes, so none of them lands in a file being replaced
+from backend.snapshot import write_lock
+
+# Summaries of one outcome within one course and term ('' where a comment has none), also
+# written by the API's on-demand summaries (backend/summaries.py) for a course or term slice
+PARTITION_TABLE = """
+CREATE TABLE IF NOT EXISTS all_scores_ai_summary_slices (
+    outcome_name TEXT NOT NULL,
+    course_code TEXT NOT NULL DEFAULT '',
+    term_title TEXT NOT NULL DEFAULT '',
+    strengths_text TEXT,
+    improvement_text TEXT,
+    input_hash TEXT,
+    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (outcome_name, course_code, term_title)
+);
+"""
+
+# Every API request the generator makes (see ledger.py), and the settings of the run that made it
+USAGE_TABLE = """
+CREATE TABLE IF NOT EXISTS ai_summary_usage (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    outcome TEXT,
+    request TEXT,
+    model TEXT,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    latency_ms REAL,
+    retries INTEGER,
+    status TEXT,
+    cost REAL,
+    created_at TIMESTAMP
+);
+"""
+RUNS_TABLE = """
+CREATE TABLE IF NOT EXISTS ai_summary_runs (
+    run_id TEXT PRIMARY KEY,
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    mode TEXT,
+    summarizer TEXT,
+    workers INTEGER,
+    prompt_budget INTEGER
+);
+"""
+
 def create_ai_summaries_table():
     query = """
     CREATE TABLE IF NOT EXISTS all_scores_ai_summaries (
@@ -12,13 +66,30 @@ def create_ai_summaries_table():
         outcome_description TEXT,
         strengths_text TEXT,
         improvement_text TEXT,
-        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        input_hash TEXT
     );
     """
-    with sqlite3.connect(db_path) as conn:
+    with write_lock(db_path), sqlite3.connect(db_path) as conn:
         conn.execute(query)
+        conn.execute(PARTITION_TABLE)
+        conn.execute(USAGE_TABLE)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_ai_summary_usage_run ON ai_summary_usage (run_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_ai_summary_usage_outcome ON ai_summary_usage (outcome)")
+        conn.execute(RUNS_TABLE)
+        # Tables created before input_hash existed get the column added; their summaries regenerate once
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(all_scores_ai_summaries)")}
+        if "input_hash" not in columns:
+            conn.execute("ALTER TABLE all_scores_ai_summaries ADD COLUMN input_hash TEXT")
         conn.commit()
 
+def fetch_input_hashes():
+    """input_hash of every stored summary, by outcome name."""
+    with sqlite3.connect(db_path) as conn:
+        rows = run_query(conn.cursor(), "ai_summary_hashes",
+                         "SELECT outcome_name, input_hash FROM all_scores_ai_summaries")
+    return {outcome_name: input_hash for outcome_name, input_hash in rows}
+
 def fetch_grouped_comments(limit=None):
     query = """
     SELECT outcome_name, GROUP_CONCAT(comment, '\n') as all_comments
@@ -26,10 +97,137 @@ def fetch_grouped_comments(limit=None):
     WHERE comment IS NOT NULL
     GROUP BY outcome_name
     """
+    params = ()
+    if limit:
+        query += " LIMIT ?"
+        params = (int(limit),)
+    with sqlite3.connect(db_path) as conn:
+        return run_query(conn.cursor(), "ai_grouped_comments", query, params)
+
+def fetch_comment_details():
+    """
+    Every comment with its score and date, as {outcome_name: [(comment, score, created_on)]},
+    for choosing which comments go into a prompt. Empty if all_scores has no
+    score/created_on columns.
+    """
+    query = """
+    SELECT outcome_name, comment, score, created_on
+    FROM all_scores
+    WHERE comment IS NOT NULL
+    ORDER BY outcome_name, created_on
+    """
+    with sqlite3.connect(db_path) as conn:
+        try:
+            rows = run_query(conn.cursor(), "ai_comment_details", query)
+        except sqlite3.OperationalError:
+            return {}
+    details = {}
+    for outcome_name, comment, score, created_on in rows:
+        details.setdefault(outcome_name, []).append((comment, score, created_on))
+    return details
+
+def fetch_partition_comments():
+    """Every comment with its score and date, as {(outcome_name, course_code, term_title): [(comment, score, created_on)]}."""
+    query = """
+    SELECT outcome_name, COALESCE(course_code, '') AS course_code, COALESCE(term_title, '') AS term_title,
+           comment, score, created_on
+    FROM all_scores
+    WHERE comment IS NOT NULL
+    ORDER BY outcome_name, course_code, term_title, created_on
+    """
+    with sqlite3.connect(db_path) as conn:
+        rows = run_query(conn.cursor(), "ai_partition_comments", query)
+    partitions = {}
+    for outcome_name, course_code, term_title, comment, score, created_on in rows:
+        partitions.setdefault((outcome_name, course_code, term_title), []).append((comment, score, created_on))
+    return partitions
+
+def fetch_partition_summaries():
+    """Stored partition summaries as {(outcome_name, course_code, term_title): (strengths, improvement, input_hash)}."""
+    with sqlite3.connect(db_path) as conn:
+        rows = run_query(conn.cursor(), "ai_partition_summaries", """
+            SELECT outcome_name, course_code, term_title, strengths_text, improvement_text, input_hash
+            FROM all_scores_ai_summary_slices
+            WHERE course_code != '' OR term_title != ''
+        """)
+    return {(row[0], row[1], row[2]): (row[3], row[4], row[5]) for row in rows}
+
+def store_partition_summaries(summaries):
+    """Upsert a batch of (outcome_name, course_code, term_title, strengths, improvement, input_hash) rows."""
+    with write_lock(db_path), sqlite3.connect(db_path) as conn:
+        run_many(conn.cursor(), "ai_partition_summaries_upsert", """
+            INSERT INTO all_scores_ai_summary_slices
+                (outcome_name, course_code, term_title, strengths_text, improvement_text, input_hash)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (outcome_name, course_code, term_title) DO UPDATE SET
+                strengths_text=excluded.strengths_text,
+                improvement_text=excluded.improvement_text,
+                input_hash=excluded.input_hash,
+                last_updated=CURRENT_TIMESTAMP
+        """, summaries)
+        conn.commit()
+
+def store_run(run_id, mode, summarizer, workers, prompt_budget):
+    with write_lock(db_path), sqlite3.connect(db_path) as conn:
+        run_query(conn.cursor(), "ai_run_insert",
+                  "INSERT INTO ai_summary_runs (run_id, mode, summarizer, workers, prompt_budget) VALUES (?, ?, ?, ?, ?)",
+                  (run_id, mode, summarizer, workers, prompt_budget))
+        conn.commit()
+
+def store_usage(rows):
+    """Append a batch of ledger rows (see ledger.UsageLedger.record)."""
+    with write_lock(db_path), sqlite3.connect(db_path) as conn:
+        run_many(conn.cursor(), "ai_usage_insert", """
+            INSERT INTO ai_summary_usage
+                (run_id, outcome, request, model, prompt_tokens, completion_tokens, latency_ms, retries, status, cost,
+                 created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        conn.commit()
+
+USAGE_COLUMNS = """
+    COUNT(*) AS calls,
+    SUM(status != 'ok') AS failed,
+    SUM(retries > 0) AS retried,
+    SUM(prompt_tokens) AS prompt_tokens,
+    SUM(completion_tokens) AS completion_tokens,
+    ROUND(AVG(latency_ms)) AS avg_latency_ms,
+    MAX(latency_ms) AS max_latency_ms,
+    ROUND(SUM(cost), 6) AS cost
+"""
+
+def fetch_usage_report(by="run", run_id=None, limit=None):
+    """
+    API usage totals per run (newest first, with the run's settings and how
+    long its requests took end to end) or per outcome (costliest first),
+    optionally for one run.
+    """
+    if by == "run":
+        query = f"""
+        SELECT u.run_id, r.started_at, r.mode, r.summarizer, r.workers, r.prompt_budget, {USAGE_COLUMNS},
+               ROUND((julianday(MAX(u.created_at)) - julianday(MIN(u.created_at))) * 86400) AS seconds
+        FROM ai_summary_usage u
+        LEFT JOIN ai_summary_runs r ON r.run_id = u.run_id
+        WHERE ? IS NULL OR u.run_id = ?
+        GROUP BY u.run_id
+        ORDER BY MIN(u.created_at) DESC
+        """
+    else:
+        query = f"""
+        SELECT outcome, COUNT(DISTINCT run_id) AS runs, {USAGE_COLUMNS}
+        FROM ai_summary_usage
+        WHERE ? IS NULL OR run_id = ?
+        GROUP BY outcome
+        ORDER BY SUM(cost) DESC, outcome
+        """
+    params = (run_id, run_id)
     if limit:
-        query += f" LIMIT {limit}"
+        query += " LIMIT ?"
+        params += (int(limit),)
     with sqlite3.connect(db_path) as conn:
-        return conn.execute(query).fetchall()
+        cursor = conn.cursor()
+        rows = run_query(cursor, f"ai_usage_by_{by}", query, params)
+        return [column[0] for column in cursor.description], rows
 
 def fetch_outcome_metadata(outcome_name):
     query = """
@@ -38,25 +236,96 @@ def fetch_outcome_metadata(outcome_name):
     WHERE name = ?
     """
     with sqlite3.connect(db_path) as conn:
-        result = conn.execute(query, (outcome_name,)).fetchone()
-        if result:
-            return result[0], result[1]
+        rows = run_query(conn.cursor(), "ai_outcome_metadata", query, (outcome_name,))
+        if rows:
+            return rows[0][0], rows[0][1]
         return None, None
 
-def store_summary(outcome_name, outcome_id, outcome_description, strengths, improvement):
-    with sqlite3.connect(db_path) as conn:
+def store_summary(outcome_name, outcome_id, outcome_description, strengths, improvement, input_hash=None):
+    with write_lock(db_path), sqlite3.connect(db_path) as conn:
         c = conn.cursor()
-        c.execute("SELECT outcome_name FROM all_scores_ai_summaries WHERE outcome_name=?", (outcome_name,))
-        result = c.fetchone()
+        result = run_query(c, "ai_summary_exists", "SELECT outcome_name FROM all_scores_ai_summaries WHERE outcome_name=?", (outcome_name,))
         if result:
-            c.execute("""
+            run_query(c, "ai_summary_update", """
                 UPDATE all_scores_ai_summaries
-                SET outcome_id=?, outcome_description=?, strengths_text=?, improvement_text=?, last_updated=CURRENT_TIMESTAMP
+                SET outcome_id=?, outcome_description=?, strengths_text=?, improvement_text=?, input_hash=?, last_updated=CURRENT_TIMESTAMP
                 WHERE outcome_name=?
-            """, (outcome_id, outcome_description, strengths, improvement, outcome_name))
+            """, (outcome_id, outcome_description, strengths, improvement, input_hash, outcome_name))
         else:
-            c.execute("""
-                INSERT INTO all_scores_ai_summaries (outcome_name, outcome_id, outcome_description, strengths_text, improvement_text)
-                VALUES (?, ?, ?, ?, ?)
-            """, (outcome_name, outcome_id, outcome_description, strengths, improvement))
-        conn.commit()
\ No newline at end of file
+            run_query(c, "ai_summary_insert", """
+                INSERT INTO all_scores_ai_summaries (outcome_name, outcome_id, outcome_description, strengths_text, improvement_text, input_hash)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (outcome_name, outcome_id, outcome_description, strengths, improvement, input_hash))
+        conn.commit()
+
+def store_summaries(summaries):
+    """
+    Upsert a batch of (outcome_name, outcome_id, outcome_description, strengths, improvement, input_hash)
+    rows in a single transaction.
+    """
+    with write_lock(db_path), sqlite3.connect(db_path) as conn:
+        run_many(conn.cursor(), "ai_summaries_upsert", """
+            INSERT INTO all_scores_ai_summaries
+                (outcome_name, outcome_id, outcome_description, strengths_text, improvement_text, input_hash)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (outcome_name) DO UPDATE SET
+                outcome_id=excluded.outcome_id,
+                outcome_description=excluded.outcome_description,
+                strengths_text=excluded.strengths_text,
+                improvement_text=excluded.improvement_text,
+                input_hash=excluded.input_hash,
+                last_updated=CURRENT_TIMESTAMP
+        """, summaries)
+        conn.commit()
+
+class SummaryWriter:
+    """
+    The only thread that writes summaries while workers generate them.
+    Workers put() finished rows; they are written with `write(batch)` once
+    `batch_size` have queued up or `flush_interval` seconds have passed, so
+    SQLite sees a few short transactions instead of one per outcome and never
+    a write from two threads at once. close() writes what is left.
+    """
+    def __init__(self, write, batch_size=20, flush_interval=2.0):
+        self.write = write
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.failed = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="summary-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, summary):
+        self._queue.put(summary)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        try:
+            self.write(batch)
+            self.written += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"❌ Could not save {len(batch)} summaries: {e}")
+
+    def _run(self):
+        batch = []
+        while True:
+            try:
+                summary = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._flush(batch)
+                batch = []
+                continue
+            if summary is None:
+                self._flush(batch)
+                return
+            batch.append(summary)
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
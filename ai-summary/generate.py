@@ -1,6 +1,49 @@
+import contextvars
+import hashlib
+import json
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import openai
 
-def generate_summary_parts(client, outcome_name, outcome_description, all_comments):
+MODEL = "gpt-3.5-turbo"
+MAX_TOKENS = 800
+# Everything besides the prompt that shapes the answer; changing any of it regenerates every summary
+GENERATION_PARAMS = {"temperature": 0.7, "max_tokens": MAX_TOKENS, "presence_penalty": 0.3, "frequency_penalty": 0.3}
+# Bump whenever the prompt text below changes
+PROMPT_VERSION = 1
+
+# Most comment text sent in one request; outcomes with more are condensed chunk by chunk first
+MAX_COMMENT_CHARS = 12000
+CHUNK_MAX_TOKENS = 400
+# Each level shrinks the text roughly sevenfold, so this covers far more feedback than any student has
+MAX_CONDENSE_LEVELS = 4
+
+def input_hash(outcome_name, outcome_description, all_comments, summarizer="openai"):
+    """
+    Fingerprint of everything a summary is generated from. Comments are
+    sorted first so the order GROUP_CONCAT happens to return doesn't matter.
+    """
+    payload = {
+        "prompt_version": PROMPT_VERSION,
+        "model": MODEL,
+        "params": GENERATION_PARAMS,
+        "outcome_name": outcome_name,
+        "outcome_description": outcome_description,
+        "comments": sorted((all_comments or "").split("\n")),
+    }
+    if summarizer != "openai":
+        # Left out for openai so hashes stored before summarizers existed stay valid
+        payload["summarizer"] = summarizer
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+# What the text in the prompt is: raw comments, or the per-course summaries a rollup is built from
+COMMENTS_SOURCE = "feedback from your instructors"
+ROLLUP_SOURCE = "summaries of your feedback in each course and term"
+
+def summary_messages(outcome_name, outcome_description, all_comments, source=COMMENTS_SOURCE):
+    """The chat messages asking for one outcome's summary, shared by live and batch generation."""
     prompt = f"""
 You are providing direct, personal feedback to a student about their performance on this learning outcome:
 
@@ -8,7 +51,7 @@ Outcome Name: "{outcome_name}"
 
 Outcome Description: "{outcome_description}"
 
-Based on the following feedback from your instructors:
+Based on the following {source}:
 
 {all_comments}
 
@@ -53,61 +96,376 @@ Important:
 - Start each point on a new line
 """
 
-    response = client.ChatCompletion.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {
-                "role": "system",
-                "content": """You are providing direct, personal feedback to a student.
+    return [
+        {
+            "role": "system",
+            "content": """You are providing direct, personal feedback to a student.
                 Always use second-person pronouns (you/your) to address the student directly.
                 Never use third-person pronouns (they/them/their).
                 Focus on specific, actionable feedback with concrete examples.
                 Structure feedback as separate lines without bullet points.
                 Use EXACTLY the section headers 'Strengths:' and 'Areas for Improvement:'."""
+        },
+        {"role": "user", "content": prompt}
+    ]
+
+# The summary comes back as the arguments of this function rather than free text, so there are no
+# section headers to lose; the prompt is unchanged and stored summaries stay valid
+SUMMARY_FUNCTION = {
+    "name": "record_summary",
+    "description": "Record the feedback for the student on this learning outcome.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "strengths": {
+                "type": "array",
+                "items": {"type": "string"},
+                "minItems": 2,
+                "maxItems": 4,
+                "description": "Each strength as its own point, addressed to the student as \"you\".",
             },
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.7,
-        max_tokens=800,
-        presence_penalty=0.3,
-        frequency_penalty=0.3
+            "improvements": {
+                "type": "array",
+                "items": {"type": "string"},
+                "minItems": 3,
+                "maxItems": 4,
+                "description": "Each area for improvement as its own actionable point.",
+            },
+        },
+        "required": ["strengths", "improvements"],
+    },
+}
+STRUCTURED_PARAMS = {"functions": [SUMMARY_FUNCTION], "function_call": {"name": SUMMARY_FUNCTION["name"]}}
+
+class ParseStats:
+    """
+    How the answers of this process parsed: as sent ("clean"), after a local
+    repair ("repaired"), only after a retry ("retried"), or not at all
+    ("failed"). Shared by the worker threads.
+    """
+    OUTCOMES = ("clean", "repaired", "retried", "failed")
+
+    def __init__(self):
+        self._counts = dict.fromkeys(self.OUTCOMES, 0)
+        self._lock = threading.Lock()
+
+    def record(self, outcome):
+        with self._lock:
+            self._counts[outcome] += 1
+
+    def counts(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def failure_rate(self):
+        """Share of first answers that were unusable even after repair, each costing another call."""
+        counts = self.counts()
+        total = sum(counts.values())
+        return (counts["retried"] + counts["failed"]) / total if total else 0.0
+
+    def report(self):
+        counts = self.counts()
+        return (f"{sum(counts.values())} answers: {counts['clean']} parsed as sent, {counts['repaired']} repaired, "
+                f"{counts['retried']} retried, {counts['failed']} unusable "
+                f"({100 * self.failure_rate():.1f}% needed another call)")
+
+PARSE_STATS = ParseStats()
+
+def _complete(client, messages):
+    response = client.ChatCompletion.create(
+        model=MODEL,
+        messages=messages,
+        **GENERATION_PARAMS,
+        **STRUCTURED_PARAMS
     )
+    return response.choices[0].message
+
+def generate_summary_parts(client, outcome_name, outcome_description, all_comments, source=COMMENTS_SOURCE,
+                           call=None):
+    """
+    Ask for the summary as record_summary arguments and parse them, repairing
+    malformed JSON locally. An answer that is still unusable gets one retry
+    telling the model what was wrong with it; a second failure raises ValueError.
+    `call(request, text)` runs each of the two requests on its own, so the
+    retry is rate limited and retried without repeating the first request;
+    main.py passes one that applies the rate limiter and retries.
+    """
+    call = call or (lambda request, text: request())
+    messages = summary_messages(outcome_name, outcome_description, all_comments, source)
+    message = call(lambda: _complete(client, messages), all_comments)
+    try:
+        strengths, improvement, repaired = _answer_points(message)
+    except ValueError as e:
+        retry_messages = messages + correction_messages(message, str(e))
+        message = call(lambda: _complete(client, retry_messages), all_comments + "\n" + retry_messages[-2]["content"])
+        try:
+            strengths, improvement = parse_answer(message)
+        except ValueError:
+            PARSE_STATS.record("failed")
+            raise
+        PARSE_STATS.record("retried")
+        return strengths, improvement
+    PARSE_STATS.record("repaired" if repaired else "clean")
+    return '\n'.join(strengths), '\n'.join(improvement)
+
+def correction_messages(message, reason):
+    """The unusable answer and what was wrong with it, to send back for the one retry."""
+    return [
+        {"role": "assistant", "content": _answer_text(message)},
+        {"role": "user", "content": f"That answer could not be used: {reason}. Call {SUMMARY_FUNCTION['name']} again "
+                                    f"with at least 2 strengths and 3 improvements, each point a separate string."},
+    ]
+
+def _field(obj, name):
+    # Batch results are plain dicts; the client returns objects (which are dicts as well) or test mocks
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+def _arguments(message):
+    arguments = _field(_field(message, "function_call"), "arguments") if _field(message, "function_call") else None
+    return arguments if isinstance(arguments, str) else None
+
+def _answer_text(message):
+    arguments = _arguments(message)
+    if arguments is not None:
+        return arguments
+    content = _field(message, "content")
+    return content if isinstance(content, str) else ""
+
+def parse_answer(message, stats=None):
+    """
+    (strengths, improvement) text from a chat message: the record_summary
+    arguments when the model called it, else a free-text answer with section
+    headers. Raises ValueError when neither has enough points. The outcome is
+    recorded in `stats` (a ParseStats) when given.
+    """
+    try:
+        strengths, improvement, repaired = _answer_points(message)
+    except ValueError as e:
+        if stats is not None:
+            stats.record("failed")
+        raise ValueError(f"❌ Could not parse response: {str(e)}. Full response: {_answer_text(message).strip()}")
+    if stats is not None:
+        stats.record("repaired" if repaired else "clean")
+    return '\n'.join(strengths), '\n'.join(improvement)
+
+def _answer_points(message):
+    # (strengths, improvements, repaired) as lists of points; ValueError says what was wrong
+    arguments = _arguments(message)
+    if arguments is None:
+        return (*_text_points(_answer_text(message).strip()), False)
+
+    repaired = False
+    try:
+        data = json.loads(arguments)
+    except ValueError:
+        data = json.loads(repair_json(arguments))
+        repaired = True
+    if not isinstance(data, dict):
+        raise ValueError("The arguments are not a JSON object")
+    sections = {"strengths": None, "improvements": None}
+    for key, value in data.items():
+        name = "strengths" if key.lower().startswith("strength") else "improvements" if "improve" in key.lower() else None
+        if name is None or sections[name] is not None:
+            continue
+        # Keys the schema doesn't use ("areas_for_improvement") and points sent as one string are repaired
+        repaired = repaired or key != name or not isinstance(value, list)
+        sections[name] = value
+    if sections["strengths"] is None:
+        raise ValueError("Missing 'strengths'")
+    if sections["improvements"] is None:
+        raise ValueError("Missing 'improvements'")
+    strengths, improvements = _clean_points(sections["strengths"]), _clean_points(sections["improvements"])
+    _check_points(strengths, improvements)
+    return strengths, improvements, repaired
+
+_CODE_FENCE = re.compile(r"```[a-zA-Z]*")
+_SECTION_HEADER = re.compile(r"^(strengths|areas for improvement|improvements)\s*:?$", re.IGNORECASE)
+
+def repair_json(text):
+    """
+    Fix what usually breaks a model's JSON: code fences or prose around the
+    object, raw newlines in strings, trailing commas, and an answer cut off
+    before its closing brackets.
+    """
+    text = _CODE_FENCE.sub("", text)
+    start = text.find("{")
+    if start == -1:
+        raise ValueError("No JSON object in the arguments")
+    out, closers = [], []
+    in_string = escaped = False
+    for char in text[start:]:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            elif char == "\n":
+                char = "\\n"
+            out.append(char)
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            closers.append("}" if char == "{" else "]")
+        elif char in "}]":
+            _end_value(out)
+            out.append(closers.pop())
+            if not closers:
+                break
+            continue
+        out.append(char)
+    if in_string:
+        if escaped:
+            out.pop()
+        out.append('"')
+    while closers:
+        _end_value(out)
+        out.append(closers.pop())
+    return "".join(out)
 
-    output = response.choices[0].message.content.strip()
+def _end_value(out):
+    # Before a closing bracket: no trailing comma, and a key cut off before its value gets null
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+    elif out and out[-1] == ":":
+        out.append("null")
+
+def _clean_points(value):
+    # Points as a list of strings; a string holding several lines becomes one point per line
+    items = value if isinstance(value, list) else [value]
+    lines = [line for item in items if isinstance(item, str) for line in item.split("\n")]
+    points = [line.strip().lstrip('•').lstrip('*').lstrip('-').lstrip('•').strip() for line in lines]
+    return [point for point in points if point and not _SECTION_HEADER.match(point)]
+
+def _check_points(strengths_points, improvement_points):
+    if len(strengths_points) < 2:
+        raise ValueError(f"Not enough strength points (minimum 2 required)")
+    if len(improvement_points) < 3:
+        raise ValueError(f"Not enough improvement points (minimum 3 required)")
+
+def parse_summary(output):
+    """Split a free-text answer with section headers into (strengths, improvement) text, or raise ValueError."""
+    output = output.strip()
 
     # More robust parsing
     try:
-        if "Strengths:" not in output:
-            raise ValueError("Missing 'Strengths:' section")
-        if "Areas for Improvement:" not in output:
-            raise ValueError("Missing 'Areas for Improvement:' section")
-
-        # Split into sections
-        parts = output.split("Areas for Improvement:")
-        if len(parts) != 2:
-            raise ValueError("Incorrect section formatting")
-
-        strengths = parts[0].replace("Strengths:", "").strip()
-        improvement = parts[1].strip()
-
-        # Clean and validate points
-        def clean_points(text):
-            # Split by newlines and clean each point
-            points = [p.strip() for p in text.split('\n') if p.strip()]
-            # Remove any bullet points or special characters at the start of each point
-            points = [p.lstrip('•').lstrip('*').lstrip('-').lstrip('•').strip() for p in points]
-            return points
-
-        strengths_points = clean_points(strengths)
-        improvement_points = clean_points(improvement)
-
-        if len(strengths_points) < 2:
-            raise ValueError(f"Not enough strength points (minimum 2 required)")
-        if len(improvement_points) < 3:
-            raise ValueError(f"Not enough improvement points (minimum 3 required)")
+        strengths_points, improvement_points = _text_points(output)
 
         # Join points back with newlines
         return '\n'.join(strengths_points), '\n'.join(improvement_points)
 
     except Exception as e:
-        raise ValueError(f"❌ Could not parse response: {str(e)}. Full response: {output}")
\ No newline at end of file
+        raise ValueError(f"❌ Could not parse response: {str(e)}. Full response: {output}")
+
+def _text_points(output):
+    if "Strengths:" not in output:
+        raise ValueError("Missing 'Strengths:' section")
+    if "Areas for Improvement:" not in output:
+        raise ValueError("Missing 'Areas for Improvement:' section")
+
+    # Split into sections
+    parts = output.split("Areas for Improvement:")
+    if len(parts) != 2:
+        raise ValueError("Incorrect section formatting")
+
+    strengths = parts[0].replace("Strengths:", "").strip()
+    improvement = parts[1].strip()
+
+    # Clean and validate points
+    def clean_points(text):
+        # Split by newlines and clean each point
+        points = [p.strip() for p in text.split('\n') if p.strip()]
+        # Remove any bullet points or special characters at the start of each point
+        points = [p.lstrip('•').lstrip('*').lstrip('-').lstrip('•').strip() for p in points]
+        return points
+
+    strengths_points = clean_points(strengths)
+    improvement_points = clean_points(improvement)
+    _check_points(strengths_points, improvement_points)
+    return strengths_points, improvement_points
+
+def chunk_comments(all_comments, max_chars=MAX_COMMENT_CHARS):
+    """Pack whole comments (one per line) into chunks of at most max_chars; an oversized comment is split."""
+    chunks, current, size = [], [], 0
+    for comment in all_comments.split("\n"):
+        if not comment.strip():
+            continue
+        for start in range(0, len(comment), max_chars):
+            piece = comment[start:start + max_chars]
+            if current and size + len(piece) + 1 > max_chars:
+                chunks.append("\n".join(current))
+                current, size = [], 0
+            current.append(piece)
+            size += len(piece) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+def summarize_chunk(client, outcome_name, outcome_description, chunk, part, parts):
+    """Map step: condense one chunk of feedback into short notes on strengths and improvements."""
+    prompt = f"""
+Below is part {part} of {parts} of the instructor feedback a student received on this learning outcome:
+
+Outcome Name: "{outcome_name}"
+
+Outcome Description: "{outcome_description}"
+
+{chunk}
+
+Condense this feedback into short notes for a later summary, with EXACTLY these section headers:
+
+Strengths:
+[One line per distinct strength, with the concrete example the feedback gives]
+
+Areas for Improvement:
+[One line per distinct weakness or suggestion, with the concrete example the feedback gives]
+
+Important:
+- Merge points that repeat; note how often something comes up if it recurs
+- Only include what the feedback says; do not add advice of your own
+- Do not use any bullet points or special characters
+"""
+    response = client.ChatCompletion.create(
+        model=MODEL,
+        messages=[
+            {"role": "system", "content": "You condense instructor feedback into faithful, concise notes."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.3,
+        max_tokens=CHUNK_MAX_TOKENS,
+    )
+    return response.choices[0].message.content.strip()
+
+def condense_comments(client, outcome_name, outcome_description, all_comments, call=None, max_workers=4,
+                      max_chars=MAX_COMMENT_CHARS):
+    """
+    Reduce comments too long for one request to notes that fit. The chunks are
+    summarized in parallel and their notes joined. If the notes are still
+    too long, the same is done to them, up to MAX_CONDENSE_LEVELS times.
+    `call(request, text)` runs each request; main.py passes one that applies
+    the rate limiter and retries.
+    """
+    call = call or (lambda request, text: request())
+    text = all_comments
+    for _ in range(MAX_CONDENSE_LEVELS):
+        if len(text) <= max_chars:
+            return text
+        chunks = chunk_comments(text, max_chars)
+
+        def summarize(numbered):
+            part, chunk = numbered
+            return call(lambda: summarize_chunk(client, outcome_name, outcome_description, chunk, part, len(chunks)),
+                        chunk)
+
+        # Each chunk runs in a copy of the caller's context, so the usage ledger still knows the outcome
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+            notes = list(executor.map(lambda numbered: context.copy().run(summarize, numbered),
+                                      enumerate(chunks, start=1)))
+        text = "\n".join(notes)
+    # Only reachable with absurd volumes; keep the request within bounds rather than fail
+    return text[:max_chars]
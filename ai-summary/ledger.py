@@ -0,0 +1,160 @@
+import contextvars
+import threading
+import time
+import uuid
+
+from ratelimit import estimate_tokens
+
+# USD per 1,000 prompt and completion tokens; models not listed here are costed at 0
+PRICES = {"gpt-3.5-turbo": (0.0005, 0.0015)}
+# The Batch API bills half the usual price
+BATCH_DISCOUNT = 0.5
+
+# Who the request being made is for, and which attempt at it this is. Context variables rather
+# than thread-locals, so they follow a task onto the threads it fans out to (see condense_comments)
+_outcome = contextvars.ContextVar("ledger_outcome", default=None)
+_attempt = contextvars.ContextVar("ledger_attempt", default=0)
+
+
+def for_outcome(label, fn):
+    """Call fn() with the API requests it makes recorded against `label`."""
+    token = _outcome.set(label)
+    try:
+        return fn()
+    finally:
+        _outcome.reset(token)
+
+
+def as_attempt(number, fn):
+    """Call fn() as attempt `number` (0 for the first) of a request that is being retried."""
+    token = _attempt.set(number)
+    try:
+        return fn()
+    finally:
+        _attempt.reset(token)
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens, discount=1.0):
+    prompt_price, completion_price = PRICES.get(model, (0.0, 0.0))
+    return round(((prompt_tokens or 0) * prompt_price + (completion_tokens or 0) * completion_price) / 1000 * discount, 6)
+
+
+def request_kind(kwargs):
+    """What a chat completion request is for, from its arguments."""
+    if "functions" not in kwargs:
+        # Only the API's on-demand summaries (backend/summaries.py) stream a free-text answer
+        return "summary" if kwargs.get("stream") else "condense"
+    # A summary's one retry carries the answer that was rejected
+    if any(message.get("role") == "assistant" for message in kwargs.get("messages", ())):
+        return "correction"
+    return "summary"
+
+
+def _field(obj, name):
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+
+def _count(usage, name):
+    value = _field(usage, name) if usage is not None else None
+    return value if isinstance(value, int) else None
+
+
+class UsageLedger:
+    """
+    One row per chat completion request of a run: the outcome it was for,
+    what kind of request it was, the model, prompt and completion tokens,
+    latency, how many times it had been retried, its status and an estimated
+    cost. Rows are kept in memory until drain() hands them over for storing;
+    record() is safe to call from any thread.
+    """
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.run_id = None
+        self._rows = []
+        self._lock = threading.Lock()
+
+    def start_run(self, run_id=None):
+        self.run_id = run_id or f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        with self._lock:
+            self._rows = []
+        return self.run_id
+
+    def record(self, request, model, prompt_tokens, completion_tokens, latency, status, discount=1.0, outcome=None,
+               attempt=None):
+        row = (
+            self.run_id, outcome or _outcome.get(), request, model, prompt_tokens, completion_tokens,
+            None if latency is None else round(latency * 1000, 1), _attempt.get() if attempt is None else attempt, status,
+            estimate_cost(model, prompt_tokens, completion_tokens, discount),
+            time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+        )
+        with self._lock:
+            self._rows.append(row)
+
+    def drain(self):
+        """The rows recorded since the last drain(), as tuples for db.store_usage()."""
+        with self._lock:
+            rows, self._rows = self._rows, []
+        return rows
+
+    def wrap(self, client):
+        return MeteredClient(client, self)
+
+
+def usage_totals(rows):
+    """(calls, failed calls, prompt tokens, completion tokens, cost) of ledger rows."""
+    return (
+        len(rows),
+        sum(1 for row in rows if row[8] != "ok"),
+        sum(row[4] or 0 for row in rows),
+        sum(row[5] or 0 for row in rows),
+        sum(row[9] for row in rows),
+    )
+
+
+class MeteredClient:
+    """`client` (the openai module) with every ChatCompletion.create() timed and recorded in `ledger`."""
+    def __init__(self, client, ledger):
+        self._client = client
+        self.ChatCompletion = _MeteredChatCompletion(client.ChatCompletion, ledger)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class _MeteredChatCompletion:
+    def __init__(self, chat_completion, ledger):
+        self._chat_completion = chat_completion
+        self._ledger = ledger
+
+    def create(self, **kwargs):
+        start = self._ledger.clock()
+        try:
+            response = self._chat_completion.create(**kwargs)
+        except Exception as e:
+            self._ledger.record(request_kind(kwargs), kwargs.get("model"), None, None,
+                                self._ledger.clock() - start, type(e).__name__)
+            raise
+        if kwargs.get("stream"):
+            return self._stream(response, kwargs, start, _outcome.get(), _attempt.get())
+        usage = _field(response, "usage")
+        self._ledger.record(request_kind(kwargs), kwargs.get("model"), _count(usage, "prompt_tokens"),
+                            _count(usage, "completion_tokens"), self._ledger.clock() - start, "ok")
+        return response
+
+    def _stream(self, chunks, kwargs, start, outcome, attempt):
+        # A streamed answer carries no usage, so its row is recorded once the stream ends, with
+        # tokens estimated from the text. It runs after create() returned, hence the captured context
+        pieces = []
+        status = "ok"
+        try:
+            for chunk in chunks:
+                pieces.append(_field(_field(_field(chunk, "choices")[0], "delta"), "content") or "")
+                yield chunk
+        except BaseException as e:
+            status = type(e).__name__
+            raise
+        finally:
+            prompt_tokens = sum(estimate_tokens(message.get("content")) for message in kwargs.get("messages", ()))
+            self._ledger.record(request_kind(kwargs), kwargs.get("model"), prompt_tokens,
+                                estimate_tokens("".join(pieces)), self._ledger.clock() - start, status,
+                                outcome=outcome, attempt=attempt)
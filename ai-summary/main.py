@@ -1,15 +1,24 @@
 import os
 import argparse
-import time
 from dotenv import load_dotenv
 import openai
 from pathlib import Path
 import json
+import itertools
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 from typing import Dict, List, Optional, Tuple
 
-from db import create_ai_summaries_table, fetch_grouped_comments, fetch_outcome_metadata, store_summary
-from generate import generate_summary_parts
+from batch import BATCH_DIR, LocalBatchClient, OpenAIBatchClient, finish_batch, load_state, submit_batch
+from db import (create_ai_summaries_table, fetch_comment_details, fetch_grouped_comments, fetch_input_hashes,
+                fetch_outcome_metadata, fetch_partition_comments, fetch_partition_summaries, store_partition_summaries,
+                store_run, store_summaries, store_usage, SummaryWriter)
+from generate import input_hash, MAX_COMMENT_CHARS, MAX_TOKENS, PARSE_STATS
+from ledger import UsageLedger, as_attempt, for_outcome, usage_totals
+from prompt import Comment, DEFAULT_PROMPT_BUDGET, build_prompt_comments, rollup_text
+from ratelimit import RateLimiter, call_with_retry, estimate_tokens
+from summarizers import ExtractiveSummarizer, OpenAISummarizer, SUMMARIZERS
 
 # Get the absolute path to the root directory
 root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -36,42 +45,248 @@ if not api_key:
 openai.api_key = api_key
 # Define client as the openai module
 client = openai
+# Every request a run makes, with its tokens, latency and cost (see ledger.py)
+ledger = UsageLedger()
+
+# Instructions and system message sent along with every outcome's comments
+PROMPT_OVERHEAD_TOKENS = 700
+RETRY_BASE_DELAY = 2.0
+
+def limited_request(request, text, limiter, max_tokens=MAX_TOKENS):
+    """Run one API request about `text` within the rate limits, retrying rate-limit and transient errors."""
+    attempts = itertools.count()
+    def attempt():
+        limiter.acquire(PROMPT_OVERHEAD_TOKENS + estimate_tokens(text) + max_tokens)
+        return as_attempt(next(attempts), request)
+    return call_with_retry(attempt, limiter, base_delay=RETRY_BASE_DELAY)
+
+def make_summarizer(name, limiter):
+    if name == "extractive":
+        return ExtractiveSummarizer()
+    return OpenAISummarizer(ledger.wrap(client), call=lambda request, text, max_tokens: limited_request(request, text, limiter, max_tokens))
+
+def summarize_outcome(outcome_name, outcome_id, outcome_description, all_comments, summary_hash, summarizer):
+    """Generate one outcome's summary (on a worker thread) and return the row to store."""
+    strengths, improvement = summarizer.summarize(outcome_name, outcome_description, all_comments)
+    return outcome_name, outcome_id, outcome_description, strengths, improvement, summary_hash
+
+def generate_concurrently(tasks, write, workers):
+    """
+    Run (label, generate) tasks on `workers` threads. Workers only call the
+    API; one writer thread stores the rows they return in batches with
+    `write(rows)`. Returns (written, failed).
+    """
+    writer = SummaryWriter(write)
+    failed = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = {executor.submit(for_outcome, label, generate): label for label, generate in tasks}
+            for future in as_completed(futures):
+                label = futures[future]
+                try:
+                    writer.put(future.result())
+                    print(f"✅ Generated summary for: {label}")
+                except Exception as e:
+                    failed += 1
+                    print(f"❌ Error for {label}: {e}")
+    finally:
+        writer.close()
+    return writer.written, failed + writer.failed
+
+def summarize_partitions(args, summarizer):
+    """
+    Summarize every outcome per course and term, then roll each outcome's
+    partition summaries up into its overall summary. Only partitions whose
+    comments changed are regenerated, and only the rollups of outcomes with a
+    changed partition.
+    """
+    partitions = fetch_partition_comments()
+    outcomes = sorted({outcome_name for outcome_name, _, _ in partitions})[:args.limit or None]
+    metadata = {outcome_name: fetch_outcome_metadata(outcome_name) for outcome_name in outcomes}
+    stored = {} if args.force else fetch_partition_summaries()
+
+    tasks = []
+    for key in sorted(partitions):
+        outcome_name, course_code, term_title = key
+        if outcome_name not in metadata:
+            continue
+        outcome_description = metadata[outcome_name][1]
+        all_comments = build_prompt_comments([Comment(*row) for row in partitions[key]], args.prompt_budget).text
+        if len(all_comments.strip()) < 5:
+            continue
+        summary_hash = input_hash(outcome_name, outcome_description, all_comments, args.summarizer)
+        if key in stored and stored[key][2] == summary_hash:
+            continue
+
+        def generate(key=key, outcome_description=outcome_description, all_comments=all_comments,
+                     summary_hash=summary_hash):
+            return (*key, *summarizer.summarize(key[0], outcome_description, all_comments), summary_hash)
+        tasks.append((" / ".join(part for part in key if part), generate))
+
+    print(f"📊 Generating {len(tasks)} partition summaries with {args.workers} workers "
+          f"({len([key for key in partitions if key[0] in metadata]) - len(tasks)} unchanged or skipped)...")
+    partition_written, partition_failed = generate_concurrently(tasks, store_partition_summaries, args.workers)
+
+    # A rollup's input is its partition summaries, so it only changes when one of them did. Slices the
+    # API summarized on demand (a course across terms, say) and partitions with no comments left are not used
+    by_outcome = {}
+    for key, (strengths, improvement, _) in fetch_partition_summaries().items():
+        if key in partitions and key[0] in metadata:
+            by_outcome.setdefault(key[0], []).append((key[1], key[2], strengths, improvement))
+    stored_hashes = {} if args.force else fetch_input_hashes()
+    tasks = []
+    for outcome_name, outcome_partitions in sorted(by_outcome.items()):
+        outcome_id, outcome_description = metadata[outcome_name]
+        summary_hash = input_hash(outcome_name, outcome_description, rollup_text(outcome_partitions), args.summarizer)
+        if stored_hashes.get(outcome_name) == summary_hash:
+            continue
+
+        def generate(outcome_name=outcome_name, outcome_id=outcome_id, outcome_description=outcome_description,
+                     outcome_partitions=outcome_partitions, summary_hash=summary_hash):
+            strengths, improvement = summarizer.rollup(outcome_name, outcome_description, outcome_partitions)
+            return outcome_name, outcome_id, outcome_description, strengths, improvement, summary_hash
+        tasks.append((outcome_name, generate))
+
+    print(f"📊 Rolling up {len(tasks)} outcome summaries ({len(by_outcome) - len(tasks)} unchanged)...")
+    rollup_written, rollup_failed = generate_concurrently(tasks, store_summaries, args.workers)
+
+    print(f"\n🎉 AI Summarization Process Complete: {partition_written} partitions and {rollup_written} rollups "
+          f"regenerated, {partition_failed + rollup_failed} failed.")
+
+def finish_run():
+    """Store the run's usage ledger and report what it cost and how often answers needed repair or another call."""
+    rows = ledger.drain()
+    if rows:
+        store_usage(rows)
+        calls, failed, prompt_tokens, completion_tokens, cost = usage_totals(rows)
+        print(f"💰 {calls} API requests ({failed} failed), {prompt_tokens} prompt + {completion_tokens} completion "
+              f"tokens, about ${cost:.4f}. See: python3 ai-summary/report.py --run {ledger.run_id}")
+    if sum(PARSE_STATS.counts().values()):
+        print(f"🧩 Structured output: {PARSE_STATS.report()}")
+
+def make_batch_client(name, limiter):
+    """The OpenAI Batch API, or the local stand-in that sends the batch's requests one by one."""
+    if name == "local":
+        return LocalBatchClient(BATCH_DIR, lambda body: limited_request(
+            lambda: client.ChatCompletion.create(**body), body["messages"][-1]["content"], limiter))
+    return OpenAIBatchClient(client)
 
 def main():
     parser = argparse.ArgumentParser(description="Generate AI summaries grouped by outcome_name from all_scores.")
     parser.add_argument("--limit", type=int, default=None, help="Optional limit on the number of outcomes to summarize.")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("AI_SUMMARY_WORKERS", 4)),
+                        help="Number of summaries to generate at once.")
+    parser.add_argument("--rpm", type=int, default=int(os.getenv("OPENAI_RPM", 500)),
+                        help="OpenAI requests-per-minute quota to stay within.")
+    parser.add_argument("--tpm", type=int, default=int(os.getenv("OPENAI_TPM", 60000)),
+                        help="OpenAI tokens-per-minute quota to stay within.")
+    parser.add_argument("--force", action="store_true",
+                        help="Regenerate every summary, even those whose comments haven't changed.")
+    parser.add_argument("--prompt-budget", type=int, default=int(os.getenv("AI_SUMMARY_PROMPT_BUDGET", DEFAULT_PROMPT_BUDGET)),
+                        help="Most tokens of comments to send per outcome (0 sends every distinct comment).")
+    parser.add_argument("--summarizer", choices=SUMMARIZERS, default=os.getenv("AI_SUMMARY_SUMMARIZER", "openai"),
+                        help="openai, or extractive for instant summaries picked from the comments without an API call.")
+    parser.add_argument("--partitioned", action="store_true",
+                        help="Summarize each outcome per course and term, and build its overall summary from those.")
+    parser.add_argument("--batch", action="store_true",
+                        help="Submit every summary as one offline batch job and wait for it (cheaper for full regenerations).")
+    parser.add_argument("--batch-client", choices=("openai", "local"), default="openai",
+                        help="Where --batch jobs run: the OpenAI Batch API or locally, one request at a time.")
+    parser.add_argument("--poll-interval", type=float, default=60.0,
+                        help="Seconds between checks on a submitted batch.")
     args = parser.parse_args()
+    if args.batch and args.summarizer != "openai":
+        parser.error("--batch only works with the openai summarizer")
+    if args.batch and args.partitioned:
+        parser.error("--batch can't be combined with --partitioned")
 
     print("🚀 Creating AI summaries table...")
     create_ai_summaries_table()
 
+    run_id = ledger.start_run()
+    store_run(run_id, "partitioned" if args.partitioned else "batch" if args.batch else "live", args.summarizer,
+              args.workers, args.prompt_budget)
+    # The requests a run made are stored however it ends: finished, nothing to do, failed or interrupted
+    try:
+        summarize(args)
+    finally:
+        finish_run()
+
+def summarize(args):
+    """Regenerate the summaries whose input changed, the way args asks for."""
+    limiter = RateLimiter(args.rpm, args.tpm)
+    if args.partitioned:
+        summarize_partitions(args, make_summarizer(args.summarizer, limiter))
+        return
+
+    if args.batch:
+        batch_client = make_batch_client(args.batch_client, limiter)
+        # A batch submitted by a run that was interrupted is collected before anything new is sent
+        state = load_state(BATCH_DIR)
+        if state is not None:
+            print(f"🔁 Resuming batch {state['batch_id']} submitted by an earlier run...")
+            written, failed = finish_batch(batch_client, BATCH_DIR, state, store_summaries, args.poll_interval,
+                                           ledger=ledger)
+            print(f"✅ Stored {written} summaries from the earlier batch ({failed} failed).")
+
     print("🚀 Fetching comments grouped by outcome_name...")
     rows = fetch_grouped_comments(args.limit)
     if not rows:
         print("⚠️ No rows found in all_scores.")
         return
 
-    print(f"📊 Generating summaries for {len(rows)} outcomes...")
-
+    # A summary is only regenerated when something it was generated from changed
+    stored_hashes = {} if args.force else fetch_input_hashes()
+    details = fetch_comment_details()
+    pending = []
+    skipped = 0
+    original_tokens = prompt_tokens = 0
     for outcome_name, all_comments in rows:
         if not all_comments or len(all_comments.strip()) < 5:
             print(f"⚠️ Skipping empty group: {outcome_name}")
+            skipped += 1
             continue
-        if len(all_comments) > 12000:
-            print(f"⚠️ Skipping {outcome_name} due to too large context ({len(all_comments)} chars).")
+        # Duplicates dropped and, over the budget, a spread of scores and dates kept
+        comments = [Comment(*row) for row in details.get(outcome_name, ())] or \
+            [Comment(line) for line in all_comments.split("\n")]
+        selection = build_prompt_comments(comments, args.prompt_budget)
+        if args.batch and len(selection.text) > MAX_COMMENT_CHARS:
+            # A batch request can't be condensed in chunks first, so keep it to one prompt's worth
+            selection = build_prompt_comments(comments, MAX_COMMENT_CHARS // 4)
+        all_comments = selection.text
+        original_tokens += selection.original_tokens
+        prompt_tokens += selection.tokens
+        if len(all_comments) > MAX_COMMENT_CHARS:
+            print(f"📚 {outcome_name} has {len(all_comments)} chars of comments; summarizing them in chunks.")
+        outcome_id, outcome_description = fetch_outcome_metadata(outcome_name)
+        summary_hash = input_hash(outcome_name, outcome_description, all_comments, args.summarizer)
+        if stored_hashes.get(outcome_name) == summary_hash:
+            skipped += 1
             continue
+        pending.append((outcome_name, outcome_id, outcome_description, all_comments, summary_hash))
 
-        outcome_id, outcome_description = fetch_outcome_metadata(outcome_name)
+    if original_tokens:
+        print(f"✂️ Comments trimmed to {prompt_tokens} of {original_tokens} estimated tokens "
+              f"({100 - 100 * prompt_tokens // original_tokens}% saved).")
+    if args.batch:
+        if not pending:
+            print(f"🎉 Nothing to regenerate ({skipped} unchanged or skipped).")
+            return
+        print(f"📦 Submitting a batch of {len(pending)} summaries ({skipped} unchanged or skipped)...")
+        state = submit_batch(batch_client, BATCH_DIR, pending)
+        written, failed = finish_batch(batch_client, BATCH_DIR, state, store_summaries, args.poll_interval,
+                                       ledger=ledger)
+        print(f"\n🎉 AI Summarization Batch Complete: {skipped} skipped, {written} regenerated, {failed} failed.")
+        return
+
+    print(f"📊 Generating summaries for {len(pending)} outcomes with {args.workers} workers "
+          f"({skipped} unchanged or skipped)...")
 
-        try:
-            strengths, improvement = generate_summary_parts(client, outcome_name, outcome_description, all_comments)
-            store_summary(outcome_name, outcome_id, outcome_description, strengths, improvement)
-            print(f"✅ Saved summary for: {outcome_name}")
-            time.sleep(1)
-        except Exception as e:
-            print(f"❌ Error for {outcome_name}: {e}")
+    summarizer = make_summarizer(args.summarizer, limiter)
+    tasks = [(outcome[0], partial(summarize_outcome, *outcome, summarizer)) for outcome in pending]
+    written, failed = generate_concurrently(tasks, store_summaries, args.workers)
 
-    print("\n🎉 AI Summarization Process Complete.")
+    print(f"\n🎉 AI Summarization Process Complete: {skipped} skipped, {written} regenerated, {failed} failed.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,144 @@
+import re
+from collections import namedtuple
+
+from ratelimit import estimate_tokens
+
+# Tokens of comments sent per summary by default; see build_prompt_comments
+DEFAULT_PROMPT_BUDGET = 2000
+# Comments whose word sets overlap at least this much (Jaccard) count as the same comment
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+Comment = namedtuple("Comment", ["text", "score", "created_on"], defaults=[None, None])
+
+PromptComments = namedtuple("PromptComments", [
+    "text",             # the comment block to put in the prompt
+    "tokens",           # its estimated tokens
+    "original_tokens",  # estimated tokens of every comment, as sent before
+    "total",            # comments received
+    "distinct",         # comments left after removing duplicates
+    "selected",         # comments in `text`
+])
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def _words(text):
+    return frozenset(_WORD.findall(text.lower()))
+
+
+def dedupe_comments(comments, threshold=NEAR_DUPLICATE_THRESHOLD):
+    """
+    Drop exact and near-duplicate comments (e.g. rubric boilerplate pasted
+    into many assessments). Returns [(comment, times_seen)], keeping the most
+    recent copy of each so that recency-based selection still sees it.
+    """
+    ordered = sorted(comments, key=lambda comment: comment.created_on or "", reverse=True)
+    kept = []  # [comment, words, count]
+    exact = {}
+    for comment in ordered:
+        normalized = " ".join(_WORD.findall(comment.text.lower()))
+        if not normalized:
+            continue
+        if normalized in exact:
+            exact[normalized][2] += 1
+            continue
+        words = _words(comment.text)
+        match = None
+        for entry in kept:
+            other = entry[1]
+            # Jaccard can't reach the threshold if the sizes differ too much; skip the set operations
+            if min(len(words), len(other)) < threshold * max(len(words), len(other)):
+                continue
+            if len(words & other) >= threshold * len(words | other):
+                match = entry
+                break
+        if match is not None:
+            match[2] += 1
+            exact[normalized] = match
+            continue
+        entry = [comment, words, 1]
+        kept.append(entry)
+        exact[normalized] = entry
+    return [(comment, count) for comment, _, count in kept]
+
+
+def _score_bucket(score):
+    try:
+        return int(round(float(score)))
+    except (TypeError, ValueError):
+        return None
+
+
+def select_comments(counted, budget_tokens):
+    """
+    Pick comments within `budget_tokens`, stratified by score: one comment per
+    score level in turn (most frequent, then most recent first within a
+    level), so the strongest and weakest work are both represented however
+    lopsided the scores are.
+    """
+    strata = {}
+    for comment, count in counted:
+        strata.setdefault(_score_bucket(comment.score), []).append((comment, count))
+    for items in strata.values():
+        items.sort(key=lambda item: (item[1], item[0].created_on or ""), reverse=True)
+
+    queues = [strata[bucket] for bucket in sorted(strata, key=lambda bucket: (bucket is None, bucket or 0))]
+    selected = []
+    used = 0
+    while any(queues):
+        for items in queues:
+            if not items:
+                continue
+            comment, count = items.pop(0)
+            tokens = estimate_tokens(_line(comment, count))
+            # The first comment is kept even if it alone is over budget, so no outcome ends up without feedback
+            if used + tokens <= budget_tokens or not selected:
+                selected.append((comment, count))
+                used += tokens
+    return selected
+
+
+def _line(comment, count):
+    text = " ".join(comment.text.split())
+    return f"{text} (repeated {count} times)" if count > 1 else text
+
+
+def build_prompt_comments(comments, budget_tokens=DEFAULT_PROMPT_BUDGET):
+    """
+    Turn an outcome's comments into the block of feedback sent to the model:
+    duplicates removed (a repeated comment is sent once and marked with how
+    often it was given), then, if still over `budget_tokens`, a stratified
+    selection. Comments are listed oldest first. budget_tokens=0 keeps every
+    distinct comment.
+    """
+    comments = [comment for comment in comments if comment.text and comment.text.strip()]
+    counted = dedupe_comments(comments)
+    if budget_tokens and sum(estimate_tokens(_line(comment, count)) for comment, count in counted) > budget_tokens:
+        selected = select_comments(counted, budget_tokens)
+    else:
+        selected = counted
+
+    order = {id(comment): position for position, comment in enumerate(comments)}
+    selected.sort(key=lambda item: (item[0].created_on or "", order[id(item[0])]))
+    text = "\n".join(_line(comment, count) for comment, count in selected)
+    return PromptComments(
+        text=text,
+        tokens=estimate_tokens(text),
+        original_tokens=estimate_tokens("\n".join(comment.text for comment in comments)),
+        total=len(comments),
+        distinct=len(counted),
+        selected=len(selected),
+    )
+
+
+def rollup_text(partitions):
+    """
+    The text an outcome's rollup summary is generated from: each
+    (course_code, term_title, strengths, improvement) partition summary under
+    a heading, in a fixed order so the same summaries always hash the same.
+    """
+    sections = []
+    for course, term, strengths, improvement in sorted(partitions, key=lambda partition: (partition[1], partition[0])):
+        heading = " ".join(part for part in (course, f"({term})" if term else "") if part) or "Other feedback"
+        sections.append(f"{heading}:\nStrengths:\n{strengths}\nAreas for Improvement:\n{improvement}")
+    return "\n\n".join(sections)
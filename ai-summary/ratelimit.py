@@ -0,0 +1,97 @@
+import random
+import threading
+import time
+
+import openai
+
+# Errors worth another attempt: quota and transient server/network trouble.
+# Anything else (bad key, invalid request, an unparseable answer) fails straight away.
+RETRYABLE_ERRORS = tuple(
+    getattr(openai.error, name)
+    for name in ("RateLimitError", "ServiceUnavailableError", "APIError", "Timeout", "APIConnectionError", "TryAgain")
+    if hasattr(openai.error, name)
+)
+
+
+def estimate_tokens(text):
+    """Rough token count for budgeting (about four characters per token for English)."""
+    return len(text or "") // 4 + 1
+
+
+class RateLimiter:
+    """
+    Keeps callers within a requests-per-minute and tokens-per-minute quota.
+
+    Both quotas are token buckets that refill continuously, so short bursts
+    are allowed and the long-run rate never exceeds the quota. acquire()
+    blocks until the request fits. back_off() pauses every caller, e.g. after
+    the API reported a rate limit, since the other workers would hit it too.
+    """
+    def __init__(self, rpm, tpm, clock=time.monotonic, sleep=time.sleep):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.clock = clock
+        self.sleep = sleep
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = clock()
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def acquire(self, tokens=0):
+        # A single request larger than the whole quota could never fit; let it wait for a full bucket instead
+        tokens = min(tokens, self.tpm)
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._refill(now)
+                if now >= self._resume_at and self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                wait = max(
+                    self._resume_at - now,
+                    (1 - self._requests) * 60 / self.rpm,
+                    (tokens - self._tokens) * 60 / self.tpm,
+                )
+            self.sleep(max(wait, 0.01))
+
+    def back_off(self, seconds):
+        with self._lock:
+            self._resume_at = max(self._resume_at, self.clock() + seconds)
+
+
+def retry_delay(error, attempt, base_delay=2.0, max_delay=60.0):
+    """Exponential backoff with jitter, or the server's Retry-After when it sent one."""
+    headers = getattr(error, "headers", None) or {}
+    try:
+        retry_after = float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        retry_after = None
+    if retry_after is not None:
+        return min(retry_after, max_delay)
+    return min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+def call_with_retry(fn, limiter=None, retries=5, base_delay=2.0, max_delay=60.0, sleep=time.sleep):
+    """
+    Call fn() and retry it on rate-limit and transient API errors. After a
+    rate-limit error the whole limiter backs off, not just this caller.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except RETRYABLE_ERRORS as e:
+            if attempt == retries:
+                raise
+            delay = retry_delay(e, attempt, base_delay, max_delay)
+            if limiter is not None and isinstance(e, openai.error.RateLimitError):
+                limiter.back_off(delay)
+            print(f"⏳ {type(e).__name__}: retrying in {delay:.1f}s (attempt {attempt + 1}/{retries})")
+            sleep(delay)
@@ -0,0 +1,40 @@
+import argparse
+
+from db import create_ai_summaries_table, fetch_usage_report
+
+
+def format_table(columns, rows):
+    """Rows as a plain-text table, one column per field, blank where a value is missing."""
+    def cell(value):
+        if value is None:
+            return ""
+        if isinstance(value, float):
+            return f"{value:.4f}" if value < 1 else f"{value:g}"
+        return str(value)
+
+    cells = [[cell(value) for value in row] for row in rows]
+    widths = [max([len(column)] + [len(row[i]) for row in cells]) for i, column in enumerate(columns)]
+    lines = ["  ".join(column.ljust(width) for column, width in zip(columns, widths)),
+             "  ".join("-" * width for width in widths)]
+    lines += ["  ".join(value.ljust(width) for value, width in zip(row, widths)) for row in cells]
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the API usage recorded by ai-summary/main.py runs.")
+    parser.add_argument("--by", choices=("run", "outcome"), default="run",
+                        help="Total usage per run (newest first) or per outcome (costliest first).")
+    parser.add_argument("--run", default=None, help="Only this run's requests.")
+    parser.add_argument("--limit", type=int, default=None, help="Most rows to show.")
+    args = parser.parse_args()
+
+    create_ai_summaries_table()
+    columns, rows = fetch_usage_report(args.by, args.run, args.limit)
+    if not rows:
+        print("⚠️ No API usage recorded yet.")
+        return
+    print(format_table(columns, rows))
+
+
+if __name__ == "__main__":
+    main()
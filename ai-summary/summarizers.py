@@ -0,0 +1,211 @@
+import re
+
+import numpy as np
+
+from generate import (generate_summary_parts, condense_comments, CHUNK_MAX_TOKENS, MAX_COMMENT_CHARS,
+                      MAX_TOKENS, COMMENTS_SOURCE, ROLLUP_SOURCE)
+from prompt import rollup_text
+
+
+class OpenAISummarizer:
+    """
+    Summaries written by the chat model. `call(request, text, max_tokens)`
+    runs each API request; main.py passes one that applies the rate limiter
+    and retries. Comments too long for one prompt are condensed first.
+    """
+    name = "openai"
+
+    def __init__(self, client, call=None):
+        self.client = client
+        self.call = call or (lambda request, text, max_tokens: request())
+
+    def summarize(self, outcome_name, outcome_description, all_comments):
+        return self._generate(outcome_name, outcome_description, all_comments, COMMENTS_SOURCE)
+
+    def rollup(self, outcome_name, outcome_description, partitions):
+        """One summary for the outcome from its (course_code, term_title, strengths, improvement) partition summaries."""
+        return self._generate(outcome_name, outcome_description, rollup_text(partitions), ROLLUP_SOURCE)
+
+    def _generate(self, outcome_name, outcome_description, text, source):
+        if len(text) > MAX_COMMENT_CHARS:
+            # Too much for one prompt: condense it chunk by chunk first
+            text = condense_comments(
+                self.client, outcome_name, outcome_description, text,
+                call=lambda request, chunk: self.call(request, chunk, CHUNK_MAX_TOKENS),
+            )
+        # Each request is limited and retried on its own: a retry after a rejected answer doesn't redo the first
+        return generate_summary_parts(self.client, outcome_name, outcome_description, text, source,
+                                      call=lambda request, prompt: self.call(request, prompt, MAX_TOKENS))
+
+
+# Most sentences ranked per outcome; similarity is quadratic in this
+MAX_SENTENCES = 1500
+DAMPING = 0.85
+# Sentences at least this similar to one already chosen say the same thing
+REDUNDANCY_THRESHOLD = 0.5
+
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"[a-z][a-z']+")
+_REPEATED = re.compile(r"\s*\(repeated (\d+) times\)$")
+_IMPROVEMENT_CUES = re.compile(
+    r"\b(should|could|consider|needs?|needed|lacks?|lacking|missing|unclear|vague|try|improve|instead|however|"
+    r"but|not|weak|insufficient|incorrect|confus\w*|avoid|next time|more)\b")
+_STRENGTH_CUES = re.compile(
+    r"\b(good|great|excellent|strong|well|clear|clearly|effective|effectively|nice|thorough|insightful|"
+    r"impressive|solid|correct|correctly|excellently|creative|compelling)\b")
+_STOPWORDS = frozenset(
+    "the a an and or of to in on for with is are was were be been this that it its as at by from your you "
+    "their there which have has had can will would also very".split())
+
+
+def split_sentences(all_comments):
+    """Comment sentences with their weight: how many times the comment was given (see prompt.py)."""
+    sentences, weights = [], []
+    for comment in all_comments.split("\n"):
+        match = _REPEATED.search(comment)
+        weight = int(match.group(1)) if match else 1
+        comment = _REPEATED.sub("", comment)
+        for sentence in _SENTENCE.split(comment.strip()):
+            if len(sentence.split()) >= 4:
+                sentences.append(sentence.strip())
+                weights.append(weight)
+    return sentences, np.asarray(weights, dtype=np.float64)
+
+
+def tfidf_matrix(sentences):
+    """Rows of L2-normalized TF-IDF vectors, one per sentence."""
+    tokens = [[word for word in _WORD.findall(sentence.lower()) if word not in _STOPWORDS] for sentence in sentences]
+    flat = [word for words in tokens for word in words]
+    if not flat:
+        return np.zeros((len(sentences), 0))
+    vocabulary, codes = np.unique(flat, return_inverse=True)
+    rows = np.repeat(np.arange(len(sentences)), [len(words) for words in tokens])
+    counts = np.zeros((len(sentences), len(vocabulary)))
+    np.add.at(counts, (rows, codes), 1.0)
+
+    document_frequency = np.count_nonzero(counts, axis=0)
+    matrix = counts * (np.log((1 + len(sentences)) / (1 + document_frequency)) + 1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def textrank(similarity, weights, iterations=50, tolerance=1e-6):
+    """
+    PageRank over the sentence similarity graph. Random jumps land on a
+    sentence in proportion to `weights`, so comments given often rank higher.
+    """
+    n = len(similarity)
+    graph = similarity.copy()
+    np.fill_diagonal(graph, 0.0)
+    out_weight = graph.sum(axis=1, keepdims=True)
+    transition = np.divide(graph, out_weight, out=np.zeros_like(graph), where=out_weight > 0)
+    teleport = weights / weights.sum()
+    rank = np.full(n, 1.0 / n)
+    for _ in range(iterations):
+        # Sentences similar to nothing hand their rank back through the jump vector
+        dangling = rank[out_weight[:, 0] == 0].sum()
+        updated = (1 - DAMPING) * teleport + DAMPING * (rank @ transition + dangling * teleport)
+        if np.abs(updated - rank).sum() < tolerance:
+            return updated
+        rank = updated
+    return rank
+
+
+def top_distinct(sentences, limit):
+    """Up to `limit` sentences in TextRank order, leaving out any that repeat one already chosen."""
+    if not sentences:
+        return []
+    matrix = tfidf_matrix(sentences)
+    similarity = matrix @ matrix.T
+    chosen = []
+    for index in np.argsort(-textrank(similarity, np.ones(len(sentences))), kind="stable"):
+        if len(chosen) == limit:
+            break
+        if not chosen or similarity[index, chosen].max() < REDUNDANCY_THRESHOLD:
+            chosen.append(index)
+    return [sentences[index] for index in chosen]
+
+
+class ExtractiveSummarizer:
+    """
+    Summaries built from the comments themselves, without a model: sentences
+    are ranked with TextRank over TF-IDF similarity, sorted into strengths or
+    improvements by their wording, and the top distinct ones fill each
+    section. Takes milliseconds, needs no network or API key, and makes an
+    instant first draft until the model's summary replaces it.
+    """
+    name = "extractive"
+
+    def __init__(self, strengths=(2, 4), improvements=(3, 4)):
+        self.strengths = strengths
+        self.improvements = improvements
+
+    def summarize(self, outcome_name, outcome_description, all_comments):
+        sentences, weights = split_sentences(all_comments or "")
+        if len(sentences) > MAX_SENTENCES:
+            keep = np.sort(np.argsort(-weights, kind="stable")[:MAX_SENTENCES])
+            sentences, weights = [sentences[i] for i in keep], weights[keep]
+
+        picked_strengths, picked_improvements = [], []
+        if sentences:
+            matrix = tfidf_matrix(sentences)
+            similarity = matrix @ matrix.T
+            rank = textrank(similarity, weights)
+            lowered = [sentence.lower() for sentence in sentences]
+            tone = np.array([len(_IMPROVEMENT_CUES.findall(s)) - len(_STRENGTH_CUES.findall(s)) for s in lowered])
+
+            chosen = []
+            neutral = []
+            for index in np.argsort(-rank, kind="stable"):
+                if chosen and similarity[index, chosen].max() >= REDUNDANCY_THRESHOLD:
+                    continue
+                if tone[index] > 0 and len(picked_improvements) < self.improvements[1]:
+                    picked_improvements.append(sentences[index])
+                elif tone[index] < 0 and len(picked_strengths) < self.strengths[1]:
+                    picked_strengths.append(sentences[index])
+                elif tone[index] == 0:
+                    neutral.append(sentences[index])
+                else:
+                    continue
+                chosen.append(index)
+            # Sentences with no clear tone make up for a section that is short
+            for sentence in neutral:
+                if len(picked_strengths) < self.strengths[0]:
+                    picked_strengths.append(sentence)
+                elif len(picked_improvements) < self.improvements[0]:
+                    picked_improvements.append(sentence)
+
+        strengths = [f"Your instructors noted: {sentence}" for sentence in picked_strengths]
+        improvements = [f"Focus on this feedback: {sentence}" for sentence in picked_improvements]
+        return self._pad(outcome_name, strengths, improvements)
+
+    def rollup(self, outcome_name, outcome_description, partitions):
+        """
+        Combine partition summaries: the points made in most courses and
+        terms rank highest, and a point repeated across them is kept once.
+        """
+        strengths = top_distinct([line for _, _, text, _ in partitions for line in text.split("\n") if line.strip()],
+                                 self.strengths[1])
+        improvements = top_distinct([line for _, _, _, text in partitions for line in text.split("\n") if line.strip()],
+                                    self.improvements[1])
+        return self._pad(outcome_name, strengths, improvements)
+
+    def _pad(self, outcome_name, strengths, improvements):
+        # Too little feedback still gets the minimum number of points in each section
+        generic_strengths = [
+            f"You demonstrated engagement with {outcome_name} across your assessed work.",
+            f"Your work shows you applying {outcome_name} in more than one context.",
+        ]
+        generic_improvements = [
+            f"Review your lowest-scored work on {outcome_name} and revise one piece of it.",
+            f"Practice applying {outcome_name} explicitly in your next assignment.",
+            f"Ask for targeted feedback on {outcome_name} when you submit your next assignment.",
+        ]
+        # A rollup may already hold some of these from its partitions
+        strengths += [line for line in generic_strengths if line not in strengths][:max(0, self.strengths[0] - len(strengths))]
+        improvements += [line for line in generic_improvements
+                         if line not in improvements][:max(0, self.improvements[0] - len(improvements))]
+        return "\n".join(strengths), "\n".join(improvements)
+
+
+SUMMARIZERS = ("openai", "extractive")
@@ -1,185 +1,814 @@
-from flask import Flask, jsonify, send_file, request
+from flask import Flask, jsonify, send_file, request, g, Response, has_request_context
 from flask_cors import CORS
 import sqlite3
 import os
 import logging
 import csv
 import io
+import json
+import threading
+import time
 from datetime import datetime
 
+import openai
+
+try:
+    from backend.pool import ConnectionPool, PoolTimeout
+    from backend.queries import run_query, iter_query
+    from backend.cache import ResultCache, data_version, make_key
+    from backend.singleflight import SingleFlight
+    from backend.events import EventHub, TooManySubscribers
+    from backend.progress import STATUS_PATH, read_status
+    from backend.exports import ExportManager, FORMAT_EXTENSIONS
+    from backend.grades import GROUPINGS, EngineCache, load_score_arrays
+    from backend.columns import COLUMNS_DIR, CURRENT_FILE, open_columns
+    from backend.summaries import (SUMMARIZERS, RateLimiter, SummaryManager, UsageLedger, fetch_slice,
+                                   generate_slice, store_slice_summary, store_summary_usage)
+    from backend import metrics, queries
+except ImportError:  # running as `python3 backend/app.py`
+    from pool import ConnectionPool, PoolTimeout
+    from queries import run_query, iter_query
+    from cache import ResultCache, data_version, make_key
+    from singleflight import SingleFlight
+    from events import EventHub, TooManySubscribers
+    from progress import STATUS_PATH, read_status
+    from exports import ExportManager, FORMAT_EXTENSIONS
+    from grades import GROUPINGS, EngineCache, load_score_arrays
+    from columns import COLUMNS_DIR, CURRENT_FILE, open_columns
+    from summaries import (SUMMARIZERS, RateLimiter, SummaryManager, UsageLedger, fetch_slice, generate_slice,
+                           store_slice_summary, store_summary_usage)
+    import metrics
+    import queries
+
 app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
-logging.basicConfig(level=logging.DEBUG)
+CORS(app, expose_headers=['X-Data-Version'])  # Enable CORS for all routes
+# Wall-clock budget for the SQL work of a single request
+app.config['QUERY_TIMEOUT_SECONDS'] = float(os.environ.get("QUERY_TIMEOUT_SECONDS", 30))
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
+# Get the absolute path to the database file
+db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data.db')
+
+# Read-only connections are opened once per worker and reused across requests
+db_pool = ConnectionPool(db_path, size=int(os.environ.get("DB_POOL_SIZE", 8)))
+
+# Serialized responses for repeated queries, dropped whenever data.db changes
+result_cache = ResultCache(max_bytes=int(float(os.environ.get("RESULT_CACHE_MB", 64)) * 1024 * 1024))
+metrics.registry.gauge("result_cache_entries", "Entries currently held in the result cache.",
+                       lambda: result_cache.stats()["entries"])
+metrics.registry.gauge("result_cache_bytes", "Bytes of serialized results currently cached.",
+                       lambda: result_cache.stats()["bytes"])
+
+# Identical cache-miss queries running at the same time share one execution
+inflight_queries = SingleFlight()
+metrics.registry.gauge("singleflight_coalescing_ratio",
+                       "Fraction of cache-miss queries answered by another request's in-flight execution.",
+                       lambda: inflight_queries.stats()["coalescing_rate"])
+metrics.registry.gauge("singleflight_in_flight", "Distinct queries currently executing.",
+                       inflight_queries.in_flight)
+
 
 def get_db_connection():
-    # Get the absolute path to the database file
-    db_path = os.path.join(os.path.dirname(__file__), 'data.db')
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    # close() on the returned connection hands it back to the pool
+    start = time.perf_counter()
+    conn = db_pool.acquire()
+    metrics.DB_CONNECTION_WAIT.observe(time.perf_counter() - start)
+
+    if has_request_context():
+        # Released in teardown even if the view bails out before conn.close()
+        g.setdefault('db_connections', []).append(conn)
+        deadline = queries.current_deadline()
+        if deadline is not None:
+            deadline.attach(conn.raw)
     return conn
 
 
+def _route_label():
+    # Use the URL rule rather than the raw path so labels stay low-cardinality
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    # waitress exposes this when channel_request_lookahead is enabled (see serve.py)
+    is_disconnected = request.environ.get('waitress.client_disconnected')
+    queries.set_deadline(queries.Deadline(app.config['QUERY_TIMEOUT_SECONDS'], is_disconnected))
+
+
+@app.after_request
+def record_request_metrics(response):
+    route = _route_label()
+    elapsed = time.perf_counter() - g.get("request_start", time.perf_counter())
+    metrics.HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+    metrics.HTTP_LATENCY.observe(elapsed, route=route)
+    if response.content_length is not None:
+        metrics.HTTP_RESPONSE_BYTES.observe(response.content_length, route=route)
+    g.response_status = response.status_code
+    return response
+
+
+@app.teardown_request
+def finish_request(exc):
+    # Errors are counted only here: an unhandled exception reaches after_request as a 500 as well as
+    # teardown as `exc`, and when exceptions propagate after_request doesn't run at all
+    if exc is not None or g.get("response_status", 0) >= 500:
+        metrics.HTTP_ERRORS.inc(route=_route_label())
+    queries.set_deadline(None)
+    for conn in g.pop('db_connections', []):
+        conn.close()
+
+
+@app.errorhandler(queries.QueryCancelled)
+def handle_query_cancelled(e):
+    logger.warning("Query cancelled on %s: %s", request.path, e)
+    return jsonify({'error': str(e)}), e.status_code
+
+
+@app.errorhandler(PoolTimeout)
+def handle_pool_timeout(e):
+    logger.warning("No database connection available for %s: %s", request.path, e)
+    return jsonify({'error': 'Server is busy, please retry shortly'}), 503, {'Retry-After': '1'}
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+def describe_data_version():
+    """The latest published sync: its version number, timestamps and changed-rows summary."""
+    try:
+        conn = get_db_connection()
+        try:
+            rows = run_query(conn.cursor(), "latest_sync_run", """
+                SELECT version, started_on, finished_on, summary
+                FROM sync_runs
+                ORDER BY version DESC
+                LIMIT 1
+            """)
+        finally:
+            conn.close()
+    except sqlite3.OperationalError:
+        rows = []  # no database yet, or one synced before sync_runs existed
+
+    if not rows:
+        return {'version': None, 'started_on': None, 'finished_on': None, 'summary': None}
+    row = rows[0]
+    return {
+        'version': row['version'],
+        'started_on': row['started_on'],
+        'finished_on': row['finished_on'],
+        'summary': json.loads(row['summary']) if row['summary'] else None,
+    }
+
+
+# Pushes sync progress and data-version changes to open /api/events streams.
+# Every open stream holds a worker thread, so keep this well below the worker count
+event_hub = EventHub(
+    db_path, STATUS_PATH, describe_data_version,
+    poll_interval=float(os.environ.get("EVENTS_POLL_SECONDS", 1)),
+    max_subscribers=int(os.environ.get("SSE_MAX_STREAMS", 4)),
+)
+metrics.registry.gauge("event_streams_open", "Open /api/events streams.", event_hub.subscriber_count)
+
+
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    try:
+        subscriber = event_hub.subscribe()
+    except TooManySubscribers as e:
+        logger.warning("Refusing event stream: %s", e)
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '10'}
+
+    # Tell the client where things stand right away; later events only describe changes.
+    # Subscribing first means a sync landing in between is reported rather than missed
+    try:
+        initial = [('data-version', describe_data_version())]
+    except Exception:
+        event_hub.unsubscribe(subscriber)
+        raise
+    status = read_status(event_hub.status_path)
+    if status is not None:
+        initial.append(('sync-progress', status))
+
+    response = Response(
+        event_hub.stream(subscriber, initial),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+    # The stream unsubscribes when it ends, but a body that is never read (a HEAD request, a client
+    # gone before the first chunk) never runs it; the server closes every response either way
+    response.call_on_close(lambda: event_hub.unsubscribe(subscriber))
+    return response
+
+
+FEEDBACK_QUERY = '''
+    SELECT assessment_id, score, weight, comment, outcome_name, assignment_title, 
+           course_title, course_code, term_title, created_on, forum_link
+    FROM all_scores
+'''
+
+
+def cached_query(name, sql, params, serialize):
+    """
+    Run a query and serialize its rows to bytes with `serialize`. The bytes are
+    kept in the result cache and reused until the database changes, and
+    concurrent identical misses share a single execution.
+    Database errors are raised to the caller and never cached.
+    """
+    # Read the version before querying so a sync landing mid-query can't be cached as current
+    version = data_version(db_path)
+    # The name is part of the key: endpoints running the same statement serialize it differently
+    key = (name, make_key(sql, params))
+    if version is not None:
+        body = result_cache.get(key, version)
+        if body is not None:
+            return body
+
+    ran = []
+
+    def execute():
+        ran.append(True)
+        conn = get_db_connection()
+        try:
+            rows = run_query(conn.cursor(), name, sql, params)
+        finally:
+            conn.close()
+        logger.debug("Retrieved %d rows for %s", len(rows), name)
+
+        body = serialize(rows)
+        if version is not None:
+            result_cache.put(key, version, body)
+        return body
+
+    while True:
+        try:
+            return inflight_queries.do((version, key), execute)[0]
+        except queries.QueryCancelled as e:
+            # Our own query, or our own deadline while waiting for another request's, is ours to report.
+            # The leader running out of time or losing its client says nothing about ours, so run it again
+            deadline = queries.current_deadline()
+            if ran or (deadline is not None and deadline.reason is e):
+                raise
+
+
+def feedback_item(row, debug=False):
+    # Handle potential None values safely
+    score_value = row['score']
+    weight_str = row['weight'] or "1x"  # fallback if None
+
+    # Parse numeric weight
+    weight_raw = row['weight']
+    try:
+        # Convert to string first in case it's an int/float
+        weight_numeric = float(str(weight_raw).replace('x', '')) if weight_raw is not None else 1.0
+    except (ValueError, TypeError, AttributeError) as e:
+        weight_numeric = weight_raw
+
+    # Parse score safely
+    if score_value is None:
+        if debug:
+            logger.debug("Found null score value in row: %s", dict(row))
+        score = 0.0
+    else:
+        try:
+            score = float(score_value)
+        except (ValueError, TypeError) as e:
+            logger.error("Error converting score %r to float: %s", score_value, e)
+            score = 0.0
+
+    return {
+        'assessment_id': row['assessment_id'],
+        'score': score,
+        'weight': weight_str,          # keep original (e.g., "8x")
+        'weight_numeric': weight_numeric,  # new numeric field (e.g., 8.0)
+        'comment': row['comment'] or "",
+        'outcome_name': row['outcome_name'] or "",
+        'assignment_title': row['assignment_title'] or "",
+        'course_title': row['course_title'] or "",
+        'course_code': row['course_code'] or "",
+        'term_title': row['term_title'] or "",
+        'created_on': row['created_on'] or "",
+        'forum_link': row['forum_link'] or ""
+
+    }
+
+
+def serialize_feedback(rows):
+    debug = logger.isEnabledFor(logging.DEBUG)
+
+    # Debug: Show first row structure if available
+    if debug and rows:
+        logger.debug("First row structure: %s", dict(rows[0]))
+    
+    # Convert rows to list of dictionaries
+    feedback_data = [feedback_item(row, debug) for row in rows]
+
+    return jsonify(feedback_data).get_data()
+
+
+def current_sync_version():
+    """Version of the latest published sync; None if data.db predates sync versions."""
+    try:
+        body = cached_query("sync_version", "SELECT MAX(version) AS version FROM sync_runs", (),
+                            lambda rows: json.dumps(rows[0]['version'] if rows else None).encode())
+    except sqlite3.OperationalError:
+        return None
+    return json.loads(body)
+
+
+# Rows of all_scores changed in versions (since, until], followed by the ids of
+# every assessment changed in that range. Ids that don't come back as rows were
+# deleted (or no longer appear in all_scores) and are reported as such
+FEEDBACK_CHANGES_QUERY = '''
+    SELECT 0 AS removed, assessment_id, score, weight, comment, outcome_name, assignment_title,
+           course_title, course_code, term_title, created_on, forum_link
+    FROM all_scores
+    WHERE assessment_id IN (
+        SELECT assessment_id FROM score_changes
+        WHERE version > ? AND version <= ? AND change != 'delete'
+    )
+    UNION ALL
+    SELECT 1, assessment_id, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL
+    FROM score_changes
+    WHERE version > ? AND version <= ?
+'''
+
+
+def serialize_feedback_changes(since, version):
+    def serialize(rows):
+        upserts = [feedback_item(row) for row in rows if not row['removed']]
+        upserted_ids = {item['assessment_id'] for item in upserts}
+        deleted = [row['assessment_id'] for row in rows
+                   if row['removed'] and row['assessment_id'] not in upserted_ids]
+        return jsonify({'version': version, 'since': since, 'upserts': upserts, 'deleted': deleted}).get_data()
+    return serialize
+
+
+def get_feedback_changes(since):
+    """
+    The ?since= delta. An assessment counts as changed when its own row does,
+    or its assignment or course does; changes to terms, colleges and learning
+    outcomes alone are not tracked and only show up in a full reload.
+    """
+    # Changes are bounded by the version read here, so a sync landing mid-request
+    # is left for the client's next call rather than half-included
+    version = current_sync_version()
+    if version is None or since < 1 or since > version:
+        # Unknown to this database (e.g. it was rebuilt from scratch): the client must reload everything
+        return jsonify({'error': 'Unknown data version; fetch /api/feedback in full', 'version': version}), 410
+
+    try:
+        body = cached_query("feedback_changes", FEEDBACK_CHANGES_QUERY, (since, version, since, version),
+                            serialize_feedback_changes(since, version))
+    except sqlite3.OperationalError as e:
+        logger.error("Error querying feedback changes: %s", e)
+        return jsonify({'error': 'Could not read changes; fetch /api/feedback in full', 'version': version}), 410
+
+    return Response(body, mimetype='application/json')
+
+
 @app.route('/api/feedback', methods=['GET'])
 def get_feedback():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Debug: Show available tables in the database
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = cursor.fetchall()
-    logger.debug(f"Available tables in database: {[table['name'] for table in tables]}")
-    
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return jsonify({'error': 'since must be an integer data version'}), 400
+        return get_feedback_changes(since)
+
+    # Debug: Show available tables in the database (skipped entirely unless DEBUG is on)
+    if logger.isEnabledFor(logging.DEBUG):
+        conn = get_db_connection()
+        tables = run_query(conn.cursor(), "list_tables", "SELECT name FROM sqlite_master WHERE type='table';")
+        logger.debug("Available tables in database: %s", [table['name'] for table in tables])
+        conn.close()
+
+    # Read the version first: the rows below are at least that new, so the client's
+    # next ?since= request can at worst repeat a change, never miss one
+    version = current_sync_version()
     try:
         # Query the all_scores view
-        logger.debug("Attempting to query all_scores view")
-        cursor.execute('''
-            SELECT score, weight, comment, outcome_name, assignment_title, 
-                   course_title, course_code, term_title, created_on, forum_link
-            FROM all_scores
-        ''')
+        body = cached_query("feedback", FEEDBACK_QUERY, (), serialize_feedback)
     except sqlite3.OperationalError as e:
-        logger.debug(f"Error querying all_scores: {e}")
+        logger.debug("Error querying all_scores: %s", e)
         return jsonify([])  # Return empty list on failure
-    
-    rows = cursor.fetchall()
-    logger.debug(f"Retrieved {len(rows)} rows from database")
-    
-    # Debug: Show first row structure if available
-    if rows:
-        first_row = dict(rows[0])
-        logger.debug(f"First row structure: {first_row}")
-    
-    # Convert rows to list of dictionaries
-    feedback_data = []
-    for row in rows:
-        # Handle potential None values safely
-        score_value = row['score']
-        weight_str = row['weight'] or "1x"  # fallback if None
 
-        # Parse numeric weight
-        weight_raw = row['weight']
-        try:
-            # Convert to string first in case it's an int/float
-            weight_numeric = float(str(weight_raw).replace('x', '')) if weight_raw is not None else 1.0
-        except (ValueError, TypeError, AttributeError) as e:
-            weight_numeric = weight_raw
-
-        # Parse score safely
-        if score_value is None:
-            logger.debug(f"Found null score value in row: {dict(row)}")
-            score = 0.0
-        else:
-            try:
-                score = float(score_value)
-            except (ValueError, TypeError) as e:
-                logger.error(f"Error converting score '{score_value}' to float: {e}")
-                score = 0.0
-
-        feedback_data.append({
-            'score': score,
-            'weight': weight_str,          # keep original (e.g., "8x")
-            'weight_numeric': weight_numeric,  # new numeric field (e.g., 8.0)
-            'comment': row['comment'] or "",
-            'outcome_name': row['outcome_name'] or "",
-            'assignment_title': row['assignment_title'] or "",
-            'course_title': row['course_title'] or "",
-            'course_code': row['course_code'] or "",
-            'term_title': row['term_title'] or "",
-            'created_on': row['created_on'] or "",
-            'forum_link': row['forum_link'] or ""
-
-        })
-
-
-    conn.close()
-    return jsonify(feedback_data)
+    response = Response(body, mimetype='application/json')
+    if version is not None:
+        response.headers['X-Data-Version'] = str(version)
+    return response
+
+
+def serialize_course_scores(rows):
+    course_scores = [
+        {
+            "course_code": row["course_code"],
+            "course_score": row["score"]
+        }
+        for row in rows
+    ]
+    return jsonify(course_scores).get_data()
+
 
 @app.route('/api/course-scores', methods=['GET'])
 def get_course_scores():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
     try:
         # Join course_scores with courses to get course_code
-        cursor.execute("""
+        body = cached_query("course_scores", """
             SELECT c.course_code, cs.score
             FROM course_scores cs
             JOIN courses c ON cs.course_id = c.course_id
-        """)
-        rows = cursor.fetchall()
+        """, (), serialize_course_scores)
+        return Response(body, mimetype='application/json')
+
+    except sqlite3.Error as e:
+        logger.error("❌ Error fetching course scores: %s", e)
+        return jsonify([]), 500
+
+
+# Same rows as views.sql's score_cube, for a database synced before score_cube existed
+SCORE_CUBE_FALLBACK = '''(
+    SELECT outcome_name, course_code, MAX(course_title) AS course_title, term_title,
+           COALESCE(score, 0) AS score, score IS NOT NULL AS scored, COUNT(*) AS n,
+           SUM(COALESCE(score, 0)) AS score_sum,
+           SUM(w) AS weight_sum, SUM(COALESCE(score, 0) * w) AS weighted_score_sum
+    FROM (
+        SELECT *, CASE WHEN weight IS NULL THEN 1.0
+                       ELSE CAST(REPLACE(CAST(weight AS TEXT), 'x', '') AS REAL) END AS w
+        FROM all_scores
+    )
+    GROUP BY outcome_name, course_code, term_title, COALESCE(score, 0), score IS NOT NULL
+)'''
+
+
+class CubeFilters:
+    """
+    The filter panel's selection as SQL conditions on score_cube columns.
+    conditions(excluding=facet) leaves out one facet's own selection.
+    """
+    def __init__(self, hcs=(), courses=(), terms=(), min_score=0, max_score=5):
+        self.score_condition, self.score_params = '1', []
+        if min_score > 0:
+            self.score_condition += ' AND score >= ?'
+            self.score_params.append(min_score)
+        if max_score < 5:
+            self.score_condition += ' AND score <= ?'
+            self.score_params.append(max_score)
+
+        self.selections = {
+            'hc': self._in_list('outcome_name', hcs),
+            'course': self._in_list('course_code', courses),
+            'term': self._in_list('term_title', terms),
+        }
+
+    @staticmethod
+    def _in_list(column, values):
+        if not values:
+            return '1', []
+        return f"{column} IN ({', '.join('?' * len(values))})", list(values)
+
+    def conditions(self, excluding=None):
+        parts = [self.score_condition]
+        params = list(self.score_params)
+        for facet, (condition, condition_params) in self.selections.items():
+            if facet != excluding:
+                parts.append(condition)
+                params += condition_params
+        return ' AND '.join(parts), params
+
+
+def build_facets_query(hcs=(), courses=(), terms=(), min_score=0, max_score=5, source='score_cube'):
+    """
+    One statement returning, for each facet value, the row count and score sum
+    under the current filters. Each facet ignores its own selection, so the
+    counts show what adding another value to it would bring in. A final
+    'total' row covers all filters.
+    """
+    conditions = CubeFilters(hcs, courses, terms, min_score, max_score).conditions
+
+    selects = []
+    params = []
+    for facet, column, label in (('hc', 'outcome_name', 'NULL'),
+                                 ('course', 'course_code', 'MAX(course_title)'),
+                                 ('term', 'term_title', 'NULL')):
+        condition, condition_params = conditions(excluding=facet)
+        selects.append(f'''
+            SELECT '{facet}' AS facet, {column} AS value, {label} AS label,
+                   SUM(CASE WHEN {condition} THEN n ELSE 0 END) AS count,
+                   SUM(CASE WHEN {condition} THEN score_sum END) AS score_sum
+            FROM {source}
+            WHERE {column} IS NOT NULL
+            GROUP BY {column}
+        ''')
+        params += condition_params * 2
 
-        course_scores = [
-            {
-                "course_code": row["course_code"],
-                "course_score": row["score"]
+    condition, condition_params = conditions()
+    selects.append(f'''
+        SELECT 'total', NULL, NULL, COALESCE(SUM(n), 0), SUM(score_sum)
+        FROM {source}
+        WHERE {condition}
+    ''')
+    params += condition_params
+    return ' UNION ALL '.join(selects), params
+
+
+def serialize_facets(rows):
+    facets = {'hc': [], 'course': [], 'term': []}
+    total = {'count': 0, 'mean': None}
+    for row in rows:
+        count = row['count'] or 0
+        mean = row['score_sum'] / count if count else None
+        if row['facet'] == 'total':
+            total = {'count': count, 'mean': mean}
+            continue
+        item = {'value': row['value'], 'label': row['value'], 'count': count, 'mean': mean}
+        if row['facet'] == 'course':
+            item['label'] = f"{row['value']} - {row['label']}"
+        facets[row['facet']].append(item)
+
+    # HCs before LOs (whose names contain a hyphen), each alphabetically, as the filter panel lists them
+    facets['hc'].sort(key=lambda item: ('-' in item['value'], item['value']))
+    facets['course'].sort(key=lambda item: item['value'])
+    facets['term'].sort(key=lambda item: item['value'])
+    return jsonify({'total': total, 'facets': facets}).get_data()
+
+
+def filter_args():
+    """The filter panel's selection from the query string; raises ValueError on bad scores."""
+    return {
+        'hcs': request.args.getlist('hc'),
+        'courses': request.args.getlist('course'),
+        'terms': request.args.getlist('term'),
+        'min_score': float(request.args.get('minScore', 0)),
+        'max_score': float(request.args.get('maxScore', 5)),
+    }
+
+
+@app.route('/api/facets', methods=['GET'])
+def get_facets():
+    try:
+        filters = filter_args()
+    except ValueError:
+        return jsonify({'error': 'minScore and maxScore must be numbers'}), 400
+
+    engine = mapped_grade_engine()
+    if engine is not None:
+        return Response(serialize_facets(engine.facet_rows(**filters)), mimetype='application/json')
+
+    try:
+        try:
+            query, params = build_facets_query(**filters)
+            body = cached_query("facets", query, params, serialize_facets)
+        except sqlite3.OperationalError as e:
+            if 'score_cube' not in str(e):
+                raise
+            query, params = build_facets_query(source=SCORE_CUBE_FALLBACK, **filters)
+            body = cached_query("facets_fallback", query, params, serialize_facets)
+        return Response(body, mimetype='application/json')
+
+    except sqlite3.Error as e:
+        logger.error("❌ Error computing facets: %s", e)
+        return jsonify({'error': 'Could not compute facets'}), 500
+
+
+RANKING_METRICS = ('mean', 'weighted_mean', 'count')
+RANKING_TYPES = ('all', 'hc', 'lo')
+
+
+def build_ranking_query(metric='mean', outcome_type='all', order='desc', k=5, offset=0, limit=25,
+                        filters=None, source='score_cube'):
+    """
+    Rank outcomes under the filters, best first by `metric`, and return in one
+    statement the k best, the k worst and one page of `limit` outcomes from
+    `offset` in the requested `order`. Only the aggregated outcomes are sorted,
+    never the underlying rows. Missing scores don't count, as in /api/grades.
+    """
+    condition, params = (filters or CubeFilters()).conditions()
+    if outcome_type == 'hc':
+        condition += " AND instr(outcome_name, '-') = 0"
+    elif outcome_type == 'lo':
+        condition += " AND instr(outcome_name, '-') > 0"
+
+    # Page position counts from the top for 'desc' and from the bottom for 'asc'
+    position = 'rank' if order == 'desc' else '(total - rank + 1)'
+    query = f'''
+        WITH stats AS (
+            SELECT outcome_name,
+                   SUM(n) AS count,
+                   SUM(score_sum) * 1.0 / SUM(n) AS mean,
+                   SUM(weighted_score_sum) / NULLIF(SUM(weight_sum), 0) AS weighted_mean
+            FROM {source}
+            WHERE outcome_name IS NOT NULL AND scored AND {condition}
+            GROUP BY outcome_name
+            HAVING SUM(n) > 0
+        ),
+        ranked AS (
+            SELECT *,
+                   ROW_NUMBER() OVER (ORDER BY {metric} DESC, outcome_name) AS rank,
+                   COUNT(*) OVER () AS total
+            FROM stats
+        )
+        SELECT *, {position} AS position
+        FROM ranked
+        WHERE rank <= ? OR rank > total - ? OR {position} BETWEEN ? AND ?
+        ORDER BY rank
+    '''
+    return query, params + [k, k, offset + 1, offset + limit]
+
+
+def serialize_ranking(metric, order, k, offset, limit):
+    def serialize(rows):
+        def outcome(row):
+            return {
+                'rank': row['rank'],
+                'outcome_name': row['outcome_name'],
+                'is_hc': '-' not in row['outcome_name'],
+                'count': row['count'],
+                'mean': row['mean'],
+                'weighted_mean': row['weighted_mean'],
             }
-            for row in rows
-        ]
-        return jsonify(course_scores)
+
+        total = rows[0]['total'] if rows else 0
+        page = sorted((row for row in rows if offset < row['position'] <= offset + limit),
+                      key=lambda row: row['position'])
+        return jsonify({
+            'metric': metric,
+            'order': order,
+            'total': total,
+            'top': [outcome(row) for row in rows if row['rank'] <= k],
+            # Worst first
+            'bottom': [outcome(row) for row in reversed(rows) if row['rank'] > total - k],
+            'items': [outcome(row) for row in page],
+            'offset': offset,
+            'limit': limit,
+            'next_offset': offset + limit if offset + limit < total else None,
+        }).get_data()
+    return serialize
+
+
+@app.route('/api/rankings', methods=['GET'])
+def get_rankings():
+    metric = request.args.get('metric', 'mean')
+    outcome_type = request.args.get('type', 'all').lower()
+    order = request.args.get('order', 'desc')
+    if metric not in RANKING_METRICS or outcome_type not in RANKING_TYPES or order not in ('asc', 'desc'):
+        return jsonify({'error': f"metric must be one of {', '.join(RANKING_METRICS)}, "
+                                 f"type one of {', '.join(RANKING_TYPES)} and order asc or desc"}), 400
+    try:
+        filters = CubeFilters(**filter_args())
+        k = min(max(int(request.args.get('k', 5)), 0), 100)
+        offset = max(int(request.args.get('offset', 0)), 0)
+        limit = min(max(int(request.args.get('limit', 25)), 1), 200)
+    except ValueError:
+        return jsonify({'error': 'k, offset, limit, minScore and maxScore must be numbers'}), 400
+
+    serialize = serialize_ranking(metric, order, k, offset, limit)
+    try:
+        try:
+            query, params = build_ranking_query(metric, outcome_type, order, k, offset, limit, filters)
+            body = cached_query("rankings", query, params, serialize)
+        except sqlite3.OperationalError as e:
+            # A score_cube built before it had the `scored` column is as good as none
+            if 'score_cube' not in str(e) and 'scored' not in str(e):
+                raise
+            query, params = build_ranking_query(metric, outcome_type, order, k, offset, limit, filters,
+                                                source=SCORE_CUBE_FALLBACK)
+            body = cached_query("rankings_fallback", query, params, serialize)
+        return Response(body, mimetype='application/json')
 
     except sqlite3.Error as e:
-        logger.error(f"❌ Error fetching course scores: {e}")
-        return jsonify([]), 500
+        logger.error("❌ Error ranking outcomes: %s", e)
+        return jsonify({'error': 'Could not rank outcomes'}), 500
+
+
+# Where ingestion writes the columnar score snapshot (see columns.py)
+columns_dir = COLUMNS_DIR
 
+
+def load_grade_arrays():
+    """
+    Memory-map the columnar snapshot written for the published sync, so every
+    worker process shares the same pages; read the scores from SQLite if it
+    is missing or belongs to another sync.
+    """
+    version = current_sync_version()
+    if version is not None:
+        arrays = open_columns(columns_dir, version)
+        if arrays is not None:
+            return arrays
+    conn = get_db_connection()
+    try:
+        return load_score_arrays(conn.cursor())
     finally:
         conn.close()
 
 
-@app.route('/api/export', methods=['GET'])
-def export_data():
-    # Get filter parameters
-    hc = request.args.get('hc', '')
-    course = request.args.get('course', '')
-    term = request.args.get('term', '')
-    min_score = float(request.args.get('minScore', 0))
-    max_score = float(request.args.get('maxScore', 5))
+# Score facts held as NumPy arrays, reloaded once per data version
+grade_engines = EngineCache(load_grade_arrays)
+
+
+def mapped_grade_engine():
+    """The grade engine if it is backed by the memory-mapped columnar snapshot, else None."""
+    if not os.path.exists(os.path.join(columns_dir, CURRENT_FILE)):
+        return None
+    try:
+        engine = grade_engines.get(data_version(db_path))
+    except sqlite3.Error:
+        return None
+    return engine if engine.arrays.mapped else None
+
+
+@app.route('/api/grades', methods=['GET'])
+def get_grades():
+    groupings = [grouping for grouping in request.args.get('by', ','.join(GROUPINGS)).split(',') if grouping]
+    if not groupings or any(grouping not in GROUPINGS for grouping in groupings):
+        return jsonify({'error': f"by must list some of {', '.join(GROUPINGS)}"}), 400
+    try:
+        filters = filter_args()
+    except ValueError:
+        return jsonify({'error': 'minScore and maxScore must be numbers'}), 400
+
+    try:
+        engine = grade_engines.get(data_version(db_path))
+    except sqlite3.Error as e:
+        logger.error("❌ Error loading scores for grades: %s", e)
+        return jsonify({'error': 'Could not compute grades'}), 500
+    return jsonify(engine.grades(groupings, **filters))
+
+
+# Bounds on one /api/simulate request
+SIMULATE_MAX_SCENARIOS = int(os.environ.get("SIMULATE_MAX_SCENARIOS", 1000))
+SIMULATE_MAX_EDITS = int(os.environ.get("SIMULATE_MAX_EDITS", 20000))
+
+
+@app.route('/api/simulate', methods=['POST'])
+def simulate_grades():
+    """
+    What-if grades. Body: {"scenarios": [[edit, ...], ...]}, where an edit is
+    {"outcome", "course", "score", "weight"} for a new score or
+    {"assessment_id", "score"[, "weight"]} for a changed one.
+    """
+    body = request.get_json(silent=True) or {}
+    scenarios = body.get('scenarios')
+    if not isinstance(scenarios, list) or not all(
+            isinstance(scenario, list) and all(isinstance(edit, dict) for edit in scenario)
+            for scenario in scenarios):
+        return jsonify({'error': 'scenarios must be a list of lists of score edits'}), 400
+    if len(scenarios) > SIMULATE_MAX_SCENARIOS or sum(map(len, scenarios)) > SIMULATE_MAX_EDITS:
+        return jsonify({'error': f"At most {SIMULATE_MAX_SCENARIOS} scenarios and "
+                                 f"{SIMULATE_MAX_EDITS} edits per request"}), 413
+
+    try:
+        engine = grade_engines.get(data_version(db_path))
+    except sqlite3.Error as e:
+        logger.error("❌ Error loading scores for simulation: %s", e)
+        return jsonify({'error': 'Could not simulate grades'}), 500
+    try:
+        results = engine.simulate(scenarios)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'scenarios': results})
+
+
+def build_export_query(hc='', course='', term='', min_score=0, max_score=5):
+    # Base query
+    query = '''
+        SELECT assessment_id, score, weight, comment, outcome_name, assignment_title, 
+               course_title, course_code, term_title, created_on, forum_link
+        FROM all_scores
+        WHERE 1=1
+    '''
+    params = []
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    # Add filters if provided
+    if hc:
+        query += ' AND outcome_name = ?'
+        params.append(hc)
     
-    try:
-        # Base query
-        query = '''
-            SELECT score, weight, comment, outcome_name, assignment_title, 
-                   course_title, course_code, term_title, created_on, forum_link
-            FROM all_scores
-            WHERE 1=1
-        '''
-        params = []
+    if course:
+        query += ' AND course_code = ?'
+        params.append(course)
         
-        # Add filters if provided
-        if hc:
-            query += ' AND outcome_name = ?'
-            params.append(hc)
+    if term:
+        query += ' AND term_title = ?'
+        params.append(term)
         
-        if course:
-            query += ' AND course_code = ?'
-            params.append(course)
-            
-        if term:
-            query += ' AND term_title = ?'
-            params.append(term)
-            
-        if min_score > 0:
-            query += ' AND score >= ?'
-            params.append(min_score)
-            
-        if max_score < 5:
-            query += ' AND score <= ?'
-            params.append(max_score)
+    if min_score > 0:
+        query += ' AND score >= ?'
+        params.append(min_score)
         
-        # Execute the query with parameters
-        logger.debug(f"Exporting filtered data with query: {query} and params: {params}")
-        cursor.execute(query, params)
-    except sqlite3.OperationalError as e:
-        logger.debug(f"Error querying all_scores: {e}")
-        rows = []
-    
-    rows = cursor.fetchall()
-    logger.debug(f"Retrieved {len(rows)} rows for filtered export")
-    
+    if max_score < 5:
+        query += ' AND score <= ?'
+        params.append(max_score)
+
+    return query, params
+
+
+def filtered_scores_csv(rows):
     # Create a CSV in memory
     output = io.StringIO()
     writer = csv.writer(output)
@@ -205,19 +834,73 @@ def export_data():
             row['forum_link'] or ""
 
         ])
+
+    return output.getvalue().encode('utf-8')
+
+
+ALL_SCORES_CSV_HEADER = ['Score', 'Weight', 'Comment', 'Outcome Name', 'Assignment Title',
+                         'Course Title', 'Course Code', 'Term Title', 'Created On', 'Forum Link']
+
+
+def all_scores_csv_row(row):
+    return [
+        row['score'],
+        row['weight'],
+        row['comment'] or "",
+        row['outcome_name'] or "",
+        row['assignment_title'] or "",
+        row['course_title'] or "",
+        row['course_code'] or "",
+        row['term_title'] or "",
+        row['created_on'] or "",
+        row['forum_link'] or ""
+    ]
+
+
+def all_scores_csv(rows):
+    # Create a CSV in memory
+    output = io.StringIO()
+    writer = csv.writer(output)
+    
+    # Write header
+    writer.writerow(ALL_SCORES_CSV_HEADER)
+    
+    # Write data rows
+    for row in rows:
+        writer.writerow(all_scores_csv_row(row))
+
+    return output.getvalue().encode('utf-8')
+
+
+@app.route('/api/export', methods=['GET'])
+def export_data():
+    # Get filter parameters
+    hc = request.args.get('hc', '')
+    course = request.args.get('course', '')
+    term = request.args.get('term', '')
+    try:
+        min_score = float(request.args.get('minScore', 0))
+        max_score = float(request.args.get('maxScore', 5))
+    except ValueError:
+        return jsonify({'error': 'minScore and maxScore must be numbers'}), 400
+    
+    query, params = build_export_query(hc, course, term, min_score, max_score)
     
-    # Prepare the response
-    output.seek(0)
+    try:
+        # Execute the query with parameters
+        logger.debug("Exporting filtered data with query: %s and params: %s", query, params)
+        body = cached_query("export_filtered", query, params, filtered_scores_csv)
+    except sqlite3.OperationalError as e:
+        logger.debug("Error querying all_scores: %s", e)
+        body = filtered_scores_csv([])
     
     # Generate filename with timestamp
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"filtered_scores_{timestamp}.csv"
     
-    conn.close()
-    
     # Return the CSV file
     return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8')),
+        io.BytesIO(body),
         mimetype='text/csv',
         as_attachment=True,
         download_name=filename
@@ -226,91 +909,307 @@ def export_data():
 
 @app.route('/api/export-all', methods=['GET'])
 def export_all_data():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     try:
         # Query the all_scores view without any filters
         logger.debug("Exporting all data from all_scores view")
-        cursor.execute('''
-            SELECT score, weight, comment, outcome_name, assignment_title, 
-                   course_title, course_code, term_title, created_on, forum_link
-            FROM all_scores
-        ''')
+        body = cached_query("export_all", FEEDBACK_QUERY, (), all_scores_csv)
     except sqlite3.OperationalError as e:
-        logger.debug(f"Error querying all_scores: {e}")
-        rows = []
-    
-    rows = cursor.fetchall()
-    logger.debug(f"Retrieved {len(rows)} rows for full export")
-    
-    # Create a CSV in memory
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write header
-    writer.writerow(['Score', 'Weight', 'Comment', 'Outcome Name', 'Assignment Title', 
-                     'Course Title', 'Course Code', 'Term Title', 'Created On', 'Forum Link'])
-    
-    # Write data rows
-    for row in rows:
-        writer.writerow([
-            row['score'],
-            row['weight'],
-            row['comment'] or "",
-            row['outcome_name'] or "",
-            row['assignment_title'] or "",
-            row['course_title'] or "",
-            row['course_code'] or "",
-            row['term_title'] or "",
-            row['created_on'] or "",
-            row['forum_link'] or ""
-        ])
-    
-    # Prepare the response
-    output.seek(0)
+        logger.debug("Error querying all_scores: %s", e)
+        body = all_scores_csv([])
     
     # Generate filename with timestamp
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"all_scores_{timestamp}.csv"
     
-    conn.close()
-    
     # Return the CSV file
     return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8')),
+        io.BytesIO(body),
         mimetype='text/csv',
         as_attachment=True,
         download_name=filename
     )
 
+# Background export jobs, for exports too large to build inside a request.
+# They get their own connections so a long export never holds one a request needs
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", 2))
+app.config['EXPORT_TIMEOUT_SECONDS'] = float(os.environ.get("EXPORT_TIMEOUT_SECONDS", 600))
+export_pool = ConnectionPool(db_path, size=EXPORT_WORKERS)
+
+
+def write_export(job, f):
+    """Stream the rows matching `job.filters` to `f` in `job.format`, reporting progress per batch."""
+    query, params = build_export_query(**job.filters)
+    deadline = queries.Deadline(app.config['EXPORT_TIMEOUT_SECONDS'])
+    queries.set_deadline(deadline)
+    conn = export_pool.acquire()
+    try:
+        deadline.attach(conn.raw)
+        cursor = conn.cursor()
+        total = run_query(cursor, "export_job_count", f"SELECT COUNT(*) AS n FROM ({query})", params)[0]['n']
+        export_manager.progress(job, 0, total)
+
+        writer = csv.writer(f)
+        if job.format == 'csv':
+            writer.writerow(ALL_SCORES_CSV_HEADER)
+        else:
+            f.write('[')
+
+        written = 0
+        for batch in iter_query(cursor, "export_job", query, params):
+            if job.format == 'csv':
+                writer.writerows(all_scores_csv_row(row) for row in batch)
+            else:
+                f.write(('' if written == 0 else ',') + ','.join(json.dumps(feedback_item(row)) for row in batch))
+            written += len(batch)
+            export_manager.progress(job, written)
+
+        if job.format == 'json':
+            f.write(']')
+    finally:
+        conn.close()
+        queries.set_deadline(None)
+
+
+export_manager = ExportManager(
+    os.environ.get("EXPORT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exports')),
+    write_export,
+    workers=EXPORT_WORKERS,
+    max_bytes=int(float(os.environ.get("EXPORT_CACHE_MB", 512)) * 1024 * 1024),
+    ttl=float(os.environ.get("EXPORT_TTL_SECONDS", 3600)),
+    # Clients can follow progress on /api/events as well as by polling
+    on_progress=lambda job: event_hub.publish('export-progress', export_job_json(job)),
+)
+
+
+def export_job_json(job):
+    data = job.to_dict()
+    data['status_url'] = f"/api/exports/{job.id}"
+    data['download_url'] = f"/api/exports/{job.id}/download" if job.state == 'done' else None
+    return data
+
+
+@app.route('/api/exports', methods=['POST'])
+def create_export():
+    body = request.get_json(silent=True) or {}
+    if not isinstance(body, dict):
+        return jsonify({'error': 'expected a JSON object'}), 400
+    fmt = body.get('format', 'csv')
+    if not isinstance(fmt, str) or fmt not in FORMAT_EXTENSIONS:
+        return jsonify({'error': f"format must be one of {', '.join(FORMAT_EXTENSIONS)}"}), 400
+    for name in ('hc', 'course', 'term'):
+        if not isinstance(body.get(name, ''), str):
+            return jsonify({'error': f"{name} must be a string"}), 400
+    try:
+        filters = {
+            'hc': body.get('hc', ''),
+            'course': body.get('course', ''),
+            'term': body.get('term', ''),
+            'min_score': float(body.get('minScore', 0)),
+            'max_score': float(body.get('maxScore', 5)),
+        }
+    except (TypeError, ValueError):
+        return jsonify({'error': 'minScore and maxScore must be numbers'}), 400
+
+    # Identical requests against the same data share one job and one file
+    query, params = build_export_query(**filters)
+    key = (fmt, make_key(query, params), data_version(db_path))
+    job, _ = export_manager.submit(key, fmt, filters)
+
+    status = 200 if job.state == 'done' else 202
+    return jsonify(export_job_json(job)), status, {'Location': f"/api/exports/{job.id}"}
+
+
+@app.route('/api/exports/<job_id>', methods=['GET'])
+def get_export(job_id):
+    job = export_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired export'}), 404
+    return jsonify(export_job_json(job))
+
+
+@app.route('/api/exports/<job_id>/download', methods=['GET'])
+def download_export(job_id):
+    # Sent from a handle opened by the manager: the file can't be evicted until the response closes it
+    job, f = export_manager.open(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired export'}), 404
+    if f is None:
+        return jsonify(export_job_json(job)), 409
+
+    timestamp = datetime.fromtimestamp(job.finished_at).strftime("%Y%m%d_%H%M%S")
+    try:
+        response = send_file(
+            f,
+            mimetype='text/csv' if job.format == 'csv' else 'application/json',
+            as_attachment=True,
+            download_name=f"scores_{timestamp}.{FORMAT_EXTENSIONS[job.format]}",
+            last_modified=job.finished_at,
+        )
+    except Exception:
+        f.close()
+        raise
+    response.content_length = job.size
+    return response
+
+
+def serialize_ai_summaries(summaries):
+    return jsonify([{
+        'outcome_name': row['outcome_name'],
+        'outcome_id': row['outcome_id'],
+        'outcome_description': row['outcome_description'],
+        'strengths_text': row['strengths_text'],
+        'improvement_text': row['improvement_text'],
+        'last_updated': row['last_updated']
+    } for row in summaries]).get_data()
+
+
 @app.route('/api/ai-summaries', methods=['GET'])
 def get_ai_summaries():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     try:
-        cursor.execute('''
+        body = cached_query("ai_summaries", '''
             SELECT outcome_name, outcome_id, outcome_description,
                    strengths_text, improvement_text, last_updated
             FROM all_scores_ai_summaries
-        ''')
-        
-        summaries = cursor.fetchall()
-        return jsonify([{
-            'outcome_name': row['outcome_name'],
-            'outcome_id': row['outcome_id'],
-            'outcome_description': row['outcome_description'],
-            'strengths_text': row['strengths_text'],
-            'improvement_text': row['improvement_text'],
-            'last_updated': row['last_updated']
-        } for row in summaries])
+        ''', (), serialize_ai_summaries)
+        return Response(body, mimetype='application/json')
         
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         return jsonify([])
+
+
+# Set once here rather than from the summary workers, which would race on the module-level key
+openai.api_key = openai.api_key or os.environ.get("OPENAI_API_KEY")
+# Every on-demand generation in this process shares one quota, as ai-summary/main.py's workers do
+summary_limiter = RateLimiter(int(os.environ.get("OPENAI_RPM", 500)), int(os.environ.get("OPENAI_TPM", 60000)))
+
+
+def generate_summary(job, emit):
+    """Summarize the comments selected by `job.params` and store the result."""
+    params = job.params
+    if params['summarizer'] == 'openai' and not openai.api_key:
+        raise ValueError("OPENAI_API_KEY is not set; use summarizer=extractive for an offline summary")
+
+    conn = db_pool.acquire()
+    try:
+        comments, outcome_id, description = fetch_slice(conn.cursor(), params['outcome'], params['course'],
+                                                        params['term'])
     finally:
         conn.close()
 
+    # Each generation's requests land in ai_summary_usage next to the offline generator's runs
+    ledger = UsageLedger()
+    ledger.start_run(f"api-{job.id}")
+    try:
+        strengths, improvement, summary_hash = generate_slice(
+            openai, params['summarizer'], params['outcome'], description, comments, emit, limiter=summary_limiter,
+            ledger=ledger)
+    except Exception:
+        store_summary_usage(db_path, ledger.drain())
+        raise
+    store_slice_summary(db_path, params['outcome'], params['course'], params['term'], outcome_id, description,
+                        strengths, improvement, summary_hash, usage=ledger.drain())
+    return {'strengths_text': strengths, 'improvement_text': improvement, 'comments': len(comments)}
+
+
+# On-demand summaries run on their own workers; each open stream holds a request thread
+summary_manager = SummaryManager(
+    generate_summary,
+    workers=int(os.environ.get("SUMMARY_WORKERS", 2)),
+    ttl=float(os.environ.get("SUMMARY_JOB_TTL_SECONDS", 600)),
+)
+summary_streams = threading.BoundedSemaphore(int(os.environ.get("SUMMARY_MAX_STREAMS", 4)))
+
+
+def summary_params(source):
+    """The slice and summarizer a summary request asks for; raises ValueError if unusable."""
+    if not isinstance(source, dict):
+        raise ValueError("expected a JSON object")
+    for name in ('outcome', 'course', 'term', 'summarizer'):
+        if source.get(name) is not None and not isinstance(source.get(name), str):
+            raise ValueError(f"{name} must be a string")
+    params = {
+        'outcome': (source.get('outcome') or '').strip(),
+        'course': (source.get('course') or '').strip(),
+        'term': (source.get('term') or '').strip(),
+        'summarizer': source.get('summarizer') or os.environ.get("AI_SUMMARY_SUMMARIZER", "openai"),
+    }
+    if not params['outcome']:
+        raise ValueError("outcome is required")
+    if params['summarizer'] not in SUMMARIZERS:
+        raise ValueError(f"summarizer must be one of {', '.join(SUMMARIZERS)}")
+    return params
+
+
+def submit_summary(params):
+    # Identical requests for the same sync share one generation, whether it is running or done
+    key = (params['outcome'], params['course'], params['term'], params['summarizer'], current_sync_version())
+    job, _ = summary_manager.submit(key, params)
+    return job
+
+
+def summary_job_json(job):
+    data = job.to_dict()
+    data['status_url'] = f"/api/ai-summaries/jobs/{job.id}"
+    data['stream_url'] = f"/api/ai-summaries/jobs/{job.id}/stream"
+    return data
+
+
+SUMMARY_STREAM_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+def summary_stream_response(job):
+    if request.method == 'HEAD':
+        return Response(mimetype='text/event-stream', headers=SUMMARY_STREAM_HEADERS)
+    if not summary_streams.acquire(blocking=False):
+        return jsonify({'error': 'Too many summary streams open'}), 503, {'Retry-After': '10'}
+
+    response = Response(summary_manager.stream(job), mimetype='text/event-stream', headers=SUMMARY_STREAM_HEADERS)
+    # Released when the server closes the response, which it does even if the body was never read
+    response.call_on_close(summary_streams.release)
+    return response
+
+
+@app.route('/api/ai-summaries/jobs', methods=['POST'])
+def create_summary_job():
+    try:
+        params = summary_params(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    job = submit_summary(params)
+    status = 200 if job.state == 'done' else 202
+    return jsonify(summary_job_json(job)), status, {'Location': f"/api/ai-summaries/jobs/{job.id}"}
+
+
+@app.route('/api/ai-summaries/jobs/<job_id>', methods=['GET'])
+def get_summary_job(job_id):
+    job = summary_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired summary job'}), 404
+    return jsonify(summary_job_json(job))
+
+
+@app.route('/api/ai-summaries/jobs/<job_id>/stream', methods=['GET'])
+def stream_summary_job(job_id):
+    job = summary_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired summary job'}), 404
+    return summary_stream_response(job)
+
+
+@app.route('/api/ai-summaries/stream', methods=['GET'])
+def stream_summary():
+    # For EventSource, which can only GET: starts (or joins) the job and streams it in one request
+    try:
+        params = summary_params(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if request.method == 'HEAD':
+        # Answered without a job: a HEAD must not start a paid generation
+        return Response(mimetype='text/event-stream', headers=SUMMARY_STREAM_HEADERS)
+    return summary_stream_response(submit_summary(params))
+
 if __name__ == '__main__':
+    # Development server; see serve.py for the production entry point
+    logging.getLogger().setLevel(logging.DEBUG)
     app.run(debug=True, port=5001)
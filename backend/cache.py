@@ -0,0 +1,113 @@
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    from backend import metrics
+except ImportError:
+    import metrics
+
+
+def normalize_sql(sql):
+    """Collapse whitespace so formatting differences don't split cache entries."""
+    return " ".join(sql.split())
+
+
+def make_key(sql, params=()):
+    if isinstance(params, dict):
+        params = tuple(sorted(params.items()))
+    return normalize_sql(sql), tuple(params or ())
+
+
+def data_version(db_path):
+    """
+    Cheap fingerprint of the database contents: changes whenever the file is
+    rewritten, committed to or swapped for another file. None if it doesn't exist.
+    """
+    try:
+        st = os.stat(db_path)
+    except OSError:
+        return None
+    version = (st.st_ino, st.st_mtime_ns, st.st_size)
+    try:
+        wal = os.stat(db_path + "-wal")
+        version += (wal.st_mtime_ns, wal.st_size)
+    except OSError:
+        pass
+    return version
+
+
+class ResultCache:
+    """
+    Bounded LRU cache of serialized query results (bytes), keyed by normalized
+    SQL and parameters. Everything is dropped as soon as the data version moves.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._version = None
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+                metrics.RESULT_CACHE_INVALIDATIONS.inc()
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    def get(self, key, version):
+        with self._lock:
+            self._check_version(version)
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                metrics.RESULT_CACHE_REQUESTS.inc(result="miss")
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            metrics.RESULT_CACHE_REQUESTS.inc(result="hit")
+            return body
+
+    def put(self, key, version, body):
+        if len(body) > self.max_bytes:
+            return False
+        with self._lock:
+            self._check_version(version)
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = body
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+                metrics.RESULT_CACHE_EVICTIONS.inc()
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._version = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
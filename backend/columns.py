@@ -0,0 +1,79 @@
+import json
+import os
+import shutil
+import sqlite3
+
+try:
+    from backend.grades import ScoreArrays, load_score_arrays
+except ImportError:  # running as `python3 backend/main.py`
+    from grades import ScoreArrays, load_score_arrays
+
+# Columnar copies of the score facts, one directory per sync version (v<version>/),
+# with CURRENT naming the one that matches the published data.db
+COLUMNS_DIR = os.environ.get(
+    "SCORE_COLUMNS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "columns"),
+)
+CURRENT_FILE = "CURRENT"
+
+
+def write_columns(db_path, root, version):
+    """
+    Write the score facts of the database at `db_path` to root/v<version>/ as
+    .npy files and return that directory. Nothing is served from it until
+    activate_columns() is called.
+    """
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        arrays = load_score_arrays(conn.cursor())
+    finally:
+        conn.close()
+
+    directory = os.path.join(root, f"v{version}")
+    tmp_directory = directory + ".tmp"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    arrays.save(tmp_directory)
+    with open(os.path.join(tmp_directory, "manifest.json"), "w") as f:
+        json.dump({"version": version, "rows": len(arrays), "columns": list(ScoreArrays.COLUMNS)}, f)
+
+    # A failed sync can leave a directory for the same version behind
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_directory, directory)
+    return directory
+
+
+def activate_columns(root, version, keep=2):
+    """Point CURRENT at v<version> and delete all but the `keep` newest versions."""
+    tmp_path = os.path.join(root, f"{CURRENT_FILE}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        f.write(f"v{version}")
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+
+    versions = sorted(
+        (int(name[1:]) for name in os.listdir(root) if name.startswith("v") and name[1:].isdigit()),
+        reverse=True,
+    )
+    for old in versions[keep:]:
+        # Processes still mapping the files keep reading them; on Windows the delete may fail, which is fine
+        shutil.rmtree(os.path.join(root, f"v{old}"), ignore_errors=True)
+
+
+def open_columns(root, version):
+    """
+    Memory-map the current columnar snapshot, or return None if there isn't
+    one or it was written for a different sync version than `version`.
+    """
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            directory = os.path.join(root, f.read().strip())
+        with open(os.path.join(directory, "manifest.json")) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != version:
+        return None
+    try:
+        return ScoreArrays.load(directory, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,135 @@
+import json
+import queue
+import threading
+import time
+
+try:
+    from backend.cache import data_version
+    from backend.progress import read_status, status_mtime
+except ImportError:
+    from cache import data_version
+    from progress import read_status, status_mtime
+
+
+class TooManySubscribers(Exception):
+    """Raised when the server already holds its maximum number of open event streams."""
+
+
+def format_event(event, data):
+    """Encode one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class EventHub:
+    """
+    Watches the sync status file and the database's data version and fans out
+    changes to every open event stream.
+
+    A single background thread does the polling no matter how many clients are
+    connected; it runs only while at least one stream is open. `describe_version`
+    is called (on that thread) after the data version moves; "data-changed" is
+    sent, with its result as the payload, only when the sync version it reports
+    has advanced. Other writes to the database (AI summaries, the usage ledger)
+    move the data version too, but don't change what clients would refetch.
+    """
+    def __init__(self, db_path, status_path, describe_version, poll_interval=1.0,
+                 max_subscribers=16, queue_size=32):
+        self.db_path = db_path
+        self.status_path = status_path
+        self.describe_version = describe_version
+        self.poll_interval = poll_interval
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self):
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribers(f"{self.max_subscribers} event streams already open")
+            subscriber = queue.Queue(maxsize=self.queue_size)
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                # Take the baseline now so a change right after subscribing isn't missed
+                baseline = (status_mtime(self.status_path), data_version(self.db_path), self._sync_version())
+                self._thread = threading.Thread(target=self._poll, args=baseline, name="event-hub",
+                                                daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event, data):
+        message = format_event(event, data)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # A client that isn't reading just misses events; it resyncs on reconnect
+                pass
+
+    def _sync_version(self):
+        try:
+            return self.describe_version().get("version")
+        except Exception:
+            return None
+
+    def _poll(self, last_mtime, last_version, last_sync):
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+
+            mtime = status_mtime(self.status_path)
+            if mtime != last_mtime:
+                last_mtime = mtime
+                status = read_status(self.status_path)
+                if status is not None:
+                    self.publish("sync-progress", status)
+
+            version = data_version(self.db_path)
+            if version != last_version:
+                try:
+                    description = self.describe_version()
+                except Exception:
+                    continue  # try again on the next poll
+                last_version = version
+                if description.get("version") != last_sync:
+                    last_sync = description.get("version")
+                    self.publish("data-changed", description)
+
+    def stream(self, subscriber, initial=(), heartbeat=15.0, max_duration=300.0, retry_ms=5000):
+        """
+        Yield the text of an SSE response for one subscriber: the `initial`
+        (event, data) pairs first, then published events, with a comment line
+        every `heartbeat` seconds so proxies keep the connection open.
+        The stream ends after `max_duration` seconds; EventSource reconnects by
+        itself, which frees the worker thread now and then.
+        """
+        try:
+            yield f"retry: {int(retry_ms)}\n\n"
+            for event, data in initial:
+                yield format_event(event, data)
+
+            ends_at = time.monotonic() + max_duration
+            while True:
+                remaining = ends_at - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    yield subscriber.get(timeout=min(heartbeat, remaining))
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+        finally:
+            self.unsubscribe(subscriber)
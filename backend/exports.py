@@ -0,0 +1,222 @@
+import io
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from backend import metrics
+except ImportError:
+    import metrics
+
+logger = logging.getLogger(__name__)
+
+FORMAT_EXTENSIONS = {"csv": "csv", "json": "json"}
+
+
+class ExportJob:
+    """One requested export: its parameters, progress and, once done, the file it produced."""
+    def __init__(self, job_id, key, fmt, filters):
+        self.id = job_id
+        self.key = key
+        self.format = fmt
+        self.filters = filters
+        self.state = "queued"  # queued -> running -> done | failed
+        self.rows_written = 0
+        self.total_rows = None
+        self.error = None
+        self.path = None
+        self.size = 0
+        self.downloads = 0  # open downloads of the file; it isn't evicted while any are
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "state": self.state,
+            "format": self.format,
+            "filters": self.filters,
+            "rows_written": self.rows_written,
+            "total_rows": self.total_rows,
+            "size": self.size,
+            "error": self.error,
+        }
+
+
+class _PinnedFile(io.FileIO):
+    """A file opened for reading that calls `on_close()` once it is closed."""
+    def __init__(self, path, on_close):
+        super().__init__(path, "rb")
+        self._on_close = on_close
+
+    def close(self):
+        if not self.closed:
+            super().close()
+            self._on_close()
+
+
+class ExportManager:
+    """
+    Runs exports on a small pool of background threads and keeps the finished
+    files in `directory`.
+
+    `run(job, f)` writes the export for `job` to the open text file `f`,
+    calling `progress(job, rows_written, total_rows)` as it goes. A job
+    submitted with the same key as a queued, running or finished job is answered
+    by that job instead of exporting again; callers put the data version in the
+    key so a sync makes old files unreachable. Finished files are deleted `ttl`
+    seconds after they were written, and the oldest ones earlier if the
+    directory would otherwise grow beyond `max_bytes`, but never while a
+    download of them (see open()) is still being served.
+    """
+    def __init__(self, directory, run, workers=2, max_bytes=512 * 1024 * 1024, ttl=3600.0,
+                 on_progress=None):
+        self.directory = directory
+        self.run = run
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.on_progress = on_progress
+        self._jobs = {}
+        self._by_key = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export")
+        self._directory_ready = False
+
+    def _prepare_directory(self):
+        # Caller holds self._lock. Jobs only live in memory, so files left by a
+        # previous process can never be downloaded; clear them out on first use
+        if self._directory_ready:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if name.startswith("export-"):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+        self._directory_ready = True
+
+    def submit(self, key, fmt, filters):
+        """Return (job, created): an existing job for `key` if there is one, else a newly queued job."""
+        if fmt not in FORMAT_EXTENSIONS:
+            raise ValueError(f"Unsupported export format: {fmt}")
+        with self._lock:
+            self._prepare_directory()
+            self._evict()
+            job = self._by_key.get(key)
+            if job is not None and job.state != "failed":
+                metrics.EXPORT_JOBS.inc(result="deduplicated")
+                return job, False
+            job = ExportJob(uuid.uuid4().hex, key, fmt, filters)
+            self._jobs[job.id] = job
+            self._by_key[key] = job
+        metrics.EXPORT_JOBS.inc(result="submitted")
+        self._executor.submit(self._run, job)
+        return job, True
+
+    def get(self, job_id):
+        with self._lock:
+            self._evict()
+            return self._jobs.get(job_id)
+
+    def open(self, job_id):
+        """
+        Return (job, file): the job as get() would, and for a finished job its
+        file opened for reading (None otherwise). The file isn't evicted until
+        that handle is closed, so a download can't lose it halfway through.
+        """
+        with self._lock:
+            self._evict()
+            job = self._jobs.get(job_id)
+            if job is None or job.state != "done":
+                return job, None
+            f = _PinnedFile(job.path, lambda: self._unpin(job))
+            job.downloads += 1
+            return job, f
+
+    def _unpin(self, job):
+        with self._lock:
+            job.downloads -= 1
+            self._evict()
+
+    def progress(self, job, rows_written, total_rows=None):
+        job.rows_written = rows_written
+        if total_rows is not None:
+            job.total_rows = total_rows
+        self._notify(job)
+
+    def _notify(self, job):
+        if self.on_progress is not None:
+            try:
+                self.on_progress(job)
+            except Exception:
+                logger.exception("Export progress callback failed")
+
+    def _run(self, job):
+        job.state = "running"
+        self._notify(job)
+        path = os.path.join(self.directory, f"export-{job.id}.{FORMAT_EXTENSIONS[job.format]}")
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+                self.run(job, f)
+            os.replace(tmp_path, path)
+            job.path = path
+            job.size = os.path.getsize(path)
+            state = "done"
+        except Exception as e:
+            logger.exception("Export %s failed", job.id)
+            job.error = str(e)
+            state = "failed"
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        # finished_at first: eviction on other threads relies on it for every done job
+        job.finished_at = time.time()
+        job.state = state
+        metrics.EXPORT_JOBS.inc(result=job.state)
+        with self._lock:
+            self._evict()
+        self._notify(job)
+
+    def _drop(self, job):
+        del self._jobs[job.id]
+        if self._by_key.get(job.key) is job:
+            del self._by_key[job.key]
+        if job.path is not None:
+            try:
+                os.remove(job.path)
+            except OSError:
+                pass
+
+    def _evict(self):
+        # Caller holds self._lock
+        now = time.time()
+        for job in list(self._jobs.values()):
+            if job.finished_at is not None and now - job.finished_at > self.ttl and not job.downloads:
+                self._drop(job)
+
+        finished = sorted((job for job in self._jobs.values() if job.state == "done"),
+                          key=lambda job: job.finished_at)
+        total = sum(job.size for job in finished)
+        for job in finished:
+            if total <= self.max_bytes:
+                break
+            if not job.downloads:
+                total -= job.size
+                self._drop(job)
+
+    def stats(self):
+        with self._lock:
+            states = [job.state for job in self._jobs.values()]
+            return {
+                "jobs": len(states),
+                "running": states.count("running"),
+                "queued": states.count("queued"),
+                "bytes": sum(job.size for job in self._jobs.values() if job.state == "done"),
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,487 @@
+import functools
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+
+try:
+    from backend.queries import run_query
+except ImportError:  # running as `python3 backend/grades.py`
+    from queries import run_query
+
+# Every row of all_scores; a missing score is NaN and doesn't count towards a grade
+SCORE_FACTS_QUERY = '''
+    SELECT assessment_id, score, weight, outcome_name, course_code, course_title, term_title
+    FROM all_scores
+'''
+
+# Groupings the engine computes; 'hc' and 'lo' both group by outcome name
+GROUPINGS = ('hc', 'lo', 'course', 'term')
+
+
+def parse_weight(weight):
+    """'8x' -> 8.0. Class scores (and anything unparseable) count once."""
+    if weight is None:
+        return 1.0
+    try:
+        return float(str(weight).replace('x', ''))
+    except ValueError:
+        return 1.0
+
+
+def edit_weight(number, weight):
+    """The weight a simulated edit asks for, like parse_weight() but refusing anything not above 0."""
+    if isinstance(weight, bool) or not isinstance(weight, (int, float, str)):
+        raise ValueError(f"Scenario {number}: weight must be a number or a string like '8x'")
+    try:
+        value = float(str(weight).replace('x', ''))
+    except ValueError:
+        raise ValueError(f"Scenario {number}: weight must be a number or a string like '8x'")
+    if not 0 < value < float('inf'):
+        raise ValueError(f"Scenario {number}: weight must be greater than 0")
+    return value
+
+
+def _encode(values):
+    """Dictionary-encode a column: (sorted distinct labels, int32 code per row)."""
+    labels, codes = np.unique(np.array([value or '' for value in values], dtype=str), return_inverse=True)
+    return labels, codes.astype(np.int32)
+
+
+class ScoreArrays:
+    """
+    The score facts as contiguous columns: int64 `assessment_id`, float64
+    `score` (NaN where there is none) and `weight`, and int32 codes into the `outcomes`, `courses` and
+    `terms` label arrays. save() writes one .npy file per column; load() can
+    memory-map them, in which case `mapped` is True.
+    """
+    COLUMNS = ('assessment_id', 'score', 'weight', 'outcome', 'course', 'term', 'outcomes', 'courses', 'terms', 'course_titles')
+
+    def __init__(self, assessment_id, score, weight, outcome, course, term, outcomes, courses, terms,
+                 course_titles, mapped=False):
+        self.assessment_id = assessment_id
+        self.score = score
+        self.weight = weight
+        self.outcome = outcome
+        self.course = course
+        self.term = term
+        self.outcomes = outcomes
+        self.courses = courses
+        self.terms = terms
+        self.course_titles = course_titles
+        self.mapped = mapped
+        # HCs are named like '#hc'; LO names contain the course code and a hyphen
+        self.outcome_is_hc = np.array(['-' not in name for name in outcomes], dtype=bool)
+
+    @classmethod
+    def from_rows(cls, rows):
+        rows = list(rows)
+        assessment_id = np.array([row['assessment_id'] for row in rows], dtype=np.int64)
+        score = np.array([row['score'] for row in rows], dtype=np.float64)  # None -> NaN
+        weight = np.array([parse_weight(row['weight']) for row in rows], dtype=np.float64)
+        outcomes, outcome = _encode(row['outcome_name'] for row in rows)
+        courses, course = _encode(row['course_code'] for row in rows)
+        terms, term = _encode(row['term_title'] for row in rows)
+        titles = {row['course_code'] or '': row['course_title'] or '' for row in rows}
+        course_titles = np.array([titles[code] for code in courses], dtype=str)
+        return cls(assessment_id, score, weight, outcome, course, term, outcomes, courses, terms, course_titles)
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for column in self.COLUMNS:
+            np.save(os.path.join(directory, f"{column}.npy"), getattr(self, column), allow_pickle=False)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        # asarray() turns each np.memmap into a plain ndarray over the same mapping,
+        # which skips the memmap subclass overhead on every operation
+        columns = {column: np.asarray(np.load(os.path.join(directory, f"{column}.npy"), mmap_mode=mmap_mode,
+                                              allow_pickle=False))
+                   for column in cls.COLUMNS}
+        return cls(**columns, mapped=mmap_mode is not None)
+
+    def __len__(self):
+        return len(self.score)
+
+    @functools.cached_property
+    def scored(self):
+        return ~np.isnan(self.score)
+
+    @functools.cached_property
+    def score_or_zero(self):
+        """Scores with missing ones counted as 0, as score_cube does."""
+        return np.nan_to_num(self.score)
+
+    def selection_masks(self, hcs=(), courses=(), terms=()):
+        """Row mask per filter panel facet that has a selection."""
+        masks = {}
+        for facet, codes, labels, selected in (('hc', self.outcome, self.outcomes, hcs),
+                                               ('course', self.course, self.courses, courses),
+                                               ('term', self.term, self.terms, terms)):
+            if selected:
+                masks[facet] = np.isin(codes, np.flatnonzero(np.isin(labels, list(selected))))
+        return masks
+
+    @staticmethod
+    def score_mask(score, min_score=0, max_score=5):
+        """Row mask for the score range, or None if it doesn't exclude anything."""
+        keep = None
+        if min_score > 0:
+            keep = score >= min_score
+        if max_score < 5:
+            keep = score <= max_score if keep is None else keep & (score <= max_score)
+        return keep
+
+    def mask(self, hcs=(), courses=(), terms=(), min_score=0, max_score=5):
+        """Boolean mask of the scored rows in the filter panel's selection (same meaning as CubeFilters)."""
+        keep = self.scored
+        for selected in [self.score_mask(self.score, min_score, max_score),
+                         *self.selection_masks(hcs, courses, terms).values()]:
+            if selected is not None:
+                keep = keep & selected
+        return keep
+
+
+def row_terms(score, weight):
+    """Per-row values whose per-group sums (with the row count) are all the grade stats need."""
+    weighted = weight * score
+    return {
+        'weight_sum': weight,
+        'score_sum': score,
+        'weighted_sum': weighted,
+        'weighted_square_sum': weighted * score,
+    }
+
+
+def group_sums(codes, n_groups, terms):
+    """Sum each of `terms` per group in one np.bincount pass each, plus the row count."""
+    sums = {name: np.bincount(codes, weights=values, minlength=n_groups) for name, values in terms.items()}
+    sums['count'] = np.bincount(codes, minlength=n_groups)
+    return sums
+
+
+def stats_from_sums(sums):
+    """Count, mean, weighted mean and weighted variance from group sums. Empty groups get NaN stats."""
+    count = sums['count']
+    weight_sum = sums['weight_sum']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = sums['score_sum'] / count
+        weighted_mean = sums['weighted_sum'] / weight_sum
+        variance = np.maximum(sums['weighted_square_sum'] / weight_sum - weighted_mean ** 2, 0.0)
+    return {
+        'count': count,
+        'weight_sum': weight_sum,
+        'mean': mean,
+        'weighted_mean': weighted_mean,
+        'variance': variance,
+    }
+
+
+def group_stats(codes, n_groups, score, weight):
+    """Count, mean, weighted mean and weighted variance of `score` per group."""
+    return stats_from_sums(group_sums(codes, n_groups, row_terms(score, weight)))
+
+
+def _number(value):
+    return None if np.isnan(value) else float(value)
+
+
+class GradeEngine:
+    """Weighted grades per HC, LO, course and term, computed from ScoreArrays."""
+    def __init__(self, arrays):
+        self.arrays = arrays
+
+    def grades(self, groupings=GROUPINGS, **filters):
+        """
+        Return {'total': {...}, grouping: [{...}, ...]} for each requested
+        grouping, under the filter panel's selection. Groups with no rows
+        after filtering are left out.
+        """
+        a = self.arrays
+        keep = a.mask(**filters)
+        score, weight = a.score[keep], a.weight[keep]
+
+        terms = row_terms(score, weight)
+        totals = {name: np.array([values.sum()]) for name, values in terms.items()}
+        totals['count'] = np.array([len(score)])
+        result = {'total': self._total(stats_from_sums(totals))}
+
+        outcome_stats = None
+        for grouping in groupings:
+            if grouping in ('hc', 'lo'):
+                # One group-by over all outcomes serves both; HCs and LOs are split afterwards
+                if outcome_stats is None:
+                    outcome_stats = stats_from_sums(group_sums(a.outcome[keep], len(a.outcomes), terms))
+                include = a.outcome_is_hc if grouping == 'hc' else ~a.outcome_is_hc
+                result[grouping] = self._groups(outcome_stats, include, outcome_name=a.outcomes)
+            elif grouping == 'course':
+                stats = stats_from_sums(group_sums(a.course[keep], len(a.courses), terms))
+                result[grouping] = self._groups(stats, course_code=a.courses, course_title=a.course_titles)
+            elif grouping == 'term':
+                stats = stats_from_sums(group_sums(a.term[keep], len(a.terms), terms))
+                result[grouping] = self._groups(stats, term_title=a.terms)
+            else:
+                raise ValueError(f"Unknown grouping: {grouping}")
+        return result
+
+    def facet_rows(self, hcs=(), courses=(), terms=(), min_score=0, max_score=5):
+        """
+        The rows build_facets_query() would return, computed from the arrays:
+        per facet value the count and score sum under every filter but that
+        facet's own, then a 'total' row. As in score_cube, a missing score counts as 0.
+        """
+        a = self.arrays
+        score = a.score_or_zero
+        masks = a.selection_masks(hcs, courses, terms)
+        score_keep = a.score_mask(score, min_score, max_score)
+        if score_keep is not None:
+            masks['score'] = score_keep
+
+        def combined(excluding=None):
+            keep = None
+            for facet, selected in masks.items():
+                if facet != excluding:
+                    keep = selected if keep is None else keep & selected
+            return keep
+
+        rows = []
+        for facet, codes, labels, titles in (('hc', a.outcome, a.outcomes, None),
+                                             ('course', a.course, a.courses, a.course_titles),
+                                             ('term', a.term, a.terms, None)):
+            keep = combined(excluding=facet)
+            if keep is None:
+                count = np.bincount(codes, minlength=len(labels))
+                score_sum = np.bincount(codes, weights=score, minlength=len(labels))
+            else:
+                count = np.bincount(codes[keep], minlength=len(labels))
+                score_sum = np.bincount(codes[keep], weights=score[keep], minlength=len(labels))
+            for i, value in enumerate(labels):
+                if value == '':
+                    continue  # NULL in the database
+                rows.append({
+                    'facet': facet,
+                    'value': str(value),
+                    'label': str(titles[i]) if titles is not None else None,
+                    'count': int(count[i]),
+                    'score_sum': float(score_sum[i]) if count[i] else None,
+                })
+
+        keep = combined()
+        total = score if keep is None else score[keep]
+        rows.append({'facet': 'total', 'value': None, 'label': None, 'count': len(total),
+                     'score_sum': float(total.sum()) if len(total) else None})
+        return rows
+
+    @functools.cached_property
+    def base_sums(self):
+        """Per-outcome and per-course sums over every scored row; the starting point of every simulation."""
+        a = self.arrays
+        keep = a.scored
+        terms = row_terms(a.score[keep], a.weight[keep])
+        return {
+            'outcome': group_sums(a.outcome[keep], len(a.outcomes), terms),
+            'course': group_sums(a.course[keep], len(a.courses), terms),
+        }
+
+    @functools.cached_property
+    def _indexes(self):
+        a = self.arrays
+        return {
+            'outcome': {str(name): i for i, name in enumerate(a.outcomes) if name},
+            'course': {str(code): i for i, code in enumerate(a.courses) if code},
+            'assessment': {int(assessment_id): row for row, assessment_id in enumerate(a.assessment_id)},
+        }
+
+    def _scenario_edits(self, scenarios):
+        """
+        Flatten the scenarios into parallel lists of (scenario, outcome, course,
+        score, weight, sign): a new score adds one +1 entry, a changed one
+        takes the existing score back out (-1) and adds the new one (+1).
+        """
+        a = self.arrays
+        indexes = self._indexes
+        edits = []
+        for number, scenario in enumerate(scenarios):
+            for edit in scenario:
+                score = edit.get('score')
+                if isinstance(score, bool) or not isinstance(score, (int, float)) or not 0 <= score <= 5:
+                    raise ValueError(f"Scenario {number}: score must be a number from 0 to 5")
+
+                if edit.get('assessment_id') is not None:
+                    assessment_id = edit['assessment_id']
+                    if isinstance(assessment_id, bool) or not isinstance(assessment_id, int):
+                        raise ValueError(f"Scenario {number}: assessment_id must be an integer")
+                    row = indexes['assessment'].get(assessment_id)
+                    if row is None:
+                        raise ValueError(f"Scenario {number}: unknown assessment_id {assessment_id}")
+                    outcome, course = a.outcome[row], a.course[row]
+                    weight = edit_weight(number, edit['weight']) if 'weight' in edit else a.weight[row]
+                    if not np.isnan(a.score[row]):
+                        edits.append((number, outcome, course, a.score[row], a.weight[row], -1.0))
+                else:
+                    if not isinstance(edit.get('outcome'), str) or not isinstance(edit.get('course'), str):
+                        raise ValueError(f"Scenario {number}: new scores need an outcome and course name")
+                    outcome = indexes['outcome'].get(edit['outcome'])
+                    course = indexes['course'].get(edit['course'])
+                    if outcome is None or course is None:
+                        raise ValueError(f"Scenario {number}: new scores need a known outcome and course "
+                                         f"(got {edit['outcome']!r}, {edit['course']!r})")
+                    weight = edit_weight(number, edit['weight']) if edit.get('weight') is not None else 1.0
+                edits.append((number, outcome, course, float(score), weight, 1.0))
+        return edits
+
+    def simulate(self, scenarios):
+        """
+        Project HC, LO and course grades for each scenario, a list of edits:
+        {'outcome', 'course', 'score', 'weight'} adds a score and
+        {'assessment_id', 'score'[, 'weight']} changes an existing one.
+        Every scenario starts from the cached base sums, and all of them are
+        applied in one np.bincount per statistic over (scenario, group), so
+        the cost grows with the number of edits rather than of assessments.
+        Only groups a scenario touches are returned, with their stats before and after.
+        """
+        a = self.arrays
+        n_scenarios = len(scenarios)
+        results = [{'hc': [], 'lo': [], 'course': []} for _ in range(n_scenarios)]
+        edits = self._scenario_edits(scenarios)
+        if not edits:
+            return results
+
+        scenario, outcome, course, score, weight, sign = (np.array(column) for column in zip(*edits))
+        terms = {name: values * sign for name, values in row_terms(score, weight).items()}
+
+        for grouping, codes, n_groups in (('outcome', outcome, len(a.outcomes)), ('course', course, len(a.courses))):
+            flat = scenario * n_groups + codes
+            base = self.base_sums[grouping]
+            projected = {
+                name: base[name] + np.bincount(flat, weights=values, minlength=n_scenarios * n_groups)
+                .reshape(n_scenarios, n_groups)
+                for name, values in terms.items()
+            }
+            projected['count'] = base['count'] + np.rint(
+                np.bincount(flat, weights=sign, minlength=n_scenarios * n_groups)
+            ).astype(np.int64).reshape(n_scenarios, n_groups)
+            before, after = stats_from_sums(base), stats_from_sums(projected)
+
+            touched = np.bincount(flat, minlength=n_scenarios * n_groups).reshape(n_scenarios, n_groups) > 0
+            numbers, groups = np.nonzero(touched)
+            items = zip(numbers.tolist(), groups.tolist(),
+                        self._stats_list(before, groups), self._stats_list(after, (numbers, groups)))
+            for number, group, stats_before, stats_after in items:
+                if grouping == 'course':
+                    results[number]['course'].append({
+                        'course_code': str(a.courses[group]), 'course_title': str(a.course_titles[group]),
+                        'before': stats_before, 'after': stats_after,
+                    })
+                else:
+                    results[number]['hc' if a.outcome_is_hc[group] else 'lo'].append({
+                        'outcome_name': str(a.outcomes[group]), 'before': stats_before, 'after': stats_after,
+                    })
+        return results
+
+    @staticmethod
+    def _stats_list(stats, index):
+        """The stats at `index` as a list of plain dicts, converted in bulk (NaN -> None)."""
+        def numbers(name):
+            return [None if value != value else value for value in stats[name][index].tolist()]
+        return [
+            {'count': count, 'mean': mean, 'weighted_mean': weighted_mean, 'variance': variance}
+            for count, mean, weighted_mean, variance in zip(
+                stats['count'][index].tolist(), numbers('mean'), numbers('weighted_mean'), numbers('variance'))
+        ]
+
+    @staticmethod
+    def _total(stats):
+        return {key: _number(values[0]) if key != 'count' else int(values[0]) for key, values in stats.items()}
+
+    @staticmethod
+    def _groups(stats, include=None, **labels):
+        return [
+            {
+                **{name: str(values[i]) for name, values in labels.items()},
+                'count': int(stats['count'][i]),
+                'weight_sum': float(stats['weight_sum'][i]),
+                'mean': float(stats['mean'][i]),
+                'weighted_mean': _number(stats['weighted_mean'][i]),
+                'variance': _number(stats['variance'][i]),
+            }
+            for i in np.flatnonzero(stats['count'] > 0 if include is None else (stats['count'] > 0) & include)
+        ]
+
+
+class EngineCache:
+    """
+    Holds one GradeEngine per data version: the first request after a sync
+    reloads the arrays, concurrent ones wait for that load instead of repeating it.
+    """
+    def __init__(self, load):
+        self.load = load
+        self._lock = threading.Lock()
+        self._version = None
+        self._engine = None
+
+    def get(self, version):
+        with self._lock:
+            if self._engine is None or version != self._version:
+                self._engine = GradeEngine(self.load())
+                self._version = version
+            return self._engine
+
+
+def load_score_arrays(cursor):
+    return ScoreArrays.from_rows(run_query(cursor, "score_facts", SCORE_FACTS_QUERY))
+
+
+# The same group-by in SQL, for comparison with the engine (see __main__ below and the tests)
+SQL_GROUP_STATS = '''
+    SELECT {column} AS value,
+           COUNT(*) AS count,
+           SUM(w) AS weight_sum,
+           AVG(score) AS mean,
+           SUM(w * score) / SUM(w) AS weighted_mean,
+           MAX(SUM(w * score * score) / SUM(w) - (SUM(w * score) / SUM(w)) * (SUM(w * score) / SUM(w)), 0)
+               AS variance
+    FROM (
+        SELECT *, CASE WHEN weight IS NULL THEN 1.0
+                       ELSE CAST(REPLACE(CAST(weight AS TEXT), 'x', '') AS REAL) END AS w
+        FROM all_scores
+        WHERE score IS NOT NULL
+    )
+    GROUP BY {column}
+'''
+
+
+def benchmark(db_path, repeat=5):
+    """Time the SQL group-bys against loading the arrays once and running the engine."""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        cursor = conn.cursor()
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for column in ('outcome_name', 'course_code', 'term_title'):
+                cursor.execute(SQL_GROUP_STATS.format(column=column)).fetchall()
+        sql_ms = (time.perf_counter() - started) * 1000 / repeat
+
+        started = time.perf_counter()
+        engine = GradeEngine(load_score_arrays(cursor))
+        load_ms = (time.perf_counter() - started) * 1000
+    finally:
+        conn.close()
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        engine.grades()
+    engine_ms = (time.perf_counter() - started) * 1000 / repeat
+
+    print(f"{len(engine.arrays)} scores")
+    print(f"SQL group-bys:      {sql_ms:8.2f} ms per request")
+    print(f"NumPy engine:       {engine_ms:8.2f} ms per request (after a one-off {load_ms:.2f} ms load)")
+
+
+if __name__ == "__main__":
+    benchmark(sys.argv[1] if len(sys.argv) > 1 else "backend/data.db")
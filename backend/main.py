@@ -4,6 +4,25 @@ import os
 import json
 from dotenv import load_dotenv
 
+try:
+    from backend.snapshot import (
+        begin_snapshot, validate_snapshot, publish_snapshot, discard_snapshot,
+        count_rows, summarize_changes, count_pending_changes, record_sync_run,
+    )
+    from backend.progress import SyncProgress
+    from backend.columns import COLUMNS_DIR, write_columns, activate_columns
+except ImportError:  # running as `python3 backend/main.py`
+    from snapshot import (
+        begin_snapshot, validate_snapshot, publish_snapshot, discard_snapshot,
+        count_rows, summarize_changes, count_pending_changes, record_sync_run,
+    )
+    from progress import SyncProgress
+    from columns import COLUMNS_DIR, write_columns, activate_columns
+
+# Most of the stored outcome assessments a sync may remove for being missing from Forum's
+# response, unless SYNC_PRUNE_MAX_FRACTION says otherwise
+PRUNE_MAX_FRACTION = 0.1
+
 # Load environment variables from .env
 def load_env_variables():
     load_dotenv()
@@ -71,14 +90,62 @@ def insert_outcome_assessments(cursor, outcome_data):
         user_id = outcome.get("target-user-id")
         class_id = outcome.get("klass-id")
 
+        # Without an id the row can't be matched up with later syncs
+        if assessment_id is None:
+            continue
+
+        # Only rows whose data actually changed are updated, so score_changes
+        # (see schema.sql) records real changes only
         cursor.execute("""
-        INSERT OR IGNORE INTO outcome_assessments 
+        INSERT INTO outcome_assessments 
         (assessment_id, assignment_id, comment, created_on, graded_blindly, grader_user_id, outcome_id, score, type, assignment_group_id, user_id, class_id)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (assessment_id) DO UPDATE SET
+            assignment_id = excluded.assignment_id, comment = excluded.comment, created_on = excluded.created_on,
+            graded_blindly = excluded.graded_blindly, grader_user_id = excluded.grader_user_id,
+            outcome_id = excluded.outcome_id, score = excluded.score, type = excluded.type,
+            assignment_group_id = excluded.assignment_group_id, user_id = excluded.user_id,
+            class_id = excluded.class_id, updated_on = CURRENT_TIMESTAMP
+        WHERE assignment_id IS NOT excluded.assignment_id OR comment IS NOT excluded.comment
+            OR created_on IS NOT excluded.created_on OR graded_blindly IS NOT excluded.graded_blindly
+            OR grader_user_id IS NOT excluded.grader_user_id OR outcome_id IS NOT excluded.outcome_id
+            OR score IS NOT excluded.score OR type IS NOT excluded.type
+            OR assignment_group_id IS NOT excluded.assignment_group_id OR user_id IS NOT excluded.user_id
+            OR class_id IS NOT excluded.class_id
         """, (assessment_id, assignment_id, comment, created_on, graded_blindly, grader_user_id, outcome_id, score, outcome_type, assignment_group_id, user_id, class_id))
 
     print("✅ Outcome assessment data inserted.")
 
+# Remove assessments Forum no longer returns (e.g. grades that were withdrawn)
+def prune_outcome_assessments(cursor, outcome_data, max_fraction=None):
+    if max_fraction is None:
+        max_fraction = float(os.getenv("SYNC_PRUNE_MAX_FRACTION", PRUNE_MAX_FRACTION))
+    fetched_ids = [(outcome.get("id"),) for outcome in outcome_data if outcome.get("id") is not None]
+    if not fetched_ids:
+        return 0  # never wipe the table because of an empty response
+
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS fetched_assessments (assessment_id INTEGER PRIMARY KEY)")
+    cursor.execute("DELETE FROM fetched_assessments")
+    cursor.executemany("INSERT OR IGNORE INTO fetched_assessments (assessment_id) VALUES (?)", fetched_ids)
+    stale = cursor.execute("""
+        SELECT COUNT(*) FROM outcome_assessments
+        WHERE assessment_id NOT IN (SELECT assessment_id FROM fetched_assessments)
+    """).fetchone()[0]
+    total = cursor.execute("SELECT COUNT(*) FROM outcome_assessments").fetchone()[0]
+    # A truncated or partial response looks just like a mass withdrawal, so that many are kept
+    if stale > max_fraction * total:
+        print(f"⚠️ Not removing {stale} of {total} outcome assessments missing from Forum's response: more than "
+              f"{max_fraction:.0%} would go. Set SYNC_PRUNE_MAX_FRACTION to allow it.")
+        return 0
+
+    cursor.execute("""
+        DELETE FROM outcome_assessments
+        WHERE assessment_id NOT IN (SELECT assessment_id FROM fetched_assessments)
+    """)
+    if cursor.rowcount:
+        print(f"✅ Removed {cursor.rowcount} outcome assessments no longer on Forum.")
+    return cursor.rowcount
+
 # Insert courses into the database
 def insert_courses(cursor, lo_trees):
     for lo_tree in lo_trees:
@@ -91,9 +158,17 @@ def insert_courses(cursor, lo_trees):
             course_state = course_info.get("state")
             course_college = course_info.get("college")
                 
+            # Changed courses are updated so renames reach the API; score_changes marks their assessments
             cursor.execute("""
-            INSERT OR IGNORE INTO courses (course_id, course_title, course_code, college_id, term_id, state)
+            INSERT INTO courses (course_id, course_title, course_code, college_id, term_id, state)
             VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (course_id) DO UPDATE SET
+                course_title = excluded.course_title, course_code = excluded.course_code,
+                college_id = excluded.college_id, term_id = excluded.term_id, state = excluded.state,
+                updated_on = CURRENT_TIMESTAMP
+            WHERE course_title IS NOT excluded.course_title OR course_code IS NOT excluded.course_code
+                OR college_id IS NOT excluded.college_id OR term_id IS NOT excluded.term_id
+                OR state IS NOT excluded.state
             """, (course_id, course_title, course_code, course_college, course_term, course_state))
 
     print("✅ Courses data inserted.")
@@ -159,9 +234,17 @@ def insert_assignment_data(cursor, assignment_data):
         if isinstance(makeup_assignment, dict):
             makeup_assignment = json.dumps(makeup_assignment)
 
+        # As with courses, a changed assignment is updated and score_changes marks its assessments
         cursor.execute("""
-        INSERT OR IGNORE INTO assignments_data (assignment_id, section_id, section_title, assignment_title, weight, makeup_assignment)
+        INSERT INTO assignments_data (assignment_id, section_id, section_title, assignment_title, weight, makeup_assignment)
         VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (assignment_id) DO UPDATE SET
+            section_id = excluded.section_id, section_title = excluded.section_title,
+            assignment_title = excluded.assignment_title, weight = excluded.weight,
+            makeup_assignment = excluded.makeup_assignment, updated_on = CURRENT_TIMESTAMP
+        WHERE section_id IS NOT excluded.section_id OR section_title IS NOT excluded.section_title
+            OR assignment_title IS NOT excluded.assignment_title OR weight IS NOT excluded.weight
+            OR makeup_assignment IS NOT excluded.makeup_assignment
         """, (assignment_id, section_id, section_title, assignment_title, weight, makeup_assignment))
 
         return True
@@ -181,7 +264,7 @@ def get_assignment_ids(db_name):
     return assignment_ids
 
 # Process assignment data for each assignment ID
-def process_assignments(BASE_URL, headers, db_name, assignment_ids):
+def process_assignments(BASE_URL, headers, db_name, assignment_ids, progress=None):
     conn = sqlite3.connect(db_name)
     cursor = conn.cursor()
     assignments_added = 0  # Counter for successfully inserted assignments
@@ -204,6 +287,8 @@ def process_assignments(BASE_URL, headers, db_name, assignment_ids):
 
         if idx % 15 == 0:
             print(f"🔄 Processed {idx}/{len(assignment_ids)} assignment scores...")
+            if progress is not None:
+                progress.update("assignments", "Fetching assignment details", idx, len(assignment_ids))
 
     conn.commit()
     conn.close()
@@ -269,7 +354,7 @@ def insert_course_scores_per_term(BASE_URL, headers, db_path):
     print("✅ Completed storing course scores")
 
 def create_views(db_path, sql_file):
-    """Executes the SQL script to create the two views."""
+    """Executes the SQL script to create the views and the score_cube summary table."""
     with sqlite3.connect(db_path) as conn:
         cursor = conn.cursor()
         with open(sql_file, "r") as f:
@@ -277,44 +362,20 @@ def create_views(db_path, sql_file):
         cursor.executescript(sql_script)
         print("✅ Scores tables created successfully!")
 
-# Main function to tie everything together
-def main():
-    # Load environment variables
-    CSRF_TOKEN, SESSION_ID, BASE_URL = load_env_variables()
-    
-    # Set up headers for API requests
-    headers = get_headers(CSRF_TOKEN, SESSION_ID)
-    
-    # Get the directory of the current script
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    # Initialize the database
-    # Absolute paths for DB and schema files
-    DB_NAME = os.path.join(script_dir, "data.db")
-    SCHEMA_FILE = os.path.join(script_dir, "schema.sql")
+# Ingest the fetched data into the snapshot database at DB_NAME
+def build_snapshot(BASE_URL, headers, DB_NAME, SCHEMA_FILE, VIEWS_FILE, lo_trees, terms, outcomes, colleges,
+                   progress=None):
+    if progress is None:
+        progress = SyncProgress(path=None)  # not reporting progress
     initialize_database(DB_NAME, SCHEMA_FILE)
-    
-    # Fetch data from APIs and handle errors
-    lo_trees = fetch_data_from_api(f"{BASE_URL}lo-trees", headers)
-    assert_data_fetched("lo-trees", lo_trees)
+    progress.update("ingesting", "Storing outcome assessments and courses")
 
-    terms = fetch_data_from_api(f"{BASE_URL}terms", headers)
-    assert_data_fetched("terms", terms)
-
-    outcomes = fetch_data_from_api(f"{BASE_URL}outcome-assessments", headers)
-    assert_data_fetched("outcome-assessments", outcomes)
-
-    colleges = fetch_data_from_api(f"{BASE_URL}colleges", headers)
-    assert_data_fetched("colleges", colleges)
-
-    if not lo_trees or not terms or not outcomes or not colleges:
-        print("❌ No data returned from the API.")
-        return  # Exit if no data is returned from the API
-    
     # Insert data into the database
     conn = sqlite3.connect(DB_NAME)
     cursor = conn.cursor()
 
     insert_outcome_assessments(cursor, outcomes)
+    prune_outcome_assessments(cursor, outcomes)
     insert_courses(cursor, lo_trees)
 
     # Commit and close so the scores function can re-open fresh
@@ -322,6 +383,7 @@ def main():
     conn.close()
 
     # Insert course scores based on newly inserted course data
+    progress.update("course_scores", "Fetching course scores")
     insert_course_scores_per_term(BASE_URL, headers, DB_NAME)
 
     # Reopen for learning outcomes and rest of workflow
@@ -336,25 +398,94 @@ def main():
     conn.commit()
     conn.close()
 
-    # Insert data into the database again, since assignments needs access to the data
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-
     # Fetch assignment ids from the database
     assignment_ids = get_assignment_ids(DB_NAME)
-    if not assignment_ids:
-        return  # Exit if no assignment IDs are found
+    if assignment_ids:
+        # Process assignments
+        process_assignments(BASE_URL, headers, DB_NAME, assignment_ids, progress)
 
-    # Process assignments
-    process_assignments(BASE_URL, headers, DB_NAME, assignment_ids)
+    # Create the views
+    progress.update("views", "Creating views")
+    create_views(DB_NAME, VIEWS_FILE)
 
-    # Commit and close connection
-    conn.commit()
-    conn.close()
+def write_score_columns(DB_NAME, columns_root, version):
+    """Columnar copy of the scores for the API; the API falls back to SQLite without it, so failures only warn."""
+    try:
+        write_columns(DB_NAME, columns_root, version)
+        return True
+    except Exception as e:
+        print(f"⚠️ Could not write the columnar score snapshot: {e}")
+        return False
 
-    # Create the views
+# Fetch everything from Forum, build it into a new snapshot and publish it
+def sync(BASE_URL, headers, LIVE_DB, SCHEMA_FILE, VIEWS_FILE, progress, columns_root=COLUMNS_DIR):
+    # Fetch data from APIs and handle errors
+    progress.update("fetching", "Fetching data from Forum", 0, 4)
+    lo_trees = fetch_data_from_api(f"{BASE_URL}lo-trees", headers)
+    assert_data_fetched("lo-trees", lo_trees)
+
+    progress.update("fetching", "Fetching data from Forum", 1, 4)
+    terms = fetch_data_from_api(f"{BASE_URL}terms", headers)
+    assert_data_fetched("terms", terms)
+
+    progress.update("fetching", "Fetching data from Forum", 2, 4)
+    outcomes = fetch_data_from_api(f"{BASE_URL}outcome-assessments", headers)
+    assert_data_fetched("outcome-assessments", outcomes)
+
+    progress.update("fetching", "Fetching data from Forum", 3, 4)
+    colleges = fetch_data_from_api(f"{BASE_URL}colleges", headers)
+    assert_data_fetched("colleges", colleges)
+
+    if not lo_trees or not terms or not outcomes or not colleges:
+        print("❌ No data returned from the API.")
+        raise RuntimeError("No data returned from the API")
+
+    # Ingest into a copy of the live database so the running API never sees a half-synced state
+    DB_NAME = begin_snapshot(LIVE_DB)
+    try:
+        before = count_rows(DB_NAME)
+        build_snapshot(BASE_URL, headers, DB_NAME, SCHEMA_FILE, VIEWS_FILE, lo_trees, terms, outcomes, colleges,
+                       progress)
+        summary = summarize_changes(before, count_rows(DB_NAME))
+        summary["outcome_assessments"].update(count_pending_changes(DB_NAME))
+        version = record_sync_run(DB_NAME, progress.started_on, summary)
+
+        progress.update("validating", "Validating the new snapshot")
+        validate_snapshot(DB_NAME)
+        progress.update("columns", "Writing the columnar score snapshot")
+        columns_written = write_score_columns(DB_NAME, columns_root, version)
+        progress.update("publishing", "Publishing the new snapshot")
+        publish_snapshot(DB_NAME, LIVE_DB)
+    except Exception:
+        discard_snapshot(DB_NAME)
+        raise
+
+    if columns_written:
+        activate_columns(columns_root, version)
+
+    progress.finish(version, summary)
+
+# Main function to tie everything together
+def main():
+    # Load environment variables
+    CSRF_TOKEN, SESSION_ID, BASE_URL = load_env_variables()
+    
+    # Set up headers for API requests
+    headers = get_headers(CSRF_TOKEN, SESSION_ID)
+    
+    # Get the directory of the current script
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    # Absolute paths for DB and schema files
+    LIVE_DB = os.path.join(script_dir, "data.db")
+    SCHEMA_FILE = os.path.join(script_dir, "schema.sql")
     VIEWS_FILE = os.path.join(script_dir, "views.sql")
-    create_views(DB_NAME, VIEWS_FILE)
+    
+    progress = SyncProgress()
+    try:
+        sync(BASE_URL, headers, LIVE_DB, SCHEMA_FILE, VIEWS_FILE, progress)
+    except Exception as e:
+        progress.fail(e)
+        raise
 
     print("✅ Data successfully stored in database")
 
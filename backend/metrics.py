@@ -0,0 +1,190 @@
+import bisect
+import threading
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+BYTE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024, 100 * 1024 * 1024)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """A monotonically increasing value per label combination."""
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        return self._values.get(key, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge:
+    """A point-in-time value read from a callback when metrics are scraped."""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, callback):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def samples(self):
+        yield f"{self.name} {_format_value(self.callback())}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label combination, in Prometheus' layout."""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # one slot per bucket plus the +Inf overflow, then sum and count
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        series = self._series.get(key)
+        return series[2] if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, [list(s[0]), s[1], s[2]]) for key, s in self._series.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry shared by the API and the query wrapper
+registry = Registry()
+
+HTTP_REQUESTS = registry.counter(
+    "http_requests_total", "HTTP requests handled, by route, method and status.",
+    ("route", "method", "status"))
+HTTP_ERRORS = registry.counter(
+    "http_request_errors_total", "HTTP requests that ended in a 5xx or an unhandled exception.",
+    ("route",))
+HTTP_LATENCY = registry.histogram(
+    "http_request_duration_seconds", "Time spent handling a request, by route.",
+    ("route",), LATENCY_BUCKETS)
+HTTP_RESPONSE_BYTES = registry.histogram(
+    "http_response_size_bytes", "Size of response bodies, by route.",
+    ("route",), BYTE_BUCKETS)
+
+DB_QUERY_LATENCY = registry.histogram(
+    "db_query_duration_seconds", "Time spent executing and fetching a SQL statement, by query name.",
+    ("query",), LATENCY_BUCKETS)
+DB_QUERY_ROWS = registry.histogram(
+    "db_query_rows", "Rows returned by a SQL statement, by query name.",
+    ("query",), ROW_BUCKETS)
+DB_QUERY_ERRORS = registry.counter(
+    "db_query_errors_total", "SQL statements that raised a database error, by query name.",
+    ("query",))
+DB_CONNECTION_WAIT = registry.histogram(
+    "db_connection_wait_seconds", "Time spent waiting for a pooled database connection.",
+    (), LATENCY_BUCKETS)
+
+RESULT_CACHE_REQUESTS = registry.counter(
+    "result_cache_requests_total", "Result cache lookups, by result (hit or miss).",
+    ("result",))
+RESULT_CACHE_EVICTIONS = registry.counter(
+    "result_cache_evictions_total", "Result cache entries evicted to stay under the size limit.")
+RESULT_CACHE_INVALIDATIONS = registry.counter(
+    "result_cache_invalidations_total", "Times the result cache was emptied because the data version changed.")
+
+SINGLEFLIGHT_CALLS = registry.counter(
+    "singleflight_calls_total",
+    "Cache-miss queries by role: leaders ran the query, followers shared a concurrent leader's result.",
+    ("role",))
+
+EXPORT_JOBS = registry.counter(
+    "export_jobs_total",
+    "Export job requests by outcome: submitted, deduplicated (served by an earlier job), done or failed.",
+    ("result",))
+
+SUMMARY_JOBS = registry.counter(
+    "summary_jobs_total",
+    "On-demand AI summary requests by outcome: submitted, deduplicated (served by an earlier job), done or failed.",
+    ("result",))
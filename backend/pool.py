@@ -0,0 +1,160 @@
+import os
+import queue
+import sqlite3
+import threading
+from pathlib import Path
+
+# Per-connection tuning for the read-only serving path
+DEFAULT_CACHE_SIZE_KIB = 16 * 1024       # 16 MiB page cache per connection
+DEFAULT_MMAP_SIZE = 256 * 1024 * 1024    # map up to 256 MiB of the file
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection became free within the wait timeout."""
+
+
+class PooledConnection:
+    """
+    Thin wrapper around a pooled sqlite3 connection.
+    close() hands the connection back to the pool instead of closing it,
+    so existing `conn = get_db_connection() ... conn.close()` code keeps working.
+    """
+    def __init__(self, pool, conn, generation):
+        self._pool = pool
+        self._conn = conn
+        self._generation = generation
+
+    def cursor(self):
+        return self._conn.cursor()
+
+    def execute(self, *args, **kwargs):
+        return self._conn.execute(*args, **kwargs)
+
+    @property
+    def raw(self):
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.set_progress_handler(None, 0)  # don't carry this request's deadline into the next
+            self._pool.release(self._conn, self._generation)
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    A small pool of read-only SQLite connections.
+
+    Connections are opened lazily with `mode=ro`, `query_only` and tuned cache/mmap
+    settings, then reused across requests. The pool is per process: if it notices it
+    is running in a forked worker it drops the connections inherited from the parent.
+
+    When ingestion publishes a new snapshot (data.db is atomically replaced), the
+    pool notices the new file on the next acquire(): idle connections to the old
+    file are closed, and busy ones are closed when their request hands them back.
+    """
+    def __init__(self, db_path, size=8, timeout=5.0,
+                 cache_size_kib=DEFAULT_CACHE_SIZE_KIB, mmap_size=DEFAULT_MMAP_SIZE):
+        self.db_path = os.path.abspath(db_path)
+        self.size = size
+        self.timeout = timeout
+        self.cache_size_kib = cache_size_kib
+        self.mmap_size = mmap_size
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()  # LIFO keeps the hottest connection (and its cache) in use
+        self._created = 0
+        self._identity = None
+        self._generation = 0
+
+    def _file_identity(self):
+        try:
+            st = os.stat(self.db_path)
+        except OSError:
+            return None
+        return st.st_dev, st.st_ino
+
+    def _drain_idle(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            self._created -= 1
+
+    def _connect(self):
+        uri = Path(self.db_path).as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kib)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def acquire(self):
+        identity = self._file_identity()
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            if identity != self._identity:
+                # data.db was swapped for a new snapshot (or appeared for the first time)
+                self._identity = identity
+                self._generation += 1
+                self._drain_idle()
+            generation = self._generation
+            try:
+                conn, _ = self._idle.get_nowait()
+                return PooledConnection(self, conn, generation)
+            except queue.Empty:
+                pass
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+
+        if can_create:
+            try:
+                return PooledConnection(self, self._connect(), generation)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            conn, conn_generation = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeout(f"No database connection free after {self.timeout}s")
+        if conn_generation != self._generation:
+            # Handed back just before a snapshot swap; reopen against the new file
+            conn.close()
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return PooledConnection(self, conn, self._generation)
+
+    def release(self, conn, generation):
+        if self._pid != os.getpid():
+            return  # belongs to a pool from before a fork; just drop it
+        with self._lock:
+            if generation != self._generation:
+                conn.close()
+                self._created -= 1
+                return
+        self._idle.put((conn, generation))
+
+    def close_all(self):
+        with self._lock:
+            self._drain_idle()
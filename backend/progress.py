@@ -0,0 +1,76 @@
+import json
+import os
+from datetime import datetime, timezone
+
+# main.py reports where a sync is up to here; the API streams it to clients (see events.py)
+STATUS_PATH = os.environ.get(
+    "SYNC_STATUS_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "sync_status.json"),
+)
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def write_status(path, status):
+    # Write to a temporary file and rename it so readers never see a half-written file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(status, f)
+    os.replace(tmp_path, path)
+
+
+def read_status(path=STATUS_PATH):
+    """Return the last reported sync status, or None if no sync has reported yet."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class SyncProgress:
+    """
+    Records the progress of one sync run in a small JSON status file.
+    Each update replaces the whole file with the current state:
+    {"state", "stage", "message", "current", "total", "started_on", "updated_on", ...}
+    With path=None updates are only kept in memory.
+    """
+    def __init__(self, path=STATUS_PATH):
+        self.path = path
+        self.started_on = _now()
+        self.status = {}
+
+    def update(self, stage, message=None, current=None, total=None, state="running", **extra):
+        self.status = {
+            "state": state,
+            "stage": stage,
+            "message": message,
+            "current": current,
+            "total": total,
+            "started_on": self.started_on,
+            "updated_on": _now(),
+            **extra,
+        }
+        if self.path is None:
+            return
+        try:
+            write_status(self.path, self.status)
+        except OSError as e:
+            # Progress reporting must never break the sync itself
+            print(f"⚠️ Could not write sync status to {self.path}: {e}")
+
+    def finish(self, version=None, summary=None):
+        self.update("done", "Sync complete", state="succeeded", version=version, summary=summary)
+
+    def fail(self, error):
+        self.update(self.status.get("stage", "starting"), str(error), state="failed")
+
+
+def status_mtime(path=STATUS_PATH):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
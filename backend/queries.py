@@ -0,0 +1,156 @@
+import sqlite3
+import threading
+import time
+
+try:
+    from backend.metrics import DB_QUERY_ERRORS, DB_QUERY_LATENCY, DB_QUERY_ROWS
+    from backend import slowlog
+except ImportError:
+    from metrics import DB_QUERY_ERRORS, DB_QUERY_LATENCY, DB_QUERY_ROWS
+    import slowlog
+
+# How many SQLite VM instructions run between deadline checks
+PROGRESS_STEPS = 1000
+
+_local = threading.local()
+
+
+class QueryCancelled(Exception):
+    """A statement was interrupted before it finished; maps to an HTTP error status."""
+    status_code = 503
+
+
+class QueryTimeout(QueryCancelled):
+    status_code = 504
+
+
+class ClientDisconnected(QueryCancelled):
+    status_code = 503
+
+
+class Deadline:
+    """
+    A per-request time limit for SQL work. check() is installed as the SQLite
+    progress handler and aborts the running statement once the deadline passes
+    or `is_disconnected()` reports that the client has gone away.
+    """
+    def __init__(self, timeout, is_disconnected=None):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+        self.is_disconnected = is_disconnected
+        self.reason = None
+
+    def check(self):
+        if time.monotonic() >= self.expires_at:
+            self.reason = QueryTimeout(f"Query exceeded the {self.timeout:g}s time limit")
+            return 1
+        if self.is_disconnected is not None and self.is_disconnected():
+            self.reason = ClientDisconnected("Client disconnected before the query finished")
+            return 1
+        return 0
+
+    def attach(self, conn):
+        conn.set_progress_handler(self.check, PROGRESS_STEPS)
+
+
+def set_deadline(deadline):
+    """Set (or clear, with None) the deadline for queries run on this thread."""
+    _local.deadline = deadline
+
+
+def current_deadline():
+    return getattr(_local, "deadline", None)
+
+
+def check_deadline():
+    """Raise the thread's Deadline error if it has passed or the client has gone; for waits outside SQLite."""
+    deadline = current_deadline()
+    if deadline is not None and deadline.check():
+        raise deadline.reason
+
+
+def run_query(cursor, name, sql, params=()):
+    """
+    Execute `sql` on `cursor`, fetch every row and record timing metrics.
+    `name` is a short, stable label for the statement (e.g. "feedback") so
+    metrics stay readable and low-cardinality whatever the bound parameters.
+    Statements slower than the slow-query threshold are also written to the
+    slow-query log together with their query plan. If the thread's Deadline
+    interrupted the statement, the matching QueryCancelled error is raised.
+    """
+    start = time.perf_counter()
+    try:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    except sqlite3.Error as e:
+        DB_QUERY_ERRORS.inc(query=name)
+        DB_QUERY_LATENCY.observe(time.perf_counter() - start, query=name)
+        deadline = current_deadline()
+        if deadline is not None and deadline.reason is not None and "interrupted" in str(e):
+            raise deadline.reason from e
+        raise
+
+    elapsed = time.perf_counter() - start
+    DB_QUERY_LATENCY.observe(elapsed, query=name)
+    DB_QUERY_ROWS.observe(len(rows), query=name)
+    slowlog.record_if_slow(cursor, name, sql, params, elapsed, len(rows))
+    return rows
+
+
+def run_many(cursor, name, sql, rows):
+    """
+    Like run_query(), but execute the write `sql` once for each parameter
+    tuple in `rows` (cursor.executemany) and return how many there were. A slow
+    batch is logged with the first row's parameters and the batch size as its
+    row count.
+    """
+    rows = list(rows)
+    start = time.perf_counter()
+    try:
+        cursor.executemany(sql, rows)
+    except sqlite3.Error as e:
+        DB_QUERY_ERRORS.inc(query=name)
+        DB_QUERY_LATENCY.observe(time.perf_counter() - start, query=name)
+        deadline = current_deadline()
+        if deadline is not None and deadline.reason is not None and "interrupted" in str(e):
+            raise deadline.reason from e
+        raise
+
+    elapsed = time.perf_counter() - start
+    DB_QUERY_LATENCY.observe(elapsed, query=name)
+    DB_QUERY_ROWS.observe(len(rows), query=name)
+    slowlog.record_if_slow(cursor, name, sql, rows[0] if rows else (), elapsed, len(rows))
+    return len(rows)
+
+
+def iter_query(cursor, name, sql, params=(), batch_size=1000):
+    """
+    Like run_query(), but yield the rows in lists of up to `batch_size` instead
+    of fetching them all at once, for results too big to hold in memory.
+    Only the time spent in SQLite counts towards the metrics, not the time the
+    caller spends between batches.
+    """
+    elapsed = 0.0
+    row_count = 0
+    start = time.perf_counter()
+    try:
+        cursor.execute(sql, params)
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            elapsed += time.perf_counter() - start
+            if not batch:
+                break
+            row_count += len(batch)
+            yield batch
+            start = time.perf_counter()
+    except sqlite3.Error as e:
+        DB_QUERY_ERRORS.inc(query=name)
+        DB_QUERY_LATENCY.observe(elapsed + time.perf_counter() - start, query=name)
+        deadline = current_deadline()
+        if deadline is not None and deadline.reason is not None and "interrupted" in str(e):
+            raise deadline.reason from e
+        raise
+
+    DB_QUERY_LATENCY.observe(elapsed, query=name)
+    DB_QUERY_ROWS.observe(row_count, query=name)
+    slowlog.record_if_slow(cursor, name, sql, params, elapsed, row_count)
@@ -64,4 +64,88 @@ CREATE TABLE IF NOT EXISTS course_scores (
     term_id INTEGER,
     score REAL,
     updated_on TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
\ No newline at end of file
+);
+
+-- Lets the all_scores view look up assessments per assignment without building a temporary index on every query
+CREATE INDEX IF NOT EXISTS idx_outcome_assessments_assignment ON outcome_assessments (assignment_id, type);
+
+-- One row per published sync; the highest version is the data version clients see
+CREATE TABLE IF NOT EXISTS sync_runs (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_on TIMESTAMP,
+    finished_on TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    summary TEXT  -- JSON: row counts and changes per table
+);
+
+-- Latest change to each assessment, stamped with the sync version being built
+-- (one more than the last published one). /api/feedback?since= reads this to send deltas
+CREATE TABLE IF NOT EXISTS score_changes (
+    assessment_id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL,
+    change TEXT NOT NULL CHECK (change IN ('insert', 'update', 'delete'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_score_changes_version ON score_changes (version);
+
+CREATE TRIGGER IF NOT EXISTS outcome_assessments_track_insert AFTER INSERT ON outcome_assessments
+BEGIN
+    INSERT INTO score_changes (assessment_id, version, change)
+    VALUES (NEW.assessment_id, (SELECT COALESCE(MAX(version), 0) + 1 FROM sync_runs), 'insert')
+    ON CONFLICT (assessment_id) DO UPDATE SET version = excluded.version, change = excluded.change;
+END;
+
+CREATE TRIGGER IF NOT EXISTS outcome_assessments_track_update AFTER UPDATE ON outcome_assessments
+BEGIN
+    INSERT INTO score_changes (assessment_id, version, change)
+    VALUES (NEW.assessment_id, (SELECT COALESCE(MAX(version), 0) + 1 FROM sync_runs), 'update')
+    ON CONFLICT (assessment_id) DO UPDATE SET version = excluded.version, change = excluded.change;
+END;
+
+CREATE TRIGGER IF NOT EXISTS outcome_assessments_track_delete AFTER DELETE ON outcome_assessments
+BEGIN
+    INSERT INTO score_changes (assessment_id, version, change)
+    VALUES (OLD.assessment_id, (SELECT COALESCE(MAX(version), 0) + 1 FROM sync_runs), 'delete')
+    ON CONFLICT (assessment_id) DO UPDATE SET version = excluded.version, change = excluded.change;
+END;
+
+-- all_scores also shows each assessment's assignment and course, so a new or changed one of
+-- those marks the assessments it appears on as updated too (an insert earlier in the same sync stays an insert).
+-- Terms, colleges and learning outcomes are not tracked: a change to one of them only reaches
+-- /api/feedback?since= clients once the assessments themselves change or are reloaded in full
+CREATE TRIGGER IF NOT EXISTS assignments_data_track_insert AFTER INSERT ON assignments_data
+BEGIN
+    INSERT INTO score_changes (assessment_id, version, change)
+    SELECT assessment_id, (SELECT COALESCE(MAX(version), 0) + 1 FROM sync_runs), 'update'
+    FROM outcome_assessments WHERE assignment_id = CAST(NEW.assignment_id AS INTEGER)
+    ON CONFLICT (assessment_id) DO UPDATE SET version = excluded.version,
+        change = CASE WHEN score_changes.version = excluded.version THEN score_changes.change ELSE excluded.change END;
+END;
+
+CREATE TRIGGER IF NOT EXISTS assignments_data_track_update AFTER UPDATE ON assignments_data
+BEGIN
+    INSERT INTO score_changes (assessment_id, version, change)
+    SELECT assessment_id, (SELECT COALESCE(MAX(version), 0) + 1 FROM sync_runs), 'update'
+    FROM outcome_assessments WHERE assignment_id = CAST(NEW.assignment_id AS INTEGER)
+    ON CONFLICT (assessment_id) DO UPDATE SET version = excluded.version,
+        change = CASE WHEN score_changes.version = excluded.version THEN score_changes.change ELSE excluded.change END;
+END;
+
+CREATE TRIGGER IF NOT EXISTS courses_track_insert AFTER INSERT ON courses
+BEGIN
+    INSERT INTO score_changes (assessment_id, version, change)
+    SELECT assessment_id, (SELECT COALESCE(MAX(version), 0) + 1 FROM sync_runs), 'update'
+    FROM outcome_assessments
+    WHERE outcome_id IN (SELECT outcome_id FROM learning_outcomes WHERE course_id = NEW.course_id)
+    ON CONFLICT (assessment_id) DO UPDATE SET version = excluded.version,
+        change = CASE WHEN score_changes.version = excluded.version THEN score_changes.change ELSE excluded.change END;
+END;
+
+CREATE TRIGGER IF NOT EXISTS courses_track_update AFTER UPDATE ON courses
+BEGIN
+    INSERT INTO score_changes (assessment_id, version, change)
+    SELECT assessment_id, (SELECT COALESCE(MAX(version), 0) + 1 FROM sync_runs), 'update'
+    FROM outcome_assessments
+    WHERE outcome_id IN (SELECT outcome_id FROM learning_outcomes WHERE course_id = NEW.course_id)
+    ON CONFLICT (assessment_id) DO UPDATE SET version = excluded.version,
+        change = CASE WHEN score_changes.version = excluded.version THEN score_changes.change ELSE excluded.change END;
+END;
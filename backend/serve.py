@@ -0,0 +1,56 @@
+import argparse
+import logging
+import os
+
+try:
+    from backend import app as backend_app
+except ImportError:  # running as `python3 backend/serve.py`
+    import app as backend_app
+
+try:
+    from backend.pool import ConnectionPool
+except ImportError:
+    from pool import ConnectionPool
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the feedback API with a production WSGI server.")
+    parser.add_argument("--host", default=os.environ.get("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 5001)))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WORKERS", 8)),
+                        help="Number of worker threads handling requests.")
+    parser.add_argument("--pool-size", type=int, default=None,
+                        help="Read-only DB connections to keep open (defaults to --workers).")
+    parser.add_argument("--log-level", default=os.environ.get("LOG_LEVEL", "WARNING"),
+                        help="Request-path logging is skipped entirely below this level.")
+    return parser.parse_args(argv)
+
+
+def configure(args):
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    # One pooled connection per worker thread so no request waits on another's connection
+    backend_app.db_pool.close_all()
+    backend_app.db_pool = ConnectionPool(backend_app.db_path, size=args.pool_size or args.workers)
+
+    # Each open /api/events stream occupies a worker; leave at least half of them for normal requests
+    if "SSE_MAX_STREAMS" not in os.environ:
+        backend_app.event_hub.max_subscribers = max(1, args.workers // 2)
+    return backend_app.app
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    app = configure(args)
+
+    from waitress import serve
+
+    print(f"🚀 Serving API on http://{args.host}:{args.port} with {args.workers} workers")
+    # channel_request_lookahead lets waitress notice clients that hang up mid-request,
+    # which the query deadline uses to cancel their SQL
+    serve(app, host=args.host, port=args.port, threads=args.workers, ident="hc-history",
+          channel_request_lookahead=5)
+
+
+if __name__ == "__main__":
+    main()
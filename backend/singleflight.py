@@ -0,0 +1,80 @@
+import threading
+
+try:
+    from backend import metrics
+    from backend.queries import check_deadline
+except ImportError:
+    import metrics
+    from queries import check_deadline
+
+# Seconds a follower waits between checks of its own request's deadline
+WAIT_SLICE = 0.05
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into one execution.
+    The first caller (the leader) runs the function; callers arriving while it
+    is still running wait for it and receive the same result or exception.
+    A follower stops waiting with its own QueryTimeout or ClientDisconnected
+    once the Deadline of its thread (see queries.set_deadline) runs out; the
+    leader carries on for the others.
+    """
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key, fn):
+        """Return (result, shared) where shared is True if another caller did the work."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+                self.leaders += 1
+            else:
+                leader = False
+                self.followers += 1
+
+        if not leader:
+            metrics.SINGLEFLIGHT_CALLS.inc(role="follower")
+            while not call.done.wait(WAIT_SLICE):
+                check_deadline()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        metrics.SINGLEFLIGHT_CALLS.inc(role="leader")
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        with self._lock:
+            total = self.leaders + self.followers
+            return {
+                "leaders": self.leaders,
+                "followers": self.followers,
+                "coalescing_rate": self.followers / total if total else 0.0,
+                "in_flight": len(self._calls),
+            }
@@ -0,0 +1,74 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+
+DEFAULT_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "slow_queries.log")
+MAX_PARAM_LENGTH = 200
+
+# Statements slower than this many milliseconds are logged; override with SLOW_QUERY_MS
+threshold_ms = float(os.environ.get("SLOW_QUERY_MS", 250))
+
+logger = logging.getLogger("slow_queries")
+logger.propagate = False  # keep full query dumps out of the app log
+_configure_lock = threading.Lock()
+
+
+def configure(path=None, threshold=None, max_bytes=5 * 1024 * 1024, backup_count=3):
+    """(Re)point the slow-query log at a rotating file and optionally change the threshold."""
+    global threshold_ms
+    if threshold is not None:
+        threshold_ms = float(threshold)
+    with _configure_lock:
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        handler = RotatingFileHandler(path or os.environ.get("SLOW_QUERY_LOG", DEFAULT_LOG_PATH),
+                                      maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+
+
+def _short(value):
+    text = repr(value) if not isinstance(value, str) else value
+    if len(text) > MAX_PARAM_LENGTH:
+        return text[:MAX_PARAM_LENGTH] + f"... ({len(text)} chars)"
+    return text
+
+
+def explain(conn, sql, params=()):
+    """Return the EXPLAIN QUERY PLAN detail lines for `sql`, or the error that prevented it."""
+    try:
+        rows = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        return [row[3] for row in rows]
+    except Exception as e:
+        return [f"unavailable: {e}"]
+
+
+def record_if_slow(cursor, name, sql, params, duration, row_count):
+    duration_ms = duration * 1000
+    if duration_ms < threshold_ms:
+        return False
+    if not logger.handlers:
+        configure()
+
+    conn = getattr(cursor, "connection", None)
+    plan = explain(conn, sql, params) if conn is not None else ["unavailable: no connection"]
+    if isinstance(params, dict):
+        bound = {key: _short(value) for key, value in params.items()}
+    else:
+        bound = [_short(value) for value in params or ()]
+
+    logger.info(json.dumps({
+        "time": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "query": name,
+        "duration_ms": round(duration_ms, 2),
+        "rows": row_count,
+        "sql": " ".join(sql.split()),
+        "params": bound,
+        "plan": plan,
+    }))
+    return True
@@ -0,0 +1,250 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+if os.name == "posix":
+    import fcntl
+else:
+    import msvcrt
+
+# Objects the API needs; a snapshot missing any of them is never published
+REQUIRED_TABLES = (
+    "outcome_assessments", "courses", "learning_outcomes", "terms",
+    "colleges", "assignments_data", "course_scores",
+)
+REQUIRED_VIEWS = ("assignment_scores", "all_scores")
+# Tables other processes write to the live database while a sync runs: the AI summaries (from
+# ai-summary/main.py and the API's on-demand summaries) and the generator's usage ledger. The
+# snapshot's copies are as old as the build, so publishing takes the live ones across. Their
+# writers hold write_lock() while they connect and commit, so none of them can write to the old file
+CARRIED_TABLES = (
+    "all_scores_ai_summaries", "all_scores_ai_summary_slices", "ai_summary_usage", "ai_summary_runs",
+)
+
+
+class SnapshotError(Exception):
+    """Raised when a freshly built snapshot fails validation or can't be published."""
+
+
+def build_path_for(live_path):
+    return live_path + ".next"
+
+
+def begin_snapshot(live_path):
+    """
+    Start a new snapshot next to `live_path` and return its path.
+    The snapshot starts as a consistent copy of the live database (taken with
+    SQLite's backup API, so readers of the live file are never blocked), which
+    keeps ingestion incremental while the live file stays untouched.
+    """
+    build_path = build_path_for(live_path)
+    discard_snapshot(build_path)
+
+    if os.path.exists(live_path):
+        src = sqlite3.connect(Path(os.path.abspath(live_path)).as_uri() + "?mode=ro", uri=True)
+        dst = sqlite3.connect(build_path)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+    return build_path
+
+
+def discard_snapshot(build_path):
+    for path in (build_path, build_path + "-journal", build_path + "-wal", build_path + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def validate_snapshot(path):
+    """Check integrity and that the tables and views the API depends on are present and queryable."""
+    conn = sqlite3.connect(path)
+    try:
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        if result != "ok":
+            raise SnapshotError(f"Integrity check failed: {result}")
+
+        objects = {(row[0], row[1]) for row in conn.execute("SELECT type, name FROM sqlite_master")}
+        missing = [f"table {t}" for t in REQUIRED_TABLES if ("table", t) not in objects]
+        missing += [f"view {v}" for v in REQUIRED_VIEWS if ("view", v) not in objects]
+        if missing:
+            raise SnapshotError(f"Snapshot is missing {', '.join(missing)}")
+
+        if conn.execute("SELECT COUNT(*) FROM outcome_assessments").fetchone()[0] == 0:
+            raise SnapshotError("Snapshot has no outcome assessments")
+        # Compiling and running the view catches broken view definitions
+        conn.execute("SELECT COUNT(*) FROM all_scores").fetchone()
+    except sqlite3.Error as e:
+        raise SnapshotError(f"Snapshot is not queryable: {e}") from e
+    finally:
+        conn.close()
+
+
+def count_rows(path, tables=REQUIRED_TABLES):
+    """Row count per table; tables that don't exist yet count as 0."""
+    conn = sqlite3.connect(path)
+    try:
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        return {
+            table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] if table in existing else 0
+            for table in tables
+        }
+    finally:
+        conn.close()
+
+
+def summarize_changes(before, after):
+    return {
+        table: {"rows": after[table], "delta": after[table] - before.get(table, 0)}
+        for table in after
+    }
+
+
+# The version the snapshot being built will get; the score_changes triggers use the same expression
+PENDING_VERSION = "(SELECT COALESCE(MAX(version), 0) + 1 FROM sync_runs)"
+
+
+def count_pending_changes(path):
+    """Assessments inserted, updated and deleted by the sync being built."""
+    conn = sqlite3.connect(path)
+    try:
+        counts = dict(conn.execute(f"""
+            SELECT change, COUNT(*) FROM score_changes
+            WHERE version = {PENDING_VERSION}
+            GROUP BY change
+        """).fetchall())
+    finally:
+        conn.close()
+    return {"inserted": counts.get("insert", 0), "updated": counts.get("update", 0),
+            "deleted": counts.get("delete", 0)}
+
+
+def record_sync_run(path, started_on, summary):
+    """Add this sync to the snapshot's sync_runs table and return its version number."""
+    conn = sqlite3.connect(path)
+    try:
+        with conn:
+            cursor = conn.execute(
+                f"INSERT INTO sync_runs (version, started_on, summary) VALUES ({PENDING_VERSION}, ?, ?)",
+                (started_on, json.dumps(summary)),
+            )
+        return cursor.lastrowid
+    finally:
+        conn.close()
+
+
+def _fsync(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def carry_forward(live_path, build_path, tables=CARRIED_TABLES):
+    """
+    Replace the snapshot's copies of `tables` (and their indexes) with the
+    live database's current ones. Tables the live database doesn't have are
+    left alone. The caller holds write_lock().
+    """
+    conn = sqlite3.connect(build_path)
+    try:
+        conn.execute("ATTACH DATABASE ? AS live", (os.path.abspath(live_path),))
+        with conn:
+            for table in tables:
+                objects = conn.execute(
+                    "SELECT type, sql FROM live.sqlite_master WHERE tbl_name = ? AND sql IS NOT NULL "
+                    "ORDER BY type != 'table'", (table,)).fetchall()
+                if not objects:
+                    continue
+                conn.execute(f'DROP TABLE IF EXISTS main."{table}"')
+                for _, sql in objects:
+                    conn.execute(sql)
+                conn.execute(f'INSERT INTO main."{table}" SELECT * FROM live."{table}"')
+    finally:
+        conn.close()
+
+
+def _try_lock(fd):
+    if os.name == "posix":
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    else:
+        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+
+
+def _unlock(fd):
+    if os.name == "posix":
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def write_lock(live_path, timeout=30.0):
+    """
+    Hold the lock that keeps writes to CARRIED_TABLES and publishing apart;
+    raises TimeoutError if it can't be had within `timeout` seconds. It is
+    taken on a file next to the database rather than on the database itself,
+    so it still means the same thing after publishing has swapped the file:
+    a writer that waited for it opens its connection on the new one.
+    """
+    fd = os.open(live_path + ".lock", os.O_RDWR | os.O_CREAT)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                _try_lock(fd)
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"Timed out waiting for the write lock on {live_path}")
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            _unlock(fd)
+    finally:
+        os.close(fd)
+
+
+def publish_snapshot(build_path, live_path, retries=10, retry_delay=0.5, carry_tables=CARRIED_TABLES,
+                     lock_timeout=30.0):
+    """
+    Atomically replace the live database with the validated snapshot.
+    Readers that already have the old file open keep reading it until they
+    reconnect; new connections see the new file. The tables in `carry_tables`
+    are copied over from the live database first, under write_lock(), which
+    is held until the new file is in place.
+    """
+    if os.path.exists(build_path + "-journal") or os.path.exists(build_path + "-wal"):
+        raise SnapshotError("Snapshot still has an open transaction; close all connections first")
+
+    try:
+        with write_lock(live_path, lock_timeout):
+            if carry_tables and os.path.exists(live_path):
+                carry_forward(live_path, build_path, carry_tables)
+            _replace(build_path, live_path, retries, retry_delay)
+    except TimeoutError as e:
+        raise SnapshotError(f"Could not lock {live_path} to copy its summary tables: {e}") from e
+
+    if os.name == "posix":
+        _fsync(os.path.dirname(os.path.abspath(live_path)))
+
+
+def _replace(build_path, live_path, retries, retry_delay):
+    _fsync(build_path)
+    for attempt in range(retries):
+        try:
+            os.replace(build_path, live_path)
+            return
+        except PermissionError:
+            # Windows refuses to replace a file another process has open;
+            # retry briefly in case that is only transient
+            if attempt == retries - 1:
+                raise SnapshotError(f"Could not replace {live_path}; is another process holding it open?")
+            time.sleep(retry_delay)
@@ -0,0 +1,349 @@
+import itertools
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from backend import metrics
+    from backend.events import format_event
+    from backend.queries import run_many, run_query
+    from backend.snapshot import write_lock
+except ImportError:
+    import metrics
+    from events import format_event
+    from queries import run_many, run_query
+    from snapshot import write_lock
+
+# The prompt, parsing and summarizers are shared with the offline generator in ai-summary/
+AI_SUMMARY_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ai-summary")
+if AI_SUMMARY_DIR not in sys.path:
+    sys.path.append(AI_SUMMARY_DIR)
+from generate import GENERATION_PARAMS, MAX_COMMENT_CHARS, MODEL, input_hash, parse_answer, summary_messages
+from ledger import UsageLedger, as_attempt, for_outcome
+from prompt import DEFAULT_PROMPT_BUDGET, Comment, build_prompt_comments
+from ratelimit import RateLimiter, call_with_retry, estimate_tokens
+from summarizers import SUMMARIZERS, ExtractiveSummarizer
+
+logger = logging.getLogger(__name__)
+
+SLICE_COMMENTS_QUERY = """
+    SELECT comment, score, created_on
+    FROM all_scores
+    WHERE outcome_name = ? AND comment IS NOT NULL
+      AND (? = '' OR course_code = ?) AND (? = '' OR term_title = ?)
+    ORDER BY created_on
+"""
+
+# Summaries of part of an outcome's feedback (one course and/or term); '' means "every"
+SLICE_TABLE = """
+    CREATE TABLE IF NOT EXISTS all_scores_ai_summary_slices (
+        outcome_name TEXT NOT NULL,
+        course_code TEXT NOT NULL DEFAULT '',
+        term_title TEXT NOT NULL DEFAULT '',
+        strengths_text TEXT,
+        improvement_text TEXT,
+        input_hash TEXT,
+        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (outcome_name, course_code, term_title)
+    )
+"""
+# As created by ai-summary/db.py, for servers that never ran the offline generator
+SUMMARY_TABLE = """
+    CREATE TABLE IF NOT EXISTS all_scores_ai_summaries (
+        outcome_name TEXT PRIMARY KEY,
+        outcome_id INTEGER,
+        outcome_description TEXT,
+        strengths_text TEXT,
+        improvement_text TEXT,
+        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        input_hash TEXT
+    )
+"""
+# Likewise; on-demand generations are recorded here under run_id "api-<job id>"
+USAGE_TABLE = """
+    CREATE TABLE IF NOT EXISTS ai_summary_usage (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_id TEXT NOT NULL,
+        outcome TEXT,
+        request TEXT,
+        model TEXT,
+        prompt_tokens INTEGER,
+        completion_tokens INTEGER,
+        latency_ms REAL,
+        retries INTEGER,
+        status TEXT,
+        cost REAL,
+        created_at TIMESTAMP
+    )
+"""
+
+
+class SummaryJob:
+    """
+    One requested summary. Everything it reports (tokens as they arrive, then
+    the result or the error) is appended to `events`, so a client that starts
+    watching late still sees the whole answer.
+    """
+    def __init__(self, job_id, key, params):
+        self.id = job_id
+        self.key = key
+        self.params = params
+        self.state = "queued"  # queued -> running -> done | failed
+        self.events = []
+        self.text = ""
+        self.result = None
+        self.error = None
+        self.finished_at = None
+        self.closed = False  # set with the last event
+        self.changed = threading.Condition()
+
+    def add_event(self, event, data, last=False):
+        with self.changed:
+            self.events.append(format_event(event, data))
+            self.closed = self.closed or last
+            self.changed.notify_all()
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "state": self.state,
+            **self.params,
+            "text": self.text,
+            "summary": self.result,
+            "error": self.error,
+        }
+
+
+class SummaryManager:
+    """
+    Generates summaries on a small pool of background threads.
+
+    `run(job, emit)` produces the summary for `job.params`, calling
+    `emit(text)` with each piece of the answer as the model writes it, and
+    returns the stored summary as a dict. A job submitted with the same key as
+    one that is queued, running or finished less than `ttl` seconds ago is
+    answered by that job, so simultaneous requests for the same slice cost one
+    generation; callers put the data version in the key.
+    """
+    def __init__(self, run, workers=2, ttl=600.0):
+        self.run = run
+        self.ttl = ttl
+        self._jobs = {}
+        self._by_key = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="summary")
+
+    def submit(self, key, params):
+        """Return (job, created): an existing job for `key` if there is one, else a newly queued job."""
+        with self._lock:
+            self._evict()
+            job = self._by_key.get(key)
+            if job is not None and job.state != "failed":
+                metrics.SUMMARY_JOBS.inc(result="deduplicated")
+                return job, False
+            job = SummaryJob(uuid.uuid4().hex, key, params)
+            self._jobs[job.id] = job
+            self._by_key[key] = job
+        metrics.SUMMARY_JOBS.inc(result="submitted")
+        self._executor.submit(self._run, job)
+        return job, True
+
+    def get(self, job_id):
+        with self._lock:
+            self._evict()
+            return self._jobs.get(job_id)
+
+    def _run(self, job):
+        job.state = "running"
+        job.add_event("summary-state", {"state": job.state})
+
+        def emit(text):
+            job.text += text
+            job.add_event("token", {"text": text})
+
+        try:
+            job.result = self.run(job, emit)
+            state, event, data = "done", "summary-done", None
+        except Exception as e:
+            logger.exception("Summary job %s failed", job.id)
+            job.error = str(e)
+            state, event, data = "failed", "summary-failed", {"error": job.error}
+        # finished_at first: eviction on other threads relies on it for every finished job
+        job.finished_at = time.time()
+        job.state = state
+        metrics.SUMMARY_JOBS.inc(result=state)
+        job.add_event(event, data or job.to_dict(), last=True)
+
+    def _evict(self):
+        # Caller holds self._lock
+        now = time.time()
+        for job in list(self._jobs.values()):
+            if job.finished_at is not None and now - job.finished_at > self.ttl:
+                del self._jobs[job.id]
+                if self._by_key.get(job.key) is job:
+                    del self._by_key[job.key]
+
+    def stream(self, job, heartbeat=15.0, max_duration=300.0):
+        """
+        Yield the text of an SSE response following `job`: every event so far,
+        then new ones as they happen, ending once the job has finished. A
+        comment line goes out every `heartbeat` seconds while nothing happens.
+        """
+        yield "retry: 5000\n\n"
+        sent = 0
+        ends_at = time.monotonic() + max_duration
+        while True:
+            with job.changed:
+                if sent == len(job.events) and not job.closed:
+                    job.changed.wait(timeout=min(heartbeat, max(ends_at - time.monotonic(), 0)))
+                events = job.events[sent:]
+                closed = job.closed
+            if events:
+                sent += len(events)
+                yield "".join(events)
+            if closed or time.monotonic() >= ends_at:
+                return
+            if not events:
+                yield ": keep-alive\n\n"
+
+    def stats(self):
+        with self._lock:
+            states = [job.state for job in self._jobs.values()]
+            return {"jobs": len(states), "running": states.count("running"), "queued": states.count("queued")}
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+def fetch_slice(cursor, outcome, course="", term=""):
+    """(comments, outcome_id, description) for one outcome, limited to a course and/or term when given."""
+    rows = run_query(cursor, "summary_slice_comments", SLICE_COMMENTS_QUERY, (outcome, course, course, term, term))
+    comments = [Comment(row["comment"], row["score"], row["created_on"]) for row in rows]
+    metadata = run_query(cursor, "summary_outcome_metadata",
+                         "SELECT outcome_id, description FROM learning_outcomes WHERE name = ? LIMIT 1", (outcome,))
+    if metadata:
+        return comments, metadata[0]["outcome_id"], metadata[0]["description"]
+    return comments, None, None
+
+
+def stream_summary_text(client, outcome_name, outcome_description, all_comments, limiter=None):
+    """
+    Start a streamed completion and return an iterator over the pieces of
+    its answer. The request itself is made (and retried) before anything is
+    streamed, so a retry never repeats text a client has already seen. Each
+    attempt first waits for room in `limiter`, when given.
+    """
+    messages = summary_messages(outcome_name, outcome_description, all_comments)
+    tokens = sum(estimate_tokens(message["content"]) for message in messages) + GENERATION_PARAMS["max_tokens"]
+    attempts = itertools.count()
+
+    def attempt():
+        if limiter is not None:
+            limiter.acquire(tokens)
+        return as_attempt(next(attempts), lambda: client.ChatCompletion.create(
+            model=MODEL, messages=messages, stream=True, **GENERATION_PARAMS))
+
+    response = for_outcome(outcome_name, lambda: call_with_retry(attempt, limiter))
+    return (chunk["choices"][0]["delta"].get("content") or "" for chunk in response)
+
+
+def generate_slice(client, summarizer, outcome, description, comments, emit, budget=DEFAULT_PROMPT_BUDGET,
+                   limiter=None, ledger=None):
+    """
+    Summarize `comments`, emitting the text as it is produced. Model requests
+    wait for `limiter` and are recorded in `ledger` (a UsageLedger) when
+    given. Returns (strengths, improvement, input_hash).
+
+    Unlike ai-summary/main.py this asks for a free-text answer rather than
+    record_summary arguments, since the text is what a client watches arrive;
+    it is checked by the same parser main.py uses for free-text answers.
+    """
+    if not comments:
+        raise ValueError(f"No comments for {outcome} in this selection")
+    # Nothing condenses long feedback here first, so the prompt stays within one request
+    budget = min(budget or MAX_COMMENT_CHARS // 4, MAX_COMMENT_CHARS // 4)
+    text = build_prompt_comments(comments, budget).text
+
+    if summarizer == "extractive":
+        strengths, improvement = ExtractiveSummarizer().summarize(outcome, description, text)
+        emit(f"Strengths:\n{strengths}\n\nAreas for Improvement:\n{improvement}")
+    else:
+        if ledger is not None:
+            client = ledger.wrap(client)
+        answer = []
+        for piece in stream_summary_text(client, outcome, description, text, limiter):
+            if piece:
+                answer.append(piece)
+                emit(piece)
+        strengths, improvement = parse_answer({"content": "".join(answer)})
+    return strengths, improvement, input_hash(outcome, description, text, summarizer)
+
+
+def _insert_usage(conn, usage):
+    if usage:
+        conn.execute(USAGE_TABLE)
+        run_many(conn.cursor(), "summary_usage_insert", """
+            INSERT INTO ai_summary_usage
+                (run_id, outcome, request, model, prompt_tokens, completion_tokens, latency_ms, retries, status, cost,
+                 created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, usage)
+
+
+def store_summary_usage(db_path, usage):
+    """Save the ledger rows of a generation that produced no summary."""
+    with write_lock(db_path):
+        conn = sqlite3.connect(db_path, timeout=30)
+        try:
+            _insert_usage(conn, usage)
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def store_slice_summary(db_path, outcome, course, term, outcome_id, description, strengths, improvement, summary_hash,
+                        usage=()):
+    """
+    Save a generated summary: a whole outcome's replaces its row in
+    all_scores_ai_summaries, a course or term slice goes to the slices table.
+    The ledger rows in `usage` go to ai_summary_usage in the same transaction.
+    """
+    # Under the lock a sync's publish takes, so the summary can't land in a file being replaced
+    with write_lock(db_path):
+        conn = sqlite3.connect(db_path, timeout=30)
+        try:
+            if not course and not term:
+                conn.execute(SUMMARY_TABLE)
+                conn.execute("""
+                    INSERT INTO all_scores_ai_summaries
+                        (outcome_name, outcome_id, outcome_description, strengths_text, improvement_text, input_hash)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (outcome_name) DO UPDATE SET
+                        outcome_id=excluded.outcome_id,
+                        outcome_description=excluded.outcome_description,
+                        strengths_text=excluded.strengths_text,
+                        improvement_text=excluded.improvement_text,
+                        input_hash=excluded.input_hash,
+                        last_updated=CURRENT_TIMESTAMP
+                """, (outcome, outcome_id, description, strengths, improvement, summary_hash))
+            else:
+                conn.execute(SLICE_TABLE)
+                conn.execute("""
+                    INSERT INTO all_scores_ai_summary_slices
+                        (outcome_name, course_code, term_title, strengths_text, improvement_text, input_hash)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (outcome_name, course_code, term_title) DO UPDATE SET
+                        strengths_text=excluded.strengths_text,
+                        improvement_text=excluded.improvement_text,
+                        input_hash=excluded.input_hash,
+                        last_updated=CURRENT_TIMESTAMP
+                """, (outcome, course, term, strengths, improvement, summary_hash))
+            _insert_usage(conn, usage)
+            conn.commit()
+        finally:
+            conn.close()
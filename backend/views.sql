@@ -72,7 +72,7 @@ JOIN learning_outcomes lo ON oa.outcome_id = lo.outcome_id
 JOIN courses c ON lo.course_id = c.course_id
 JOIN terms t ON c.term_id = t.term_id
 JOIN colleges co ON c.college_id = co.college_id
-LEFT JOIN assignments_data ad ON oa.assignment_id = ad.assignment_id
+LEFT JOIN assignments_data ad ON ad.assignment_id = CAST(oa.assignment_id AS TEXT)
 LEFT JOIN (
   SELECT 
     ad.section_id,
@@ -84,3 +84,25 @@ LEFT JOIN (
   WHERE oa2.type = 'assignment' AND ad.section_id IS NOT NULL
   GROUP BY c.course_title
 ) AS fallback_sections ON fallback_sections.course_title = c.course_title;
+
+-- Pre-aggregated score counts behind /api/facets and /api/rankings. Rebuilt with the views
+-- at the end of every sync; a few hundred rows instead of one per assessment. Facets count a
+-- missing score as 0, as the feedback API does; `scored` lets rankings leave them out, as grades do
+DROP TABLE IF EXISTS score_cube;
+
+CREATE TABLE score_cube AS
+SELECT
+    outcome_name,
+    course_code,
+    MAX(course_title) AS course_title,
+    term_title,
+    COALESCE(score, 0) AS score,
+    score IS NOT NULL AS scored,
+    COUNT(*) AS n,
+    SUM(COALESCE(score, 0)) AS score_sum,
+    -- weights are stored like '8x'; missing ones count once, as in the feedback API
+    SUM(CASE WHEN weight IS NULL THEN 1.0 ELSE CAST(REPLACE(CAST(weight AS TEXT), 'x', '') AS REAL) END) AS weight_sum,
+    SUM(COALESCE(score, 0) * CASE WHEN weight IS NULL THEN 1.0 ELSE CAST(REPLACE(CAST(weight AS TEXT), 'x', '') AS REAL) END)
+        AS weighted_score_sum
+FROM all_scores
+GROUP BY outcome_name, course_code, term_title, COALESCE(score, 0), score IS NOT NULL;
@@ -1,6 +1,6 @@
 "use client";
 
-import React, { useMemo, useState } from "react";
+import React, { useEffect, useMemo, useState } from "react";
 import { Award, Download, AlertCircle } from "lucide-react";
 import { motion } from "framer-motion";
 import {
@@ -30,7 +30,23 @@ interface FeedbackItem {
     weight: string;
     weight_numeric?: number;
   }
-  
+
+interface RankedOutcome {
+  rank: number;
+  outcome_name: string;
+  is_hc: boolean;
+  count: number;
+  mean: number;
+  weighted_mean: number | null;
+}
+
+interface RankingPage {
+  total: number;
+  items: RankedOutcome[];
+  next_offset: number | null;
+}
+
+const PAGE_SIZE = 25;
 
 export default function RankingTable({ data }: { data: FeedbackItem[] }) {
   const [showType, setShowType] = useState<"HC" | "LO" | "All">("All");
@@ -42,43 +58,35 @@ export default function RankingTable({ data }: { data: FeedbackItem[] }) {
     return (total / data.length).toFixed(2);
   }, [data]);
 
-  const outcomeStats = useMemo(() => {
-    const stats = new Map<
-      string,
-      { totalScore: number; count: number; isHC: boolean }
-    >();
-
-    data.forEach((item) => {
-      if (!item.outcome_name) return;
-      if (!stats.has(item.outcome_name)) {
-        const isHC = !item.outcome_name.includes("-");
-        stats.set(item.outcome_name, { totalScore: 0, count: 0, isHC });
-      }
+  // Ranking is done by /api/rankings; we only hold the pages shown so far
+  const [rankedOutcomes, setRankedOutcomes] = useState<RankedOutcome[]>([]);
+  const [totalOutcomes, setTotalOutcomes] = useState(0);
+  const [nextOffset, setNextOffset] = useState<number | null>(null);
 
-      const current = stats.get(item.outcome_name)!;
-      current.totalScore += item.score;
-      current.count += 1;
+  async function loadPage(offset: number) {
+    const params = new URLSearchParams({
+      type: showType.toLowerCase(),
+      order: sortAscending ? "asc" : "desc",
+      offset: String(offset),
+      limit: String(PAGE_SIZE),
     });
+    try {
+      const response = await fetch(`http://localhost:5001/api/rankings?${params.toString()}`);
+      if (!response.ok) throw new Error(`HTTP error! Status ${response.status}`);
+      const page = await response.json() as RankingPage;
+      setRankedOutcomes(prev => (offset === 0 ? page.items : [...prev, ...page.items]));
+      setTotalOutcomes(page.total);
+      setNextOffset(page.next_offset);
+    } catch (error) {
+      console.error("Error loading rankings:", error);
+    }
+  }
 
-    return stats;
-  }, [data]);
-
-  const rankedOutcomes = useMemo(() => {
-    return Array.from(outcomeStats.entries())
-      .map(([name, stats]) => ({
-        name,
-        avgScore: stats.totalScore / stats.count,
-        count: stats.count,
-        isHC: stats.isHC,
-      }))
-      .filter((o) => {
-        if (showType === "All") return true;
-        return showType === "HC" ? o.isHC : !o.isHC;
-      })
-      .sort((a, b) =>
-        sortAscending ? a.avgScore - b.avgScore : b.avgScore - a.avgScore
-      );
-  }, [outcomeStats, showType, sortAscending]);
+  // start over when the view changes or new data arrives
+  useEffect(() => {
+    loadPage(0);
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [showType, sortAscending, data]);
 
   const getScoreColorClass = (score: number) => {
     if (score >= 4.5) return "text-[#8B6BF2]";
@@ -159,7 +167,7 @@ export default function RankingTable({ data }: { data: FeedbackItem[] }) {
             <div className="overflow-x-auto">
               <div className="flex flex-wrap items-center justify-between px-4 sm:px-6 py-3 border-b border-[#E2E8F0] gap-3">
                 <h3 className="font-medium text-[#0F172A]">
-                  Showing {rankedOutcomes.length} {showType} outcomes
+                  Showing {rankedOutcomes.length} of {totalOutcomes} {showType} outcomes
                 </h3>
 
                 <div className="flex flex-wrap gap-3">
@@ -216,7 +224,7 @@ export default function RankingTable({ data }: { data: FeedbackItem[] }) {
                 <tbody className="divide-y divide-[#E2E8F0]">
                   {rankedOutcomes.map((outcome, index) => (
                     <tr
-                      key={outcome.name}
+                      key={outcome.outcome_name}
                       className={`hover:bg-[#F8FAFC] ${
                         sortAscending && index < 3
                           ? "bg-red-50"
@@ -228,24 +236,24 @@ export default function RankingTable({ data }: { data: FeedbackItem[] }) {
                       <td className="px-4 sm:px-6 py-4 whitespace-nowrap">{index + 1}</td>
                       <td className="px-4 sm:px-6 py-4 font-medium">
                         <div className="flex items-center gap-2">
-                          <span>{outcome.name}</span>
+                          <span>{outcome.outcome_name}</span>
                           <span
                             className={`inline-flex items-center px-2 py-0.5 rounded-full text-xs font-medium ${
-                              outcome.isHC
+                              outcome.is_hc
                                 ? "bg-blue-100 text-blue-800"
                                 : "bg-purple-100 text-purple-800"
                             }`}
                           >
-                            {outcome.isHC ? "HC" : "LO"}
+                            {outcome.is_hc ? "HC" : "LO"}
                           </span>
                         </div>
                       </td>
                       <td
                         className={`px-4 sm:px-6 py-4 whitespace-nowrap text-right font-bold ${getScoreColorClass(
-                          outcome.avgScore
+                          outcome.mean
                         )}`}
                       >
-                        {outcome.avgScore.toFixed(2)}
+                        {outcome.mean.toFixed(2)}
                       </td>
                       <td className="px-4 sm:px-6 py-4 whitespace-nowrap text-right text-[#64748B]">
                         {outcome.count}
@@ -255,6 +263,14 @@ export default function RankingTable({ data }: { data: FeedbackItem[] }) {
                 </tbody>
               </table>
 
+              {nextOffset !== null && (
+                <div className="py-4 text-center border-t border-[#E2E8F0]">
+                  <Button variant="outline" size="sm" onClick={() => loadPage(nextOffset)}>
+                    Show more
+                  </Button>
+                </div>
+              )}
+
               {rankedOutcomes.length === 0 && (
                 <div className="py-12 text-center text-[#64748B]">
                   <AlertCircle className="h-12 w-12 mx-auto text-[#E2E8F0] mb-3" />
@@ -1,7 +1,7 @@
 // components/FeedbackPlatform.tsx
 "use client";
 
-import { useState, useEffect, useMemo } from "react";
+import { useState, useEffect, useMemo, useRef } from "react";
 import { motion } from "framer-motion";
 import { Card, CardContent, CardDescription, CardFooter, CardHeader, CardTitle } from "@/components/ui/card"
 import { Button } from "@/components/ui/button"
@@ -26,6 +26,7 @@ import RankingTable from "./components/table/RankingTable";
 
 
 interface FeedbackItem {
+  assessment_id: number;
   score: number;
   comment: string;
   outcome_name: string;
@@ -38,6 +39,30 @@ interface FeedbackItem {
   weight_numeric?: number;   // e.g., 8
 }
 
+// Response of /api/feedback?since=<version>
+interface FeedbackDelta {
+  version: number;
+  upserts: FeedbackItem[];
+  deleted: number[];
+}
+
+// Response of /api/facets
+interface FacetValue {
+  value: string;
+  label: string;
+  count: number;        // rows matching the other filters plus this value
+  mean: number | null;
+}
+
+interface Facets {
+  total: { count: number; mean: number | null };
+  facets: { hc: FacetValue[]; course: FacetValue[]; term: FacetValue[] };
+}
+
+function facetOption(item: FacetValue) {
+  return { value: item.value, label: `${item.label} (${item.count})` };
+}
+
 // Add new interface for AI summaries
 interface AISummary {
   outcome_name: string;
@@ -63,62 +88,47 @@ export default function FeedbackPlatform() {
   const [minScore, setMinScore]               = useState<number>(1);
   const [maxScore, setMaxScore]               = useState<number>(5);
 
-  const [uniqueHCs, setUniqueHCs]             = useState<string[]>([]);
-  const [uniqueCourses, setUniqueCourses]     = useState<string[]>([]);
-  const [uniqueTerms, setUniqueTerms]         = useState<string[]>([]);
+  // filter options with counts under the current selection, from /api/facets
+  const [facets, setFacets]                   = useState<Facets | null>(null);
 
   const [dbError, setDbError]                 = useState<string>("");
 
   const [aiSummaries, setAiSummaries]         = useState<AISummary[]>([]);
   const [showHCs, setShowHCs]                 = useState(true);
   const [currentSummaryHC, setCurrentSummaryHC] = useState<string>("");
+  // bumped whenever the API reports that a sync published new data
+  const [dataRevision, setDataRevision]       = useState(0);
+  // data version of the rows we hold, so a refresh only downloads what changed
+  const dataVersion = useRef<string | null>(null);
+  const loadedRows  = useRef<FeedbackItem[]>([]);
 
   // ─── Effects: fetch, filter, animations ────────────────────────────────────
 
   useEffect(() => {
     async function fetchData() {
       try {
-        // fetch feedback
-        console.log("Attempting to fetch data from API...");
-        const response = await fetch('http://localhost:5001/api/feedback');
-        if (!response.ok) throw new Error(`HTTP error! Status ${response.status}`);
-        const values = await response.json() as FeedbackItem[];
-
-        // extract uniques for filters
-        const hcs = [...new Set(values.map((item: FeedbackItem) => item.outcome_name))].filter(Boolean);
-
-        const sortedHCs = hcs.sort((a, b) => {
-          // Check if either item is an LO (contains a hyphen and course code)
-          const aIsLO = a.includes('-');
-          const bIsLO = b.includes('-');
-          
-          // If both are HCs or both are LOs, sort alphabetically
-          if ((aIsLO && bIsLO) || (!aIsLO && !bIsLO)) {
-            return a.localeCompare(b);
-          }
-          
-          // If only one is an LO, place HCs first
-          return aIsLO ? 1 : -1;
-        });
-        
-        // Create combined course information (code + title)
-        const coursesMap = new Map<string, string>();
-        values.forEach((item: FeedbackItem) => {
-          if (item.course_code && !coursesMap.has(item.course_code)) {
-            coursesMap.set(item.course_code, `${item.course_code} - ${item.course_title}`);
+        // fetch feedback: only the changes if we already hold a version, everything otherwise
+        let values: FeedbackItem[] | null = null;
+        if (dataVersion.current !== null) {
+          const deltaResponse = await fetch(`http://localhost:5001/api/feedback?since=${dataVersion.current}`);
+          if (deltaResponse.ok) {
+            const delta = await deltaResponse.json() as FeedbackDelta;
+            const changed = new Set([...delta.deleted, ...delta.upserts.map(item => item.assessment_id)]);
+            values = loadedRows.current.filter(item => !changed.has(item.assessment_id)).concat(delta.upserts);
+            dataVersion.current = String(delta.version);
           }
-        });
-
-        const courses = Array.from(coursesMap.keys());
-        const terms = [...new Set(values.map((item: FeedbackItem) => item.term_title))].filter(Boolean);
-
-        console.log("Unique HCs/LOs:", sortedHCs);
-        console.log("Unique Courses:", courses);
-        console.log("Unique Terms:", terms);
-
-        setUniqueHCs(sortedHCs);
-        setUniqueCourses(courses);
-        setUniqueTerms(terms);
+          // anything else (e.g. 410 after a rebuilt database) falls back to a full reload
+        }
+        if (values === null) {
+          console.log("Attempting to fetch data from API...");
+          const response = await fetch('http://localhost:5001/api/feedback');
+          if (!response.ok) throw new Error(`HTTP error! Status ${response.status}`);
+          values = await response.json() as FeedbackItem[];
+          dataVersion.current = response.headers.get('X-Data-Version');
+        }
+        loadedRows.current = values;
+
+        // the filter options come from /api/facets (see below), not from these rows
         setFeedbackData(values);
         setFilteredData(values);
 
@@ -133,9 +143,6 @@ export default function FeedbackPlatform() {
         console.error("Error loading data from API:", error);
         setDbError(`Error loading data: ${String(error)}`);
 
-        setUniqueHCs([]);
-        setUniqueCourses([]);
-        setUniqueTerms([]);
         setFeedbackData([]);
         setFilteredData([]);
 
@@ -143,8 +150,37 @@ export default function FeedbackPlatform() {
       }
     }
     fetchData();
+  }, [dataRevision]);
+
+  // listen for new syncs so the data is refetched only when it actually changed
+  useEffect(() => {
+    const events = new EventSource('http://localhost:5001/api/events');
+    events.addEventListener('data-changed', () => setDataRevision(r => r + 1));
+    return () => events.close();
   }, []);
 
+  // refresh the filter options (and their counts) whenever the selection or the data changes
+  useEffect(() => {
+    const params = new URLSearchParams();
+    selectedHCs.forEach(hc => params.append('hc', hc));
+    selectedCourses.forEach(course => params.append('course', course));
+    selectedTerms.forEach(term => params.append('term', term));
+    params.set('minScore', String(minScore));
+    params.set('maxScore', String(maxScore));
+
+    const controller = new AbortController();
+    fetch(`http://localhost:5001/api/facets?${params.toString()}`, { signal: controller.signal })
+      .then(response => {
+        if (!response.ok) throw new Error(`HTTP error! Status ${response.status}`);
+        return response.json() as Promise<Facets>;
+      })
+      .then(setFacets)
+      .catch(error => {
+        if (error.name !== 'AbortError') console.error("Error loading filter facets:", error);
+      });
+    return () => controller.abort();
+  }, [selectedHCs, selectedCourses, selectedTerms, minScore, maxScore, dataRevision]);
+
   useEffect(() => {
     if (selectedHCs.length > 0) {
       setCurrentSummaryHC(selectedHCs[0]);
@@ -203,26 +239,20 @@ export default function FeedbackPlatform() {
 
   // ─── Handlers ───────────────────────────────────────────────────────────────
   const hcOptions = useMemo(() => 
-    uniqueHCs.map(hc => ({ value: hc, label: hc })),
-    [uniqueHCs]
+    (facets?.facets.hc ?? []).map(facetOption),
+    [facets]
   );
   
   const courseOptions = useMemo(() => 
-    uniqueCourses.map(courseCode => {
-      const courseItem = feedbackData.find(item => item.course_code === courseCode);
-      const displayText = courseItem ? 
-        `${courseCode} - ${courseItem.course_title}` : 
-        courseCode;
-      return { value: courseCode, label: displayText };
-    }),
-    [uniqueCourses, feedbackData]
+    (facets?.facets.course ?? []).map(facetOption),
+    [facets]
   );
   
   const termOptions = useMemo(() => 
-    uniqueTerms.map(term => ({ value: term, label: term })),
-    [uniqueTerms]
+    (facets?.facets.term ?? []).map(facetOption),
+    [facets]
   );
-  
+
   const handleMinScoreChange = (e: React.ChangeEvent<HTMLInputElement>) => {
     const value = Number(e.target.value);
     setMinScore(value >= 1 && value <= maxScore ? value : 1);
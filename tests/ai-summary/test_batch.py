@@ -0,0 +1,117 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add the ai-summary directory to the Python path
+sys.path.append(str(Path(__file__).parent.parent.parent / 'ai-summary'))
+
+from batch import LocalBatchClient, finish_batch, load_state, submit_batch, summary_rows
+
+ANSWER = "Strengths:\nYou demonstrated A\nYour work shows B\n\nAreas for Improvement:\nPractice C\nFocus on D\nStrengthen E"
+
+OUTCOMES = [
+    ("Outcome A", 1, "Description A", "Comment for A", "hash-a"),
+    ("Outcome B", 2, "Description B", "Comment for B", "hash-b"),
+]
+
+def respond(body):
+    """Answer like the chat completions API"""
+    return {"choices": [{"message": {"role": "assistant", "content": ANSWER}}]}
+
+def test_submit_writes_chat_requests(tmp_path):
+    """Test that the batch file holds one chat completion request per outcome"""
+    client = LocalBatchClient(str(tmp_path), respond)
+    state = submit_batch(client, str(tmp_path), OUTCOMES)
+
+    with open(state["input_file"]) as f:
+        requests = [json.loads(line) for line in f]
+    assert [request["custom_id"] for request in requests] == ["outcome-0", "outcome-1"]
+    assert requests[0]["url"] == "/v1/chat/completions"
+    assert "Comment for A" in requests[0]["body"]["messages"][-1]["content"]
+    assert requests[0]["body"]["function_call"] == {"name": "record_summary"}
+    assert load_state(str(tmp_path)) == state
+
+def test_finish_batch_stores_results_and_clears_state(tmp_path):
+    """Test that parsed results are stored in one write and failed requests are counted"""
+    def respond_or_fail(body):
+        if "Comment for B" in body["messages"][-1]["content"]:
+            raise RuntimeError("model overloaded")
+        return respond(body)
+
+    client = LocalBatchClient(str(tmp_path), respond_or_fail)
+    state = submit_batch(client, str(tmp_path), OUTCOMES)
+    stored = []
+
+    written, failed = finish_batch(client, str(tmp_path), state, stored.append, poll_interval=0)
+
+    assert (written, failed) == (1, 1)
+    assert stored == [[("Outcome A", 1, "Description A", "You demonstrated A\nYour work shows B",
+                        "Practice C\nFocus on D\nStrengthen E", "hash-a")]]
+    assert load_state(str(tmp_path)) is None
+
+def test_batch_resumes_after_interruption(tmp_path):
+    """Test that a batch still running when the process stopped is collected by the next run"""
+    class SlowClient(LocalBatchClient):
+        polls = 0
+        def status(self, batch_id):
+            SlowClient.polls += 1
+            return "in_progress" if SlowClient.polls < 3 else super().status(batch_id)
+
+    def crash(seconds):
+        raise KeyboardInterrupt
+
+    client = SlowClient(str(tmp_path), respond)
+    state = submit_batch(client, str(tmp_path), OUTCOMES)
+    with pytest.raises(KeyboardInterrupt):
+        finish_batch(client, str(tmp_path), state, lambda rows: None, poll_interval=0, sleep=crash)
+
+    # A new process finds the batch in the state file instead of submitting again
+    resumed = load_state(str(tmp_path))
+    assert resumed["batch_id"] == state["batch_id"]
+    stored = []
+    written, failed = finish_batch(SlowClient(str(tmp_path), respond), str(tmp_path), resumed, stored.extend,
+                                   poll_interval=0, sleep=lambda seconds: None)
+    assert (written, failed) == (2, 0)
+    assert [row[0] for row in stored] == ["Outcome A", "Outcome B"]
+
+def test_summary_rows_counts_missing_and_unparseable_results():
+    """Test that results without a usable answer, or missing entirely, count as failed"""
+    state = {"summaries": {"outcome-0": ["Outcome A", 1, "Description A", "hash-a"],
+                           "outcome-1": ["Outcome B", 2, "Description B", "hash-b"]}}
+    results = [{"custom_id": "outcome-0", "response": {"status_code": 200,
+                                                       "body": {"choices": [{"message": {"content": "no sections"}}]}}}]
+    rows, failed = summary_rows(state, results)
+    assert rows == []
+    assert failed == 2
+
+def test_summary_rows_reads_function_call_answers():
+    """Test that record_summary arguments in batch results are parsed, repairing them when needed"""
+    state = {"summaries": {"outcome-0": ["Outcome A", 1, "Description A", "hash-a"]}}
+    arguments = '{"strengths": ["You demonstrated A", "Your work shows B"], "improvements": ["Practice C", "Focus on D", "Strengthen E"'
+    message = {"role": "assistant", "content": None, "function_call": {"name": "record_summary", "arguments": arguments}}
+    results = [{"custom_id": "outcome-0", "response": {"status_code": 200, "body": {"choices": [{"message": message}]}}}]
+    rows, failed = summary_rows(state, results)
+    assert rows == [("Outcome A", 1, "Description A", "You demonstrated A\nYour work shows B",
+                     "Practice C\nFocus on D\nStrengthen E", "hash-a")]
+    assert failed == 0
+
+def test_summary_rows_records_usage():
+    """Test that each batch result is recorded in the ledger at the batch price, failures included"""
+    from ledger import UsageLedger, estimate_cost
+    ledger = UsageLedger()
+    ledger.start_run()
+    state = {"summaries": {"outcome-0": ["Outcome A", 1, "Description A", "hash-a"],
+                           "outcome-1": ["Outcome B", 2, "Description B", "hash-b"]}}
+    body = {"model": "gpt-3.5-turbo", "choices": [{"message": {"content": ANSWER}}],
+            "usage": {"prompt_tokens": 1000, "completion_tokens": 200}}
+    results = [{"custom_id": "outcome-0", "response": {"status_code": 200, "body": body}},
+               {"custom_id": "outcome-1", "response": None, "error": {"message": "expired"}}]
+
+    rows, failed = summary_rows(state, results, ledger, discount=0.5)
+
+    assert failed == 1
+    recorded = ledger.drain()
+    assert [(row[1], row[2], row[8]) for row in recorded] == [("Outcome A", "batch", "ok"), ("Outcome B", "batch", "error")]
+    assert recorded[0][9] == estimate_cost("gpt-3.5-turbo", 1000, 200, 0.5)
@@ -8,7 +8,7 @@ from datetime import datetime
 # Add the ai-summary directory to the Python path
 sys.path.append(str(Path(__file__).parent.parent.parent / 'ai-summary'))
 
-from db import create_ai_summaries_table, fetch_grouped_comments, store_summary, fetch_outcome_metadata
+from db import create_ai_summaries_table, fetch_comment_details, fetch_grouped_comments, fetch_partition_comments, fetch_partition_summaries, store_partition_summaries, fetch_input_hashes, store_summary, store_summaries, fetch_outcome_metadata, SummaryWriter, store_run, store_usage, fetch_usage_report
 
 # Test data
 TEST_OUTCOME = "Test Outcome"
@@ -79,7 +79,7 @@ def test_create_ai_summaries_table(test_db, mock_db_path):
     columns = {row[1] for row in cursor.fetchall()}
     expected_columns = {
         'outcome_name', 'outcome_id', 'outcome_description',
-        'strengths_text', 'improvement_text', 'last_updated'
+        'strengths_text', 'improvement_text', 'last_updated', 'input_hash'
     }
     assert columns == expected_columns
 
@@ -103,6 +103,21 @@ def test_fetch_grouped_comments_with_limit(test_db, mock_db_path):
     rows = fetch_grouped_comments(limit=1)
     assert len(rows) == 1
 
+def test_fetch_comment_details(test_db, mock_db_path):
+    """Test fetching each comment with its score and date, and the fallback without those columns"""
+    # The fixture's all_scores has no score or created_on
+    assert fetch_comment_details() == {}
+
+    test_db.execute("ALTER TABLE all_scores ADD COLUMN score REAL")
+    test_db.execute("ALTER TABLE all_scores ADD COLUMN created_on TEXT")
+    test_db.execute("UPDATE all_scores SET score = 3, created_on = '2024-01-02' WHERE comment = 'First comment'")
+    test_db.execute("UPDATE all_scores SET score = 4, created_on = '2024-01-01' WHERE comment = 'Second comment'")
+    test_db.commit()
+
+    assert fetch_comment_details() == {
+        TEST_OUTCOME: [("Second comment", 4, "2024-01-01"), ("First comment", 3, "2024-01-02")],
+    }
+
 def test_store_summary_new(test_db, mock_db_path):
     """Test storing a new summary"""
     create_ai_summaries_table()
@@ -173,4 +188,102 @@ def test_fetch_outcome_metadata_nonexistent(test_db, mock_db_path):
     outcome_id, description = fetch_outcome_metadata("Non-existent Outcome")
     
     assert outcome_id is None
-    assert description is None 
\ No newline at end of file
+    assert description is None
+
+def test_summary_writer_batches(test_db, mock_db_path):
+    """Test that the writer stores queued summaries in batches from its own thread"""
+    create_ai_summaries_table()
+    batches = []
+
+    def write(batch):
+        batches.append(len(batch))
+        store_summaries(batch)
+
+    writer = SummaryWriter(write, batch_size=2)
+    for i in range(5):
+        writer.put((f"Outcome {i}", i, TEST_DESCRIPTION, TEST_STRENGTHS, TEST_IMPROVEMENT, f"hash {i}"))
+    writer.close()
+
+    assert batches == [2, 2, 1]
+    assert writer.written == 5
+    count = test_db.execute("SELECT COUNT(*) FROM all_scores_ai_summaries").fetchone()[0]
+    assert count == 5
+
+    # Writing the same outcome again updates it
+    store_summaries([("Outcome 0", 0, TEST_DESCRIPTION, "Updated Strength", TEST_IMPROVEMENT, "new hash")])
+    row = test_db.execute("SELECT strengths_text FROM all_scores_ai_summaries WHERE outcome_name='Outcome 0'").fetchone()
+    assert row[0] == "Updated Strength"
+
+def test_input_hash_column_added_to_existing_table(test_db, mock_db_path):
+    """Test that a table from before input_hash existed is migrated and its summaries count as stale"""
+    test_db.execute("""
+        CREATE TABLE all_scores_ai_summaries (
+            outcome_name TEXT PRIMARY KEY, outcome_id INTEGER, outcome_description TEXT,
+            strengths_text TEXT, improvement_text TEXT, last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    test_db.execute("INSERT INTO all_scores_ai_summaries (outcome_name) VALUES (?)", (TEST_OUTCOME,))
+    test_db.commit()
+
+    create_ai_summaries_table()
+    assert fetch_input_hashes() == {TEST_OUTCOME: None}
+
+    store_summary(TEST_OUTCOME, TEST_OUTCOME_ID, TEST_DESCRIPTION, TEST_STRENGTHS, TEST_IMPROVEMENT, "abc123")
+    assert fetch_input_hashes() == {TEST_OUTCOME: "abc123"}
+
+
+def test_partition_comments_and_summaries(test_db, mock_db_path):
+    """Test grouping comments per outcome, course and term, and storing partition summaries"""
+    test_db.execute("DROP TABLE all_scores")
+    test_db.execute("""
+        CREATE TABLE all_scores (outcome_name TEXT, course_code TEXT, term_title TEXT, comment TEXT,
+                                 score REAL, created_on TEXT)
+    """)
+    test_db.executemany("INSERT INTO all_scores VALUES (?, ?, ?, ?, ?, ?)", [
+        (TEST_OUTCOME, "CS110", "Fall 2024", "First comment", 3, "2024-10-02"),
+        (TEST_OUTCOME, "CS110", "Fall 2024", "Second comment", 4, "2024-10-01"),
+        (TEST_OUTCOME, "CS111", "Spring 2025", "Third comment", 5, "2025-02-01"),
+        (TEST_OUTCOME, "CS111", "Spring 2025", None, 5, "2025-02-02"),
+    ])
+    test_db.commit()
+
+    assert fetch_partition_comments() == {
+        (TEST_OUTCOME, "CS110", "Fall 2024"): [("Second comment", 4, "2024-10-01"), ("First comment", 3, "2024-10-02")],
+        (TEST_OUTCOME, "CS111", "Spring 2025"): [("Third comment", 5, "2025-02-01")],
+    }
+
+    create_ai_summaries_table()
+    store_partition_summaries([(TEST_OUTCOME, "CS110", "Fall 2024", "S1", "I1", "h1")])
+    store_partition_summaries([(TEST_OUTCOME, "CS110", "Fall 2024", "S2", "I2", "h2"),
+                               (TEST_OUTCOME, "CS111", "Spring 2025", "S3", "I3", "h3")])
+    assert fetch_partition_summaries() == {
+        (TEST_OUTCOME, "CS110", "Fall 2024"): ("S2", "I2", "h2"),
+        (TEST_OUTCOME, "CS111", "Spring 2025"): ("S3", "I3", "h3"),
+    }
+
+def test_usage_report_by_run_and_outcome(mock_db_path):
+    """Test that recorded API usage is totalled per run, with its settings, and per outcome"""
+    create_ai_summaries_table()
+    store_run("run-1", "live", "openai", 4, 2000)
+    store_usage([
+        ("run-1", "#hc1", "summary", "gpt-3.5-turbo", 1000, 200, 900.0, 0, "RateLimitError", 0.0, "2025-01-01 10:00:00"),
+        ("run-1", "#hc1", "summary", "gpt-3.5-turbo", 1000, 200, 1100.0, 1, "ok", 0.0008, "2025-01-01 10:00:30"),
+        ("run-1", "#hc2", "summary", "gpt-3.5-turbo", 500, 100, 700.0, 0, "ok", 0.0004, "2025-01-01 10:01:00"),
+        ("run-2", "#hc2", "batch", "gpt-3.5-turbo", 500, 100, None, 0, "ok", 0.0002, "2025-01-02 10:00:00"),
+    ])
+
+    columns, rows = fetch_usage_report("run")
+    runs = [dict(zip(columns, row)) for row in rows]
+    assert [run["run_id"] for run in runs] == ["run-2", "run-1"]
+    assert runs[1]["workers"] == 4 and runs[1]["mode"] == "live"
+    assert (runs[1]["calls"], runs[1]["failed"], runs[1]["retried"]) == (3, 1, 1)
+    assert runs[1]["prompt_tokens"] == 2500
+    assert runs[1]["max_latency_ms"] == 1100.0
+    assert runs[1]["seconds"] == 60
+    assert runs[0]["workers"] is None
+
+    columns, rows = fetch_usage_report("outcome")
+    assert [(row[0], row[1], row[2]) for row in rows] == [("#hc1", 1, 2), ("#hc2", 2, 2)]
+    columns, rows = fetch_usage_report("outcome", run_id="run-2", limit=5)
+    assert [row[0] for row in rows] == ["#hc2"]
+    assert dict(zip(columns, rows[0]))["cost"] == pytest.approx(0.0002)
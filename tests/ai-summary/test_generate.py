@@ -1,3 +1,5 @@
+import json
+
 import pytest
 from unittest.mock import Mock, patch
 import sys
@@ -7,7 +9,9 @@ from pathlib import Path
 # Add the ai-summary directory to the Python path
 sys.path.append(str(Path(__file__).parent.parent.parent / 'ai-summary'))
 
-from generate import generate_summary_parts
+import generate
+from generate import (generate_summary_parts, input_hash, chunk_comments, condense_comments, parse_answer, repair_json,
+                      ParseStats)
 
 # Sample test data
 SAMPLE_OUTCOME = "Critical Thinking"
@@ -152,4 +156,128 @@ def test_generate_summary_parts_clean_formatting():
     assert "-" not in strengths
     assert "•" not in improvements
     assert "*" not in improvements
-    assert "-" not in improvements 
\ No newline at end of file
+    assert "-" not in improvements
+
+def test_input_hash_tracks_inputs(monkeypatch):
+    """Test that the input hash ignores comment order but changes with any real input"""
+    base = input_hash(SAMPLE_OUTCOME, SAMPLE_DESCRIPTION, "First\nSecond")
+    assert input_hash(SAMPLE_OUTCOME, SAMPLE_DESCRIPTION, "Second\nFirst") == base
+    assert input_hash(SAMPLE_OUTCOME, SAMPLE_DESCRIPTION, "First\nSecond\nThird") != base
+    assert input_hash(SAMPLE_OUTCOME, "Another description", "First\nSecond") != base
+
+    monkeypatch.setattr(generate, "PROMPT_VERSION", generate.PROMPT_VERSION + 1)
+    assert input_hash(SAMPLE_OUTCOME, SAMPLE_DESCRIPTION, "First\nSecond") != base
+
+def test_chunk_comments_keeps_comments_whole():
+    """Test that comments are packed into chunks without splitting them, except oversized ones"""
+    comments = "\n".join(["a" * 40, "b" * 40, "c" * 40, "d" * 150])
+    chunks = chunk_comments(comments, max_chars=100)
+
+    assert chunks[0] == "a" * 40 + "\n" + "b" * 40
+    assert chunks[1] == "c" * 40
+    assert chunks[2:] == ["d" * 100, "d" * 50]
+    assert all(len(chunk) <= 100 for chunk in chunks)
+
+def test_condense_comments_reduces_hierarchically():
+    """Test that notes still too long after one pass are condensed again"""
+    mock_client = Mock()
+    mock_client.ChatCompletion.create.return_value = Mock(
+        choices=[Mock(message=Mock(content="n" * 30))]
+    )
+    calls = []
+
+    def call(request, text):
+        calls.append(len(text))
+        return request()
+
+    comments = "\n".join(["comment " * 10] * 20)  # 20 comments of 80 characters
+    condensed = condense_comments(mock_client, SAMPLE_OUTCOME, SAMPLE_DESCRIPTION, comments, call=call, max_chars=100)
+
+    # 20 chunks -> 20 notes of 30 characters (620 with newlines) -> 7 chunks -> 7 notes (216) -> 3 -> 3 notes (92)
+    assert len(condensed) <= 100
+    assert len(calls) == 20 + 7 + 3
+    assert mock_client.ChatCompletion.create.call_args[1]['max_tokens'] == 400
+
+def test_condense_comments_leaves_short_comments_alone():
+    mock_client = Mock()
+    assert condense_comments(mock_client, SAMPLE_OUTCOME, SAMPLE_DESCRIPTION, SAMPLE_COMMENTS) == SAMPLE_COMMENTS
+    mock_client.ChatCompletion.create.assert_not_called()
+
+
+def function_call_response(arguments):
+    """A chat completion whose answer is a record_summary call"""
+    return Mock(choices=[Mock(message={"role": "assistant", "content": None,
+                                       "function_call": {"name": "record_summary", "arguments": arguments}})])
+
+STRUCTURED_ANSWER = json.dumps({
+    "strengths": ["You demonstrated A", "Your work shows B"],
+    "improvements": ["Practice C", "Focus on D", "Strengthen E"],
+})
+
+def test_generate_summary_parts_requests_structured_output():
+    """Test that the summary is requested as record_summary arguments and read from them"""
+    mock_client = Mock()
+    mock_client.ChatCompletion.create.return_value = function_call_response(STRUCTURED_ANSWER)
+
+    strengths, improvements = generate_summary_parts(mock_client, SAMPLE_OUTCOME, SAMPLE_DESCRIPTION, SAMPLE_COMMENTS)
+
+    call_args = mock_client.ChatCompletion.create.call_args[1]
+    assert call_args['function_call'] == {"name": "record_summary"}
+    assert call_args['functions'][0]['parameters']['required'] == ["strengths", "improvements"]
+    assert strengths == "You demonstrated A\nYour work shows B"
+    assert improvements == "Practice C\nFocus on D\nStrengthen E"
+
+def test_parse_answer_repairs_malformed_arguments():
+    """Test that broken JSON, renamed keys and points sent as one string are repaired locally"""
+    stats = ParseStats()
+    truncated = '```json\n{"strengths": ["You demonstrated A", "Your work shows B",],\n "areas_for_improvement": "- Practice C\n- Focus on D\n- Strengthen E'
+    message = {"function_call": {"name": "record_summary", "arguments": truncated}}
+
+    assert parse_answer(message, stats) == ("You demonstrated A\nYour work shows B", "Practice C\nFocus on D\nStrengthen E")
+    assert stats.counts()["repaired"] == 1
+
+def test_repair_json():
+    """Test the fixes made to JSON before parsing it again"""
+    assert json.loads(repair_json('Here it is: {"a": [1, 2,], "b": "x"} Hope that helps')) == {"a": [1, 2], "b": "x"}
+    assert json.loads(repair_json('{"a": ["one\ntwo", "thr')) == {"a": ["one\ntwo", "thr"]}
+    assert json.loads(repair_json('{"a": [1], "b":')) == {"a": [1], "b": None}
+    with pytest.raises(ValueError):
+        repair_json("no object here")
+
+def test_generate_summary_parts_retries_once_with_the_error():
+    """Test that an unusable answer gets one retry telling the model what was wrong"""
+    mock_client = Mock()
+    mock_client.ChatCompletion.create.side_effect = [
+        function_call_response(json.dumps({"strengths": ["Only one"], "improvements": ["C", "D", "E"]})),
+        function_call_response(STRUCTURED_ANSWER),
+    ]
+    stats = generate.PARSE_STATS.counts()
+
+    strengths, _ = generate_summary_parts(mock_client, SAMPLE_OUTCOME, SAMPLE_DESCRIPTION, SAMPLE_COMMENTS)
+
+    assert strengths == "You demonstrated A\nYour work shows B"
+    assert mock_client.ChatCompletion.create.call_count == 2
+    retry_messages = mock_client.ChatCompletion.create.call_args[1]['messages']
+    assert retry_messages[-2] == {"role": "assistant", "content": json.dumps({"strengths": ["Only one"], "improvements": ["C", "D", "E"]})}
+    assert "Not enough strength points" in retry_messages[-1]['content']
+    assert generate.PARSE_STATS.counts()["retried"] == stats["retried"] + 1
+
+def test_generate_summary_parts_gives_up_after_one_retry():
+    """Test that a second unusable answer raises instead of retrying again"""
+    mock_client = Mock()
+    mock_client.ChatCompletion.create.return_value = function_call_response('{"strengths": []}')
+    failed = generate.PARSE_STATS.counts()["failed"]
+
+    with pytest.raises(ValueError, match="Missing 'improvements'"):
+        generate_summary_parts(mock_client, SAMPLE_OUTCOME, SAMPLE_DESCRIPTION, SAMPLE_COMMENTS)
+    assert mock_client.ChatCompletion.create.call_count == 2
+    assert generate.PARSE_STATS.counts()["failed"] == failed + 1
+
+def test_parse_stats_failure_rate():
+    """Test that answers needing another call count towards the failure rate"""
+    stats = ParseStats()
+    for outcome in ("clean", "clean", "repaired", "retried"):
+        stats.record(outcome)
+    assert stats.failure_rate() == 0.25
+    assert "25.0% needed another call" in stats.report()
+    assert ParseStats().failure_rate() == 0.0
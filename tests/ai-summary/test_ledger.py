@@ -0,0 +1,77 @@
+import sys
+from pathlib import Path
+from unittest.mock import Mock
+
+import pytest
+
+# Add the ai-summary directory to the Python path
+sys.path.append(str(Path(__file__).parent.parent.parent / 'ai-summary'))
+
+from generate import condense_comments
+from ledger import UsageLedger, as_attempt, estimate_cost, for_outcome, request_kind, usage_totals
+
+def test_metered_client_records_each_request():
+    """Test that successful and failed requests are both recorded with their outcome, attempt and latency"""
+    times = iter([10.0, 10.25, 20.0, 20.5])
+    ledger = UsageLedger(clock=lambda: next(times))
+    ledger.start_run()
+    client = Mock()
+    client.ChatCompletion.create.side_effect = [
+        {"choices": [], "usage": {"prompt_tokens": 1000, "completion_tokens": 200}},
+        TimeoutError("too slow"),
+    ]
+    metered = ledger.wrap(client)
+
+    for_outcome("#evidence", lambda: metered.ChatCompletion.create(model="gpt-3.5-turbo", messages=[], functions=[]))
+    with pytest.raises(TimeoutError):
+        for_outcome("#evidence", lambda: as_attempt(1, lambda: metered.ChatCompletion.create(model="gpt-3.5-turbo")))
+
+    ok, failed = ledger.drain()
+    assert ok[:10] == (ledger.run_id, "#evidence", "summary", "gpt-3.5-turbo", 1000, 200, 250.0, 0, "ok",
+                       estimate_cost("gpt-3.5-turbo", 1000, 200))
+    assert failed[1:10] == ("#evidence", "condense", "gpt-3.5-turbo", None, None, 500.0, 1, "TimeoutError", 0.0)
+    assert usage_totals([ok, failed]) == (2, 1, 1000, 200, ok[9])
+    assert ledger.drain() == []
+    # Everything else is the wrapped client's
+    assert metered.File is client.File
+
+def test_estimate_cost_and_request_kind():
+    """Test the price arithmetic and telling summaries, retries and condensing apart"""
+    assert estimate_cost("gpt-3.5-turbo", 2000, 1000) == pytest.approx(0.0025)
+    assert estimate_cost("gpt-3.5-turbo", 2000, 1000, discount=0.5) == pytest.approx(0.00125)
+    assert estimate_cost("unknown-model", 2000, 1000) == 0.0
+    assert request_kind({"functions": [], "messages": [{"role": "user"}]}) == "summary"
+    assert request_kind({"functions": [], "messages": [{"role": "user"}, {"role": "assistant"}]}) == "correction"
+    assert request_kind({"messages": [{"role": "user"}]}) == "condense"
+    assert request_kind({"messages": [{"role": "user"}], "stream": True}) == "summary"
+
+def test_streamed_requests_are_recorded_when_the_stream_ends():
+    """Test that a streamed answer is recorded once consumed, with estimated tokens and its own outcome and attempt"""
+    times = iter([5.0, 7.0])
+    ledger = UsageLedger(clock=lambda: next(times))
+    ledger.start_run("api-job")
+    client = Mock()
+    client.ChatCompletion.create.return_value = iter(
+        [{"choices": [{"delta": {"role": "assistant"}}]}, {"choices": [{"delta": {"content": "x" * 40}}]}])
+
+    chunks = for_outcome("#hc1", lambda: as_attempt(2, lambda: ledger.wrap(client).ChatCompletion.create(
+        model="gpt-3.5-turbo", messages=[{"role": "user", "content": "y" * 400}], stream=True)))
+    assert ledger.drain() == []
+    assert len(list(chunks)) == 2
+
+    [row] = ledger.drain()
+    assert row[:9] == ("api-job", "#hc1", "summary", "gpt-3.5-turbo", 101, 11, 2000.0, 2, "ok")
+
+def test_condensing_threads_keep_the_outcome():
+    """Test that requests made on condense_comments' worker threads are still recorded against the outcome"""
+    ledger = UsageLedger()
+    ledger.start_run()
+    client = Mock()
+    client.ChatCompletion.create.return_value = Mock(choices=[Mock(message=Mock(content="n" * 30))], usage=None)
+
+    for_outcome("#hc1", lambda: condense_comments(ledger.wrap(client), "#hc1", "", "\n".join(["comment " * 10] * 6),
+                                                  max_chars=100))
+
+    rows = ledger.drain()
+    assert len(rows) >= 6
+    assert {(row[1], row[2]) for row in rows} == {("#hc1", "condense")}
@@ -1,3 +1,7 @@
+import json
+from concurrent.futures import wait
+
+import openai
 import pytest
 from unittest.mock import Mock, patch, MagicMock
 import sys
@@ -11,7 +15,8 @@ sys.path.append(str(Path(__file__).parent.parent.parent / 'ai-summary'))
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import main
-from main import create_ai_summaries_table, fetch_grouped_comments, store_summary
+from main import create_ai_summaries_table, fetch_grouped_comments, store_summaries
+from prompt import rollup_text
 
 # Test data
 TEST_OUTCOME = "Test Outcome"
@@ -34,23 +39,33 @@ def mock_db_functions():
     with patch('main.create_ai_summaries_table') as mock_create, \
          patch('main.fetch_grouped_comments') as mock_fetch, \
          patch('main.fetch_outcome_metadata') as mock_metadata, \
-         patch('main.store_summary') as mock_store:
+         patch('main.store_summaries') as mock_store, \
+         patch('main.fetch_input_hashes') as mock_hashes, \
+         patch('main.fetch_comment_details') as mock_details, \
+         patch('main.store_run') as mock_store_run, \
+         patch('main.store_usage') as mock_store_usage:
         
         mock_fetch.return_value = [(TEST_OUTCOME, TEST_COMMENTS)]
+        mock_hashes.return_value = {}
+        mock_details.return_value = {}
         mock_metadata.return_value = (1, "Test Description")
         
         yield {
             'create': mock_create,
             'fetch': mock_fetch,
             'metadata': mock_metadata,
-            'store': mock_store
+            'store': mock_store,
+            'hashes': mock_hashes,
+            'details': mock_details,
+            'store_run': mock_store_run,
+            'store_usage': mock_store_usage
         }
 
 @pytest.fixture
 def mock_openai():
     """Mock OpenAI API"""
     with patch('main.openai') as mock_openai, \
-         patch('main.generate_summary_parts') as mock_generate:
+         patch('summarizers.generate_summary_parts') as mock_generate:
         
         mock_generate.return_value = (TEST_STRENGTHS, TEST_IMPROVEMENT)
         
@@ -97,7 +112,8 @@ def test_main_stores_summaries(mock_db_functions, mock_openai):
         main.main()
     
     mock_db_functions['store'].assert_called_once_with(
-        TEST_OUTCOME, 1, "Test Description", TEST_STRENGTHS, TEST_IMPROVEMENT
+        [(TEST_OUTCOME, 1, "Test Description", TEST_STRENGTHS, TEST_IMPROVEMENT,
+          main.input_hash(TEST_OUTCOME, "Test Description", TEST_COMMENTS))]
     )
 
 def test_main_handles_empty_comments(mock_db_functions, mock_openai):
@@ -111,14 +127,18 @@ def test_main_handles_empty_comments(mock_db_functions, mock_openai):
     mock_db_functions['store'].assert_not_called()
 
 def test_main_handles_long_comments(mock_db_functions, mock_openai):
-    """Test that main skips comments that are too long"""
+    """Test that comments too long for one prompt are condensed in chunks before the final summary"""
     mock_db_functions['fetch'].return_value = [(TEST_OUTCOME, "x" * 13000)]
     
-    with patch('sys.argv', ['main.py']):
+    with patch('sys.argv', ['main.py']), \
+         patch('generate.summarize_chunk', return_value="Chunk notes") as mock_chunk:
         main.main()
     
-    mock_openai['generate'].assert_not_called()
-    mock_db_functions['store'].assert_not_called()
+    # 13,000 characters make two chunks, whose notes feed the final summary
+    assert mock_chunk.call_count == 2
+    mock_openai['generate'].assert_called_once()
+    assert mock_openai['generate'].call_args[0][3] == "Chunk notes\nChunk notes"
+    mock_db_functions['store'].assert_called_once()
 
 def test_main_handles_generation_error(mock_db_functions, mock_openai):
     """Test that main handles errors during summary generation"""
@@ -137,4 +157,221 @@ def test_main_handles_no_rows(mock_db_functions, mock_openai):
         main.main()
     
     mock_openai['generate'].assert_not_called()
-    mock_db_functions['store'].assert_not_called() 
\ No newline at end of file
+    mock_db_functions['store'].assert_not_called()
+
+def test_main_generates_concurrently_and_writes_in_one_batch(mock_db_functions, mock_openai):
+    """Test that outcomes are generated on several workers and stored together"""
+    mock_db_functions['fetch'].return_value = [(f"Outcome {i}", TEST_COMMENTS) for i in range(6)]
+
+    with patch('sys.argv', ['main.py', '--workers', '3']):
+        main.main()
+
+    assert mock_openai['generate'].call_count == 6
+    mock_db_functions['store'].assert_called_once()
+    stored = mock_db_functions['store'].call_args[0][0]
+    assert sorted(row[0] for row in stored) == [f"Outcome {i}" for i in range(6)]
+
+def structured_answer():
+    """A chat completion whose answer is a valid record_summary call"""
+    return Mock(choices=[Mock(message={"function_call": {"name": "record_summary", "arguments": json.dumps({
+        "strengths": ["You demonstrated A", "Your work shows B"], "improvements": ["Practice C", "Focus on D", "Strengthen E"],
+    })}})], usage={"prompt_tokens": 900, "completion_tokens": 100})
+
+def test_main_retries_rate_limited_requests(mock_db_functions, monkeypatch):
+    """Test that a rate-limit error is retried instead of failing the outcome"""
+    monkeypatch.setattr(main, 'RETRY_BASE_DELAY', 0)
+    fake_client = Mock()
+    fake_client.ChatCompletion.create.side_effect = [openai.error.RateLimitError("Slow down"), structured_answer()]
+    monkeypatch.setattr(main, 'client', fake_client)
+
+    with patch('sys.argv', ['main.py']):
+        main.main()
+
+    assert fake_client.ChatCompletion.create.call_count == 2
+    mock_db_functions['store'].assert_called_once()
+
+def test_main_retries_only_the_correction_request(mock_db_functions, monkeypatch):
+    """Test that a rate limit on the retry after a rejected answer doesn't pay for the first request again"""
+    monkeypatch.setattr(main, 'RETRY_BASE_DELAY', 0)
+    rejected = Mock(choices=[Mock(message={"function_call": {"name": "record_summary",
+                                                             "arguments": '{"strengths": ["Only one"]}'}})])
+    fake_client = Mock()
+    fake_client.ChatCompletion.create.side_effect = [rejected, openai.error.RateLimitError("Slow down"),
+                                                     structured_answer()]
+    monkeypatch.setattr(main, 'client', fake_client)
+    acquired = []
+    real_acquire = main.RateLimiter.acquire
+    monkeypatch.setattr(main.RateLimiter, 'acquire', lambda self, tokens=0: acquired.append(tokens) or real_acquire(self, tokens))
+
+    with patch('sys.argv', ['main.py']):
+        main.main()
+
+    sent = [call[1]['messages'] for call in fake_client.ChatCompletion.create.call_args_list]
+    assert [len(messages) for messages in sent] == [2, 4, 4]
+    # Every request, the correction and its retry included, went through the rate limiter
+    assert len(acquired) == 3
+    assert mock_db_functions['store'].call_args[0][0][0][3] == "You demonstrated A\nYour work shows B"
+
+def test_main_skips_unchanged_outcomes(mock_db_functions, mock_openai):
+    """Test that outcomes whose inputs hash the same as their stored summary are not regenerated"""
+    mock_db_functions['fetch'].return_value = [(TEST_OUTCOME, TEST_COMMENTS), ("Changed Outcome", TEST_COMMENTS)]
+    mock_db_functions['hashes'].return_value = {
+        TEST_OUTCOME: main.input_hash(TEST_OUTCOME, "Test Description", TEST_COMMENTS),
+        "Changed Outcome": "hash of older comments",
+    }
+
+    with patch('sys.argv', ['main.py']):
+        main.main()
+
+    mock_openai['generate'].assert_called_once()
+    assert mock_openai['generate'].call_args[0][1] == "Changed Outcome"
+
+    # --force regenerates everything
+    mock_openai['generate'].reset_mock()
+    with patch('sys.argv', ['main.py', '--force']):
+        main.main()
+    assert mock_openai['generate'].call_count == 2
+
+def test_main_sends_budgeted_comments(mock_db_functions, mock_openai):
+    """Test that repeated comments are sent once and the rest trimmed to the prompt budget"""
+    details = [("Great use of evidence.", 5, "2024-01-01")] * 3
+    details += [(f"Comment number {i} about a different part of the argument.", i % 5 + 1, f"2024-02-{i + 1:02d}")
+                for i in range(20)]
+    mock_db_functions['details'].return_value = {TEST_OUTCOME: details}
+
+    with patch('sys.argv', ['main.py', '--prompt-budget', '60']):
+        main.main()
+
+    sent = mock_openai['generate'].call_args[0][3]
+    assert sent.count("Great use of evidence.") == 1
+    assert "(repeated 3 times)" in sent
+    assert len(sent.split("\n")) < 21
+    # The stored hash is of what was actually sent
+    stored = mock_db_functions['store'].call_args[0][0][0]
+    assert stored[5] == main.input_hash(TEST_OUTCOME, "Test Description", sent)
+
+def test_main_batch_mode(mock_db_functions, mock_openai, monkeypatch, tmp_path):
+    """Test that --batch sends every outcome in one batch and stores the results together"""
+    import batch
+    mock_db_functions['fetch'].return_value = [(TEST_OUTCOME, TEST_COMMENTS), ("Second Outcome", TEST_COMMENTS)]
+    answer = "Strengths:\nYou demonstrated A\nYour work shows B\n\nAreas for Improvement:\nPractice C\nFocus on D\nStrengthen E"
+    requests = []
+    def respond(body):
+        requests.append(body)
+        return {"choices": [{"message": {"content": answer}}]}
+    monkeypatch.setattr(main, "BATCH_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "make_batch_client", lambda name, limiter: batch.LocalBatchClient(str(tmp_path), respond))
+
+    with patch('sys.argv', ['main.py', '--batch']):
+        main.main()
+
+    assert len(requests) == 2
+    mock_openai['generate'].assert_not_called()
+    mock_db_functions['store'].assert_called_once()
+    stored = mock_db_functions['store'].call_args[0][0]
+    assert [row[0] for row in stored] == [TEST_OUTCOME, "Second Outcome"]
+    assert stored[0][5] == main.input_hash(TEST_OUTCOME, "Test Description", TEST_COMMENTS)
+    assert batch.load_state(str(tmp_path)) is None
+
+def test_main_extractive_summarizer(mock_db_functions, mock_openai):
+    """Test that --summarizer extractive stores summaries without calling the API"""
+    with patch('sys.argv', ['main.py', '--summarizer', 'extractive']):
+        main.main()
+
+    mock_openai['generate'].assert_not_called()
+    stored = mock_db_functions['store'].call_args[0][0][0]
+    assert stored[0] == TEST_OUTCOME
+    assert len(stored[3].split("\n")) >= 2
+    assert len(stored[4].split("\n")) >= 3
+    # An extractive draft doesn't count as up to date for the model
+    assert stored[5] == main.input_hash(TEST_OUTCOME, "Test Description", TEST_COMMENTS, "extractive")
+    assert stored[5] != main.input_hash(TEST_OUTCOME, "Test Description", TEST_COMMENTS)
+
+def test_main_partitioned_regenerates_only_what_changed(mock_db_functions, mock_openai):
+    """Test that only changed partitions, and the rollups of their outcomes, are regenerated"""
+    partitions = {
+        ("#hc1", "CS110", "Fall 2024"): [("Strong evidence throughout.", 5, "2024-10-01")],
+        ("#hc1", "CS111", "Spring 2025"): [("Needs clearer claims.", 2, "2025-02-01")],
+        ("#hc2", "CS110", "Fall 2024"): [("Good framing of the problem.", 4, "2024-10-02")],
+    }
+    def partition_hash(key):
+        return main.input_hash(key[0], "Test Description", "\n".join(c for c, _, _ in partitions[key]))
+    # #hc1's Spring partition is new; everything about #hc2 is already up to date
+    stored = {key: ("S", "I", partition_hash(key)) for key in partitions if key[2] != "Spring 2025"}
+    after = {**stored, ("#hc1", "CS111", "Spring 2025"): (TEST_STRENGTHS, TEST_IMPROVEMENT, "new")}
+    mock_db_functions['hashes'].return_value = {
+        "#hc1": "older rollup",
+        "#hc2": main.input_hash("#hc2", "Test Description", rollup_text([("CS110", "Fall 2024", "S", "I")])),
+    }
+
+    with patch('sys.argv', ['main.py', '--partitioned']), \
+         patch('main.fetch_partition_comments', return_value=partitions), \
+         patch('main.fetch_partition_summaries', side_effect=[stored, after]), \
+         patch('main.store_partition_summaries') as mock_store_partitions:
+        main.main()
+
+    # One partition, then one rollup built from both of #hc1's partitions
+    assert [call[0][1] for call in mock_openai['generate'].call_args_list] == ["#hc1", "#hc1"]
+    assert mock_store_partitions.call_args[0][0] == [
+        ("#hc1", "CS111", "Spring 2025", TEST_STRENGTHS, TEST_IMPROVEMENT,
+         partition_hash(("#hc1", "CS111", "Spring 2025")))]
+    rollup_input = mock_openai['generate'].call_args_list[1][0][3]
+    assert "CS110 (Fall 2024):" in rollup_input and "CS111 (Spring 2025):" in rollup_input
+    assert rollup_input.index("Fall 2024") < rollup_input.index("Spring 2025")
+    stored_rollups = mock_db_functions['store'].call_args[0][0]
+    assert [row[0] for row in stored_rollups] == ["#hc1"]
+
+def test_main_records_api_usage(mock_db_functions, monkeypatch):
+    """Test that every API request of a run is recorded in the usage ledger, with its outcome and tokens"""
+    monkeypatch.setattr(main, 'RETRY_BASE_DELAY', 0)
+    answer = structured_answer()
+    fake_client = Mock()
+    fake_client.ChatCompletion.create.side_effect = [openai.error.RateLimitError("Slow down"), answer]
+    monkeypatch.setattr(main, 'client', fake_client)
+
+    with patch('sys.argv', ['main.py', '--workers', '2']):
+        main.main()
+
+    run_id, mode, summarizer, workers, budget = mock_db_functions['store_run'].call_args[0]
+    assert (mode, summarizer, workers) == ("live", "openai", 2)
+    rows = mock_db_functions['store_usage'].call_args[0][0]
+    assert [(row[0], row[1], row[2], row[7], row[8]) for row in rows] == [
+        (run_id, TEST_OUTCOME, "summary", 0, "RateLimitError"),
+        (run_id, TEST_OUTCOME, "summary", 1, "ok"),
+    ]
+    assert rows[1][4:6] == (900, 100)
+    assert rows[1][9] == pytest.approx((900 * 0.0005 + 100 * 0.0015) / 1000)
+
+def test_main_records_api_usage_however_the_run_ends(mock_db_functions, monkeypatch, tmp_path):
+    """Test that the usage ledger is stored when a run stops early or is interrupted"""
+    import batch
+    monkeypatch.setattr(main, "BATCH_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "make_batch_client", lambda name, limiter: batch.LocalBatchClient(
+        str(tmp_path), lambda body: {"choices": [{"message": {"content": "Nothing useful"}}]}))
+    batch.submit_batch(main.make_batch_client("local", None), str(tmp_path),
+                       [(TEST_OUTCOME, 1, "Test Description", TEST_COMMENTS, "hash")])
+    # A resumed batch's requests are kept when there is nothing new to summarize afterwards
+    mock_db_functions['fetch'].return_value = []
+
+    with patch('sys.argv', ['main.py', '--batch']):
+        main.main()
+
+    rows = mock_db_functions['store_usage'].call_args[0][0]
+    assert [(row[1], row[2], row[8]) for row in rows] == [(TEST_OUTCOME, "batch", "unparseable")]
+
+    # And a run stopped with Ctrl-C keeps the requests it had already made
+    mock_db_functions['store_usage'].reset_mock()
+    mock_db_functions['fetch'].return_value = [(TEST_OUTCOME, TEST_COMMENTS)]
+    def interrupted(futures):
+        wait(futures)
+        raise KeyboardInterrupt
+    monkeypatch.setattr(main, 'as_completed', interrupted)
+    fake_client = Mock()
+    fake_client.ChatCompletion.create.return_value = structured_answer()
+    monkeypatch.setattr(main, 'client', fake_client)
+
+    with patch('sys.argv', ['main.py']), pytest.raises(KeyboardInterrupt):
+        main.main()
+
+    rows = mock_db_functions['store_usage'].call_args[0][0]
+    assert [(row[1], row[2], row[8]) for row in rows] == [(TEST_OUTCOME, "summary", "ok")]
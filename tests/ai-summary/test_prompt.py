@@ -0,0 +1,56 @@
+import sys
+from pathlib import Path
+
+# Add the ai-summary directory to the Python path
+sys.path.append(str(Path(__file__).parent.parent.parent / 'ai-summary'))
+
+from prompt import Comment, build_prompt_comments, dedupe_comments, select_comments
+from ratelimit import estimate_tokens
+
+def test_dedupe_drops_exact_and_near_duplicates():
+    """Test that copies differing only in case, punctuation or a word or two count as one comment"""
+    comments = [
+        Comment("Clear thesis, well supported by evidence from the readings.", 4, "2024-01-01"),
+        Comment("clear thesis well supported by evidence from the readings", 4, "2024-01-02"),
+        Comment("Clear thesis, very well supported by evidence from the readings.", 4, "2024-01-03"),
+        Comment("Needs more engagement with counterarguments.", 2, "2024-01-04"),
+    ]
+    counted = dedupe_comments(comments)
+
+    assert len(counted) == 2
+    counts = {comment.text: count for comment, count in counted}
+    # The most recent copy is the one kept
+    assert counts["Clear thesis, very well supported by evidence from the readings."] == 3
+    assert counts["Needs more engagement with counterarguments."] == 1
+
+def test_select_covers_every_score_within_budget():
+    """Test that a lopsided score distribution still yields comments from every score level"""
+    counted = [(Comment(f"Strong work on part {i} of the assignment.", 5, f"2024-01-{i + 1:02d}"), 1) for i in range(30)]
+    counted += [(Comment("Missed the point of the prompt entirely.", 1, "2024-01-15"), 1)]
+    counted += [(Comment("Partly correct but the reasoning is thin.", 3, "2024-01-16"), 1)]
+
+    selected = select_comments(counted, budget_tokens=40)
+
+    assert {comment.score for comment, _ in selected} == {1, 3, 5}
+    assert sum(estimate_tokens(comment.text) for comment, _ in selected) <= 40
+    # Within a score level the most recent comments come first
+    fives = [comment for comment, _ in selected if comment.score == 5]
+    assert fives[0].created_on == "2024-01-30"
+
+def test_build_prompt_comments_reports_savings():
+    """Test that the prompt block is smaller than the raw comments and listed oldest first"""
+    comments = [Comment("Good structure.", 4, "2024-03-01")] * 10 + [Comment("Cite your sources.", 2, "2024-02-01")]
+    selection = build_prompt_comments(comments, budget_tokens=100)
+
+    assert selection.text == "Cite your sources.\nGood structure. (repeated 10 times)"
+    assert selection.total == 11
+    assert selection.distinct == selection.selected == 2
+    assert selection.tokens < selection.original_tokens
+
+def test_build_prompt_comments_without_budget_keeps_every_distinct_comment():
+    """Test that a budget of 0 only removes duplicates"""
+    comments = [Comment(f"Distinct remark {word}.") for word in ("alpha", "bravo", "charlie", "delta")]
+    selection = build_prompt_comments(comments, budget_tokens=0)
+
+    assert selection.selected == 4
+    assert selection.text.split("\n")[0] == "Distinct remark alpha."
@@ -0,0 +1,81 @@
+import openai
+import pytest
+import sys
+from pathlib import Path
+
+# Add the ai-summary directory to the Python path
+sys.path.append(str(Path(__file__).parent.parent.parent / 'ai-summary'))
+
+from ratelimit import RateLimiter, call_with_retry, estimate_tokens
+
+
+class FakeClock:
+    """Time that only moves when someone sleeps."""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("x" * 400) == 101
+    assert estimate_tokens(None) == 1
+
+def test_limiter_enforces_requests_per_minute():
+    """Test that a burst is allowed up to the quota and then spread out"""
+    clock = FakeClock()
+    limiter = RateLimiter(rpm=60, tpm=1_000_000, clock=clock, sleep=clock.sleep)
+    for _ in range(60):
+        limiter.acquire()
+    assert clock.now == 0
+
+    limiter.acquire()
+    assert clock.now == pytest.approx(1.0, abs=0.02)
+
+def test_limiter_enforces_tokens_per_minute():
+    """Test that large requests wait for the token bucket to refill"""
+    clock = FakeClock()
+    limiter = RateLimiter(rpm=1000, tpm=6000, clock=clock, sleep=clock.sleep)
+    limiter.acquire(5000)
+    limiter.acquire(3000)
+    # 2,000 tokens were missing at 100 tokens per second
+    assert clock.now == pytest.approx(20.0, abs=0.1)
+
+def test_back_off_pauses_every_caller():
+    clock = FakeClock()
+    limiter = RateLimiter(rpm=1000, tpm=100_000, clock=clock, sleep=clock.sleep)
+    limiter.back_off(5)
+    limiter.acquire()
+    assert clock.now >= 5
+
+def test_call_with_retry_retries_rate_limits():
+    """Test that rate-limit errors are retried and other errors are not"""
+    calls = []
+    delays = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise openai.error.RateLimitError("Slow down")
+        return "ok"
+
+    assert call_with_retry(flaky, sleep=delays.append, base_delay=1) == "ok"
+    assert len(calls) == 3
+    assert len(delays) == 2 and delays[1] > delays[0] * 0.5
+
+    def broken():
+        raise ValueError("bad response")
+
+    with pytest.raises(ValueError):
+        call_with_retry(broken, sleep=delays.append)
+
+def test_call_with_retry_gives_up():
+    def always_limited():
+        raise openai.error.RateLimitError("Slow down")
+
+    with pytest.raises(openai.error.RateLimitError):
+        call_with_retry(always_limited, retries=2, sleep=lambda seconds: None)
@@ -0,0 +1,101 @@
+import sys
+from pathlib import Path
+from unittest.mock import Mock
+
+import numpy as np
+
+# Add the ai-summary directory to the Python path
+sys.path.append(str(Path(__file__).parent.parent.parent / 'ai-summary'))
+
+from generate import parse_summary
+from summarizers import ExtractiveSummarizer, OpenAISummarizer, split_sentences, textrank, tfidf_matrix
+
+COMMENTS = "\n".join([
+    "Excellent use of evidence from the readings to support your claim. Your thesis is clear and compelling.",
+    "You should address counterarguments before concluding. The conclusion is not supported by the analysis.",
+    "Great use of evidence from the readings to support the claim. (repeated 3 times)",
+    "The framing needs more precision; consider defining your key terms up front.",
+    "Strong structure overall, with effective transitions between sections.",
+    "Citations are missing for several statistics in the second section.",
+])
+
+def test_split_sentences_weights_repeated_comments():
+    """Test that comments are split into sentences and repeat markers become weights"""
+    sentences, weights = split_sentences(COMMENTS)
+
+    assert "Your thesis is clear and compelling." in sentences
+    assert "Great use of evidence from the readings to support the claim." in sentences
+    assert weights[sentences.index("Great use of evidence from the readings to support the claim.")] == 3
+
+def test_textrank_favours_central_and_repeated_sentences():
+    """Test that a sentence similar to the others, or given more often, ranks higher"""
+    sentences = ["evidence supports the claim well", "evidence supports the argument", "transitions are abrupt here"]
+    matrix = tfidf_matrix(sentences)
+    rank = textrank(matrix @ matrix.T, np.ones(3))
+    assert rank[2] < rank[0]
+    assert np.isclose(rank.sum(), 1.0)
+
+    heavy = textrank(matrix @ matrix.T, np.array([1.0, 1.0, 10.0]))
+    assert heavy[2] > rank[2]
+
+def test_extractive_summary_fills_both_sections():
+    """Test that strengths and improvements are drawn from the matching comments, without repeats"""
+    strengths, improvement = ExtractiveSummarizer().summarize("#evidence", "Use evidence well", COMMENTS)
+
+    strength_lines = strengths.split("\n")
+    improvement_lines = improvement.split("\n")
+    assert 2 <= len(strength_lines) <= 4
+    assert 3 <= len(improvement_lines) <= 4
+    assert any("evidence from the readings" in line for line in strength_lines)
+    # The two near-identical evidence comments are only used once
+    assert sum("evidence from the readings" in line for line in strength_lines) == 1
+    assert any("counterarguments" in line for line in improvement_lines)
+    assert not any("counterarguments" in line for line in strength_lines)
+    # Same structure the model is asked for
+    assert parse_summary(f"Strengths:\n{strengths}\n\nAreas for Improvement:\n{improvement}") == (strengths, improvement)
+
+def test_extractive_summary_without_comments_still_has_every_section():
+    """Test that too little feedback is padded so the summary keeps its minimum points"""
+    strengths, improvement = ExtractiveSummarizer().summarize("#evidence", "", "Ok.")
+    assert len(strengths.split("\n")) == 2
+    assert len(improvement.split("\n")) == 3
+    assert "#evidence" in strengths
+
+def test_openai_summarizer_condenses_long_comments():
+    """Test that the OpenAI summarizer sends long comments through chunked condensing via its call wrapper"""
+    calls = []
+    def call(request, text, max_tokens):
+        calls.append(max_tokens)
+        return request()
+
+    client = Mock()
+    client.ChatCompletion.create.return_value.choices = [
+        Mock(message=Mock(content="Strengths:\nA\nB\nAreas for Improvement:\nC\nD\nE"))]
+    summarizer = OpenAISummarizer(client, call)
+
+    assert summarizer.summarize("#evidence", "", "short") == ("A\nB", "C\nD\nE")
+    assert calls == [800]
+
+    calls.clear()
+    summarizer.summarize("#evidence", "", "x" * 13000)
+    assert calls == [400, 400, 800]
+
+def test_extractive_rollup_keeps_points_shared_by_partitions_once():
+    """Test that a rollup merges partition summaries without repeating a point"""
+    partitions = [
+        ("CS110", "Fall 2024", "Your instructors noted: Strong use of evidence from the readings.\n"
+                               "Your instructors noted: Clear structure in every paper.",
+         "Focus on this feedback: Address counterarguments before concluding.\n"
+         "Focus on this feedback: Define key terms early.\nFocus on this feedback: Cite every statistic."),
+        ("CS111", "Spring 2025", "Your instructors noted: Strong use of evidence from the readings.\n"
+                                 "Your instructors noted: Creative framing of the problem.",
+         "Focus on this feedback: Address counterarguments before concluding.\n"
+         "Focus on this feedback: Quantify the tradeoffs."),
+    ]
+    strengths, improvement = ExtractiveSummarizer().rollup("#evidence", "", partitions)
+
+    strength_lines = strengths.split("\n")
+    assert strength_lines.count("Your instructors noted: Strong use of evidence from the readings.") == 1
+    assert len(strength_lines) == 3
+    assert sum("counterarguments" in line for line in improvement.split("\n")) == 1
+    assert 3 <= len(improvement.split("\n")) <= 4
@@ -7,6 +7,8 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..',
 import io
 import csv
 import sqlite3
+import threading
+import time
 import pytest
 
 # Import the entire module; we need it for the Flask instance and for patching get_db_connection
@@ -59,6 +61,7 @@ def fake_get_db_connection_success_feedback():
     # Fake rows for /api/feedback endpoint.
     fake_rows = [
         {
+            'assessment_id': 1,
             'score': '4.0',
             'weight': '8x',
             'comment': 'Great job',
@@ -67,9 +70,11 @@ def fake_get_db_connection_success_feedback():
             'course_title': 'Course 101',
             'course_code': 'C101',
             'term_title': 'Fall 2021',
-            'created_on': '2021-09-01'
+            'created_on': '2021-09-01',
+            'forum_link': 'https://forum.minerva.edu/app/assignments/1'
         },
         {
+            'assessment_id': 2,
             'score': None,
             'weight': None,
             'comment': None,
@@ -78,7 +83,8 @@ def fake_get_db_connection_success_feedback():
             'course_title': None,
             'course_code': None,
             'term_title': None,
-            'created_on': None
+            'created_on': None,
+            'forum_link': None
         }
     ]
     fake_cursor = FakeCursor(rows=fake_rows, fail_on_all_scores=False)
@@ -100,7 +106,8 @@ def fake_get_db_connection_export():
         'course_title': 'Course Export',
         'course_code': 'CExport',
         'term_title': 'Winter 2022',
-        'created_on': '2022-01-15'
+        'created_on': '2022-01-15',
+        'forum_link': 'https://forum.minerva.edu/app/assignments/2'
     }]
     fake_cursor = FakeCursor(rows=fake_rows, fail_on_all_scores=False)
     return FakeConnection(fake_cursor)
@@ -108,6 +115,7 @@ def fake_get_db_connection_export():
 def fake_get_db_connection_export_all():
     # Fake row for testing /api/export-all endpoint.
     fake_rows = [{
+        'assessment_id': 3,
         'score': 3.2,
         'weight': '5x',
         'comment': 'Average',
@@ -116,13 +124,21 @@ def fake_get_db_connection_export_all():
         'course_title': 'Course All',
         'course_code': 'CAll',
         'term_title': 'Spring 2022',
-        'created_on': '2022-03-10'
+        'created_on': '2022-03-10',
+        'forum_link': 'https://forum.minerva.edu/app/assignments/3'
     }]
     fake_cursor = FakeCursor(rows=fake_rows, fail_on_all_scores=False)
     return FakeConnection(fake_cursor)
 
 # --- Fixtures for Different Endpoints ---
 
+@pytest.fixture(autouse=True)
+def empty_result_cache():
+    # Each test swaps in its own fake data, so nothing may be served from a previous test
+    backend_app.result_cache.clear()
+    yield
+    backend_app.result_cache.clear()
+
 @pytest.fixture
 def client_feedback(monkeypatch):
     # Override the top-level function in the module using a string target
@@ -192,18 +208,23 @@ def test_export_data(client_export):
 
     expected_header = [
         'Outcome Name', 'Score', 'Comment', 'Weight',
-        'Assignment Title', 'Course Code', 'Course Title', 'Term Title'
+        'Assignment Title', 'Course Code', 'Course Title', 'Term Title', 'Forum Link'
     ]
     # Check CSV header.
     assert rows[0] == expected_header
 
     expected_row = [
         'Outcome Export', '4.5', 'Well done', '10x',
-        'Export Assignment', 'CExport', 'Course Export', 'Winter 2022'
+        'Export Assignment', 'CExport', 'Course Export', 'Winter 2022',
+        'https://forum.minerva.edu/app/assignments/2'
     ]
     # Check CSV data row.
     assert rows[1] == expected_row
 
+    response = client_export.get("/api/export?minScore=abc")
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'minScore and maxScore must be numbers'}
+
 def test_export_all_data(client_export_all):
     response = client_export_all.get("/api/export-all")
     assert response.status_code == 200
@@ -218,12 +239,457 @@ def test_export_all_data(client_export_all):
 
     expected_header = [
         'Score', 'Weight', 'Comment', 'Outcome Name', 'Assignment Title',
-        'Course Title', 'Course Code', 'Term Title', 'Created On'
+        'Course Title', 'Course Code', 'Term Title', 'Created On', 'Forum Link'
     ]
     assert rows[0] == expected_header
 
     expected_row = [
         '3.2', '5x', 'Average', 'Outcome All', 'All Assignment',
-        'Course All', 'CAll', 'Spring 2022', '2022-03-10'
+        'Course All', 'CAll', 'Spring 2022', '2022-03-10',
+        'https://forum.minerva.edu/app/assignments/3'
     ]
     assert rows[1] == expected_row
+
+def test_metrics_endpoint(client_feedback):
+    client_feedback.get("/api/feedback")
+    response = client_feedback.get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+
+    text = response.data.decode('utf-8')
+    assert 'http_requests_total{route="/api/feedback",method="GET",status="200"}' in text
+    assert 'db_query_duration_seconds_count{query="feedback"}' in text
+    assert 'db_query_rows_bucket{query="feedback",le="10"}' in text
+
+def test_query_timeout_returns_504(monkeypatch):
+    class TimingOutCursor(FakeCursor):
+        def execute(self, query, params=None):
+            raise backend_app.queries.QueryTimeout("Query exceeded the 30s time limit")
+
+    monkeypatch.setattr("backend.app.get_db_connection", lambda: FakeConnection(TimingOutCursor(rows=[])))
+    backend_app.app.config['TESTING'] = True
+    with backend_app.app.test_client() as client:
+        response = client.get("/api/export?hc=Outcome+Export")
+        assert response.status_code == 504
+        assert "time limit" in response.get_json()['error']
+
+def test_cached_query_followers_do_not_inherit_the_leaders_timeout(monkeypatch):
+    calls = []
+    leader_errors = []
+
+    class LeaderTimingOutCursor(FakeCursor):
+        def execute(self, query, params=None):
+            calls.append(query)
+            if len(calls) == 1:
+                # Time out the leader once the follower is waiting on it
+                while backend_app.inflight_queries.stats()["followers"] == followers:
+                    time.sleep(0.01)
+                deadline = backend_app.queries.current_deadline()
+                deadline.reason = backend_app.queries.QueryTimeout("Query exceeded the 0.1s time limit")
+                raise deadline.reason
+            super().execute(query, params)
+
+    def lead():
+        backend_app.queries.set_deadline(backend_app.queries.Deadline(30))
+        try:
+            backend_app.cached_query("leader_timeout", "SELECT * FROM all_scores", (), len)
+        except backend_app.queries.QueryTimeout as e:
+            leader_errors.append(e)
+
+    followers = backend_app.inflight_queries.stats()["followers"]
+    cursor = LeaderTimingOutCursor(rows=[{}, {}])
+    monkeypatch.setattr("backend.app.get_db_connection", lambda: FakeConnection(cursor))
+    monkeypatch.setattr("backend.app.data_version", lambda path: None)
+    leader = threading.Thread(target=lead)
+    leader.start()
+    while backend_app.inflight_queries.in_flight() == 0:
+        time.sleep(0.01)
+    # The follower runs the query again under its own deadline instead of failing with the leader
+    assert backend_app.cached_query("leader_timeout", "SELECT * FROM all_scores", (), len) == 2
+    leader.join()
+    assert len(leader_errors) == 1
+    assert len(calls) == 2
+
+def test_feedback_served_from_cache_until_data_changes(monkeypatch):
+    executed = []
+
+    class CountingCursor(FakeCursor):
+        def execute(self, query, params=None):
+            if "FROM all_scores" in query:
+                executed.append(query)
+            super().execute(query, params)
+
+    def fake_connection():
+        rows = fake_get_db_connection_success_feedback()._cursor.rows
+        return FakeConnection(CountingCursor(rows=rows))
+
+    version = {"value": (1, 1, 1)}
+    before = backend_app.result_cache.stats()
+    monkeypatch.setattr("backend.app.get_db_connection", fake_connection)
+    monkeypatch.setattr("backend.app.data_version", lambda path: version["value"])
+    backend_app.app.config['TESTING'] = True
+    with backend_app.app.test_client() as client:
+        first = client.get("/api/feedback")
+        second = client.get("/api/feedback")
+        assert first.get_json() == second.get_json()
+        assert len(executed) == 1
+
+        # A new data version (e.g. after a sync) must bypass the cached copy
+        version["value"] = (1, 2, 1)
+        client.get("/api/feedback")
+        assert len(executed) == 2
+
+    # Each request also looks up the sync version for X-Data-Version, through the same cache
+    stats = backend_app.result_cache.stats()
+    assert stats["hits"] - before["hits"] == 2
+    assert stats["misses"] - before["misses"] == 4
+
+def test_feedback_and_export_all_cache_their_own_bodies(monkeypatch):
+    """Both run FEEDBACK_QUERY; each must get its own format back from the cache, in either order"""
+    monkeypatch.setattr("backend.app.get_db_connection", fake_get_db_connection_export_all)
+    monkeypatch.setattr("backend.app.data_version", lambda path: (7, 7, 7))
+    backend_app.app.config['TESTING'] = True
+
+    def check(client, url):
+        response = client.get(url)
+        if url == "/api/feedback":
+            assert response.mimetype == "application/json"
+            assert response.get_json()[0]['outcome_name'] == 'Outcome All'
+        else:
+            assert response.mimetype == "text/csv"
+            rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+            assert 'Outcome All' in rows[1]
+
+    with backend_app.app.test_client() as client:
+        for order in (["/api/feedback", "/api/export-all"], ["/api/export-all", "/api/feedback"]):
+            backend_app.result_cache.clear()
+            # The second pass through each order is served from the cache
+            for url in order * 2:
+                check(client, url)
+
+def test_unhandled_exception_counts_as_one_error(monkeypatch):
+    def broken_connection():
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr("backend.app.get_db_connection", broken_connection)
+    monkeypatch.setattr("backend.app.data_version", lambda path: None)
+    monkeypatch.setitem(backend_app.app.config, 'TESTING', False)
+    monkeypatch.setitem(backend_app.app.config, 'PROPAGATE_EXCEPTIONS', False)
+    before = backend_app.metrics.HTTP_ERRORS.value(route="/api/feedback")
+    with backend_app.app.test_client() as client:
+        assert client.get("/api/feedback").status_code == 500
+    assert backend_app.metrics.HTTP_ERRORS.value(route="/api/feedback") - before == 1
+
+def test_events_stream_starts_with_current_version(monkeypatch):
+    monkeypatch.setattr("backend.app.get_db_connection",
+                        lambda: FakeConnection(FakeCursor([])))
+    backend_app.app.config['TESTING'] = True
+    with backend_app.app.test_client() as client:
+        response = client.get("/api/events", buffered=False)
+        assert response.status_code == 200
+        assert response.mimetype == "text/event-stream"
+        chunks = iter(response.response)
+        assert next(chunks).startswith(b"retry:")
+        first_event = next(chunks).decode()
+        assert first_event.startswith("event: data-version\n")
+        assert '"version": null' in first_event
+        response.close()
+    assert backend_app.event_hub.subscriber_count() == 0
+
+def test_event_streams_that_are_never_read_release_their_slot(monkeypatch):
+    """HEAD requests never iterate the body; they must not use up the stream limit"""
+    monkeypatch.setattr("backend.app.get_db_connection",
+                        lambda: FakeConnection(FakeCursor([])))
+    backend_app.app.config['TESTING'] = True
+    with backend_app.app.test_client() as client:
+        for _ in range(backend_app.event_hub.max_subscribers + 2):
+            response = client.head("/api/events")
+            assert response.status_code == 200
+            # What a WSGI server does with every response, whether or not it sent a body
+            response.close()
+        assert backend_app.event_hub.subscriber_count() == 0
+        response = client.get("/api/events", buffered=False)
+        assert response.status_code == 200
+        response.close()
+    assert backend_app.event_hub.subscriber_count() == 0
+
+@pytest.fixture
+def synced_db(tmp_path, monkeypatch):
+    """A real database that has been through two syncs, served through a pool."""
+    backend_dir = os.path.join(os.path.dirname(__file__), '..', '..', 'backend')
+    path = str(tmp_path / "data.db")
+    conn = sqlite3.connect(path)
+    with open(os.path.join(backend_dir, "schema.sql")) as f:
+        conn.executescript(f.read())
+    with open(os.path.join(backend_dir, "views.sql")) as f:
+        conn.executescript(f.read())
+    conn.execute("INSERT INTO colleges VALUES (1, 'CS', 'Computational Sciences', NULL)")
+    conn.execute("INSERT INTO terms VALUES (1, 'Fall 2024', NULL)")
+    conn.execute("INSERT INTO courses VALUES (1, 'Course', 'CS110', 1, 1, 'active', NULL)")
+    conn.execute("INSERT INTO courses VALUES (2, 'Other course', 'CS111', 1, 1, 'active', NULL)")
+    conn.execute("INSERT INTO learning_outcomes VALUES (1, 1, 'desc', '#hc1', NULL)")
+    conn.execute("INSERT INTO learning_outcomes VALUES (2, 2, 'desc', '#hc2', NULL)")
+    conn.execute("INSERT INTO learning_outcomes VALUES (3, 2, 'desc', 'CS111-lo1', NULL)")
+
+    def sync(statements):
+        for sql in statements:
+            conn.execute(sql)
+        conn.execute("INSERT INTO sync_runs (version) SELECT COALESCE(MAX(version), 0) + 1 FROM sync_runs")
+        conn.commit()
+
+    sync(["INSERT INTO outcome_assessments (assessment_id, outcome_id, score, type) VALUES (%d, 1, 3, 'class')" % i
+          for i in (1, 2, 3)])
+    sync([
+        "UPDATE outcome_assessments SET score = 5 WHERE assessment_id = 1",
+        "DELETE FROM outcome_assessments WHERE assessment_id = 2",
+        "INSERT INTO outcome_assessments (assessment_id, outcome_id, score, type) VALUES (4, 1, 2, 'class')",
+        "INSERT INTO outcome_assessments (assessment_id, outcome_id, score, type) VALUES (5, 2, 4, 'class')",
+        "INSERT INTO outcome_assessments (assessment_id, outcome_id, score, type) VALUES (6, 3, 4, 'class')",
+    ])
+    # Ingestion recreates the views (and score_cube) once the data is in
+    with open(os.path.join(backend_dir, "views.sql")) as f:
+        conn.executescript(f.read())
+    conn.close()
+
+    monkeypatch.setattr(backend_app, "db_path", path)
+    monkeypatch.setattr(backend_app, "db_pool", backend_app.ConnectionPool(path, size=2))
+    monkeypatch.setattr(backend_app, "columns_dir", str(tmp_path / "columns"))
+    monkeypatch.setattr(backend_app, "grade_engines", backend_app.EngineCache(backend_app.load_grade_arrays))
+    backend_app.app.config['TESTING'] = True
+    with backend_app.app.test_client() as client:
+        yield client
+    backend_app.db_pool.close_all()
+
+def test_feedback_reports_data_version(synced_db):
+    response = synced_db.get("/api/feedback")
+    assert response.headers["X-Data-Version"] == "2"
+    assert sorted(item['assessment_id'] for item in response.get_json()) == [1, 3, 4, 5, 6]
+
+def test_feedback_since_returns_only_changes(synced_db):
+    delta = synced_db.get("/api/feedback?since=1").get_json()
+    assert delta['version'] == 2
+    assert delta['deleted'] == [2]
+    upserts = {item['assessment_id']: item['score'] for item in delta['upserts']}
+    assert upserts == {1: 5.0, 4: 2.0, 5: 4.0, 6: 4.0}
+
+    # Nothing changed since the current version
+    assert synced_db.get("/api/feedback?since=2").get_json()['upserts'] == []
+
+def test_feedback_since_unknown_version(synced_db):
+    assert synced_db.get("/api/feedback?since=7").status_code == 410
+    assert synced_db.get("/api/feedback?since=0").status_code == 410
+    assert synced_db.get("/api/feedback?since=abc").status_code == 400
+
+def test_export_job_round_trip(synced_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(backend_app, "export_pool", backend_app.db_pool)
+    monkeypatch.setattr(backend_app.export_manager, "directory", str(tmp_path / "exports"))
+
+    response = synced_db.post("/api/exports", json={"format": "csv", "minScore": 3})
+    assert response.status_code in (200, 202)
+    job_id = response.get_json()['id']
+
+    for _ in range(500):
+        status = synced_db.get(f"/api/exports/{job_id}").get_json()
+        if status['state'] not in ('queued', 'running'):
+            break
+        time.sleep(0.01)
+    assert status['state'] == 'done'
+    assert status['rows_written'] == status['total_rows'] == 4
+
+    download = synced_db.get(status['download_url'])
+    rows = list(csv.reader(io.StringIO(download.data.decode())))
+    assert rows[0][:2] == ['Score', 'Weight']
+    assert sorted(row[0] for row in rows[1:]) == ['3.0', '4.0', '4.0', '5.0']
+    # The file is pinned while it is sent and released once the response is closed
+    assert backend_app.export_manager.get(job_id).downloads == 1
+    download.close()
+    assert backend_app.export_manager.get(job_id).downloads == 0
+
+    # The same request against the same data is answered by the finished job
+    again = synced_db.post("/api/exports", json={"format": "csv", "minScore": 3})
+    assert again.status_code == 200
+    assert again.get_json()['id'] == job_id
+
+def test_export_job_rejects_unknown_format(client_feedback):
+    assert client_feedback.post("/api/exports", json={"format": "xlsx"}).status_code == 400
+    for body in ([1, 2], {"format": ["csv"]}, {"format": "csv", "hc": ["a"]}, {"format": "csv", "term": {}},
+                 {"format": "csv", "minScore": [3]}):
+        assert client_feedback.post("/api/exports", json=body).status_code == 400
+    assert client_feedback.get("/api/exports/nope").status_code == 404
+
+def test_facets_count_under_other_filters(synced_db):
+    facets = synced_db.get("/api/facets?course=CS110&minScore=3").get_json()
+    # Scores 5 and 3 in CS110 pass the filters
+    assert facets['total'] == {'count': 2, 'mean': 4.0}
+
+    hcs = {item['value']: item['count'] for item in facets['facets']['hc']}
+    assert hcs == {'#hc1': 2, '#hc2': 0, 'CS111-lo1': 0}
+    assert [item['value'] for item in facets['facets']['hc']] == ['#hc1', '#hc2', 'CS111-lo1']
+
+    # The course facet ignores the course selection, so CS111 still shows what selecting it would add
+    courses = {item['value']: (item['count'], item['label']) for item in facets['facets']['course']}
+    assert courses == {'CS110': (2, 'CS110 - Course'), 'CS111': (2, 'CS111 - Other course')}
+
+def test_facets_without_score_cube(synced_db):
+    conn = sqlite3.connect(backend_app.db_path)
+    conn.execute("DROP TABLE score_cube")
+    conn.commit()
+    conn.close()
+
+    facets = synced_db.get("/api/facets?hc=%23hc2&hc=CS111-lo1").get_json()
+    assert facets['total']['count'] == 2
+    assert {item['value']: item['count'] for item in facets['facets']['term']} == {'Fall 2024': 2}
+
+def test_rankings_top_bottom_and_pages(synced_db):
+    ranking = synced_db.get("/api/rankings?k=1&order=asc&limit=2").get_json()
+    # Means: #hc2 4.0 and CS111-lo1 4.0 (ties broken by name), #hc1 (5 + 3 + 2) / 3
+    assert ranking['total'] == 3
+    assert [item['outcome_name'] for item in ranking['top']] == ['#hc2']
+    assert [item['outcome_name'] for item in ranking['bottom']] == ['#hc1']
+    assert [(item['rank'], item['outcome_name']) for item in ranking['items']] == [(3, '#hc1'), (2, 'CS111-lo1')]
+    assert ranking['next_offset'] == 2
+
+    last_page = synced_db.get("/api/rankings?order=asc&limit=2&offset=2").get_json()
+    assert [item['outcome_name'] for item in last_page['items']] == ['#hc2']
+    assert last_page['next_offset'] is None
+
+def test_rankings_by_count_under_filters(synced_db):
+    ranking = synced_db.get("/api/rankings?metric=count&type=hc&minScore=3").get_json()
+    assert [(item['outcome_name'], item['count']) for item in ranking['items']] == [('#hc1', 2), ('#hc2', 1)]
+    assert all(item['is_hc'] for item in ranking['items'])
+    assert synced_db.get("/api/rankings?metric=median").status_code == 400
+
+def test_rankings_and_grades_agree_on_missing_scores(synced_db):
+    conn = sqlite3.connect(backend_app.db_path)
+    conn.execute("INSERT INTO outcome_assessments (assessment_id, outcome_id, score, type) VALUES (7, 2, NULL, 'class')")
+    with open(os.path.join(os.path.dirname(__file__), '..', '..', 'backend', 'views.sql')) as f:
+        conn.executescript(f.read())
+    conn.close()
+
+    for query in ("", "&minScore=3", "&course=CS111"):
+        ranking = synced_db.get(f"/api/rankings?limit=200{query}").get_json()
+        grades = synced_db.get(f"/api/grades?by=hc,lo{query}").get_json()
+        ranked = {item['outcome_name']: (item['count'], item['mean'], item['weighted_mean'])
+                  for item in ranking['items']}
+        graded = {item['outcome_name']: (item['count'], pytest.approx(item['mean']),
+                                         pytest.approx(item['weighted_mean']))
+                  for item in grades['hc'] + grades['lo']}
+        assert ranked == graded
+    # #hc2's missing score doesn't pull its mean down to 2.0
+    assert ranked['#hc2'] == (1, 4.0, 4.0)
+
+def test_grades_per_outcome_and_course(synced_db):
+    grades = synced_db.get("/api/grades?by=hc,course").get_json()
+    assert grades['total']['count'] == 5
+    assert [(item['outcome_name'], item['count'], item['mean']) for item in grades['hc']] == [
+        ('#hc1', 3, pytest.approx(10 / 3)), ('#hc2', 1, 4.0)]
+    assert [(item['course_code'], item['count']) for item in grades['course']] == [('CS110', 3), ('CS111', 2)]
+    assert 'lo' not in grades
+
+    filtered = synced_db.get("/api/grades?by=lo&course=CS111").get_json()
+    assert [item['outcome_name'] for item in filtered['lo']] == ['CS111-lo1']
+    assert synced_db.get("/api/grades?by=student").status_code == 400
+
+def test_facets_from_columnar_snapshot(synced_db):
+    from backend.columns import activate_columns, write_columns
+
+    queries = ["/api/facets", "/api/facets?hc=%23hc1&minScore=3", "/api/facets?course=CS111&term=Fall%202024"]
+    from_sql = [synced_db.get(query).get_json() for query in queries]
+
+    write_columns(backend_app.db_path, backend_app.columns_dir, 2)
+    activate_columns(backend_app.columns_dir, 2)
+    assert backend_app.mapped_grade_engine() is not None
+    assert [synced_db.get(query).get_json() for query in queries] == from_sql
+    assert synced_db.get("/api/grades?by=hc").get_json()['hc'][0]['outcome_name'] == '#hc1'
+
+def test_simulate_scenarios(synced_db):
+    response = synced_db.post("/api/simulate", json={"scenarios": [
+        [{"outcome": "#hc2", "course": "CS111", "score": 2, "weight": "2x"}],
+        [{"assessment_id": 4, "score": 5}],
+    ]})
+    assert response.status_code == 200
+    added, changed = response.get_json()['scenarios']
+    # #hc2 had a single 4; adding a 2 weighted 2x gives (4 + 2 * 2) / 3
+    assert added['hc'][0]['before']['weighted_mean'] == 4.0
+    assert added['hc'][0]['after']['weighted_mean'] == pytest.approx(8 / 3)
+    # #hc1 was 5, 3 and 2; raising the 2 to 5 gives 13 / 3
+    assert changed['hc'][0]['after']['mean'] == pytest.approx(13 / 3)
+
+    assert synced_db.post("/api/simulate", json={"scenarios": "many"}).status_code == 400
+    assert synced_db.post("/api/simulate", json={"scenarios": [[{"assessment_id": 99, "score": 3}]]}).status_code == 400
+    for edit in ({"outcome": ["#hc2"], "course": "CS111", "score": 3},
+                 {"outcome": "#hc2", "course": {"name": "CS111"}, "score": 3},
+                 {"assessment_id": {}, "score": 3},
+                 {"assessment_id": [4], "score": 3},
+                 {"assessment_id": 4, "score": 3, "weight": "-3x"},
+                 {"outcome": "#hc2", "course": "CS111", "score": 3, "weight": 0}):
+        assert synced_db.post("/api/simulate", json={"scenarios": [[edit]]}).status_code == 400
+
+def test_summary_stream_generates_and_stores(synced_db, monkeypatch):
+    manager = backend_app.SummaryManager(backend_app.generate_summary, workers=1)
+    monkeypatch.setattr(backend_app, "summary_manager", manager)
+    conn = sqlite3.connect(backend_app.db_path)
+    conn.execute("UPDATE outcome_assessments SET comment = 'Great use of evidence to support the claim.' "
+                 "WHERE assessment_id = 1")
+    conn.execute("UPDATE outcome_assessments SET comment = 'You should address counterarguments more directly.' "
+                 "WHERE assessment_id = 3")
+    conn.commit()
+    conn.close()
+
+    response = synced_db.get("/api/ai-summaries/stream?outcome=%23hc1&summarizer=extractive")
+    assert response.mimetype == "text/event-stream"
+    body = response.get_data(as_text=True)
+    assert "event: token" in body
+    assert body.rstrip().splitlines()[-2] == "event: summary-done"
+
+    summaries = synced_db.get("/api/ai-summaries").get_json()
+    assert [summary['outcome_name'] for summary in summaries] == ['#hc1']
+    assert "Great use of evidence" in summaries[0]['strengths_text']
+    assert "counterarguments" in summaries[0]['improvement_text']
+
+    # A course slice is stored separately; asking again joins the finished job
+    created = synced_db.post("/api/ai-summaries/jobs", json={"outcome": "#hc1", "course": "CS110",
+                                                              "summarizer": "extractive"})
+    assert created.status_code in (200, 202)
+    job_id = created.get_json()['id']
+    for _ in range(500):
+        status = synced_db.get(f"/api/ai-summaries/jobs/{job_id}").get_json()
+        if status['state'] not in ('queued', 'running'):
+            break
+        time.sleep(0.01)
+    assert status['state'] == 'done'
+    again = synced_db.post("/api/ai-summaries/jobs", json={"outcome": "#hc1", "course": "CS110",
+                                                            "summarizer": "extractive"})
+    assert again.status_code == 200 and again.get_json()['id'] == job_id
+
+    conn = sqlite3.connect(backend_app.db_path)
+    assert conn.execute("SELECT course_code FROM all_scores_ai_summary_slices").fetchall() == [("CS110",)]
+    conn.close()
+
+def test_summary_streams_release_their_slot_and_head_starts_no_job(synced_db, monkeypatch):
+    runs = []
+    manager = backend_app.SummaryManager(lambda job, emit: runs.append(job.params) or {}, workers=1)
+    monkeypatch.setattr(backend_app, "summary_manager", manager)
+    monkeypatch.setattr(backend_app, "summary_streams", backend_app.threading.BoundedSemaphore(2))
+
+    for _ in range(4):
+        response = synced_db.head("/api/ai-summaries/stream?outcome=%23hc1&summarizer=extractive")
+        assert response.status_code == 200
+        response.close()
+    assert manager.stats()["jobs"] == 0
+
+    # Streams whose body is never read still give their slot back once the server closes them
+    job, _ = manager.submit("key", {"outcome": "#hc1"})
+    for _ in range(4):
+        response = synced_db.get(f"/api/ai-summaries/jobs/{job.id}/stream", buffered=False)
+        assert response.status_code == 200
+        response.close()
+    assert len(runs) == 1
+
+def test_summary_requests_are_validated(client_feedback):
+    assert client_feedback.get("/api/ai-summaries/stream").status_code == 400
+    assert client_feedback.post("/api/ai-summaries/jobs", json={"outcome": "#hc1", "summarizer": "gpt"}).status_code == 400
+    assert client_feedback.get("/api/ai-summaries/jobs/nope").status_code == 404
+    assert client_feedback.post("/api/ai-summaries/jobs", json={"outcome": ["#hc1"]}).status_code == 400
+    assert client_feedback.post("/api/ai-summaries/jobs", json={"outcome": "#hc1", "term": 2024}).status_code == 400
+    assert client_feedback.post("/api/ai-summaries/jobs", json=["#hc1"]).status_code == 400
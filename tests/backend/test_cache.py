@@ -0,0 +1,53 @@
+from backend.cache import ResultCache, data_version, make_key
+
+
+def test_make_key_normalizes_whitespace():
+    a = make_key("SELECT *\n    FROM all_scores  WHERE score >= ?", [3])
+    b = make_key("SELECT * FROM all_scores WHERE score >= ?", (3,))
+    assert a == b
+
+def test_hit_and_miss_counts():
+    cache = ResultCache(max_bytes=1024)
+    key = make_key("SELECT 1")
+
+    assert cache.get(key, version=1) is None
+    cache.put(key, 1, b"[1]")
+    assert cache.get(key, version=1) == b"[1]"
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+
+def test_evicts_least_recently_used_to_stay_under_size():
+    cache = ResultCache(max_bytes=10)
+    cache.put("a", 1, b"aaaa")
+    cache.put("b", 1, b"bbbb")
+    cache.get("a", 1)            # "a" is now the most recently used
+    cache.put("c", 1, b"cccc")   # needs room, so "b" goes
+
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) == b"aaaa"
+    assert cache.get("c", 1) == b"cccc"
+    assert cache.stats()["bytes"] <= 10
+    assert cache.stats()["evictions"] == 1
+
+def test_oversized_results_are_not_cached():
+    cache = ResultCache(max_bytes=4)
+    assert cache.put("big", 1, b"too large") is False
+    assert cache.get("big", 1) is None
+
+def test_new_data_version_invalidates_everything():
+    cache = ResultCache(max_bytes=1024)
+    cache.put("a", 1, b"old")
+    assert cache.get("a", 2) is None
+    assert cache.stats()["invalidations"] == 1
+
+def test_data_version_changes_when_file_is_written(tmp_path):
+    db = tmp_path / "data.db"
+    assert data_version(str(db)) is None
+
+    db.write_bytes(b"one")
+    before = data_version(str(db))
+    db.write_bytes(b"two and more")
+    assert data_version(str(db)) != before
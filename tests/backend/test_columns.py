@@ -0,0 +1,38 @@
+import os
+import numpy as np
+
+from backend.columns import CURRENT_FILE, activate_columns, open_columns, write_columns
+from tests.backend.test_snapshot import build_database
+
+
+def test_columns_round_trip(tmp_path):
+    db = str(tmp_path / "data.db")
+    build_database(db, [1, 2, 3])
+    root = str(tmp_path / "columns")
+
+    directory = write_columns(db, root, 1)
+    assert os.path.exists(os.path.join(directory, "score.npy"))
+    # Written but not active yet
+    assert open_columns(root, 1) is None
+
+    activate_columns(root, 1)
+    arrays = open_columns(root, 1)
+    assert arrays.mapped
+    assert len(arrays) == 3
+    assert list(arrays.outcomes) == ['#hc1']
+    assert np.all(arrays.score == 4)
+
+    # Columns from another sync than the one published are never served
+    assert open_columns(root, 2) is None
+
+
+def test_activate_keeps_only_recent_versions(tmp_path):
+    db = str(tmp_path / "data.db")
+    build_database(db, [1])
+    root = str(tmp_path / "columns")
+    for version in (1, 2, 3):
+        write_columns(db, root, version)
+        activate_columns(root, version)
+
+    assert sorted(os.listdir(root)) == [CURRENT_FILE, "v2", "v3"]
+    assert open_columns(root, 3) is not None
@@ -0,0 +1,86 @@
+import sqlite3
+import time
+
+import pytest
+
+from backend.events import EventHub, TooManySubscribers, format_event
+from backend.progress import SyncProgress, read_status
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+def make_hub(tmp_path, describe_version=lambda: {"version": 7}, **kwargs):
+    db_path = str(tmp_path / "data.db")
+    sqlite3.connect(db_path).close()
+    return EventHub(db_path, str(tmp_path / "sync_status.json"), describe_version,
+                    poll_interval=0.01, **kwargs)
+
+def write(db_path, sql):
+    conn = sqlite3.connect(db_path)
+    conn.execute(sql)
+    conn.commit()
+    conn.close()
+
+def test_format_event():
+    assert format_event("data-changed", {"version": 2}) == 'event: data-changed\ndata: {"version": 2}\n\n'
+
+def test_sync_progress_writes_status_file(tmp_path):
+    path = str(tmp_path / "sync_status.json")
+    progress = SyncProgress(path)
+    progress.update("fetching", "Fetching data from Forum", 1, 4)
+    assert read_status(path)["current"] == 1
+
+    progress.fail(RuntimeError("Forum is down"))
+    status = read_status(path)
+    assert status["state"] == "failed"
+    assert status["stage"] == "fetching"
+    assert status["message"] == "Forum is down"
+    assert read_status(str(tmp_path / "missing.json")) is None
+
+def test_hub_publishes_progress_and_data_changes(tmp_path):
+    sync = {"version": 7}
+    hub = make_hub(tmp_path, lambda: dict(sync))
+    subscriber = hub.subscribe()
+
+    SyncProgress(hub.status_path).update("views", "Creating views")
+    assert "event: sync-progress" in subscriber.get(timeout=5)
+
+    # A write that isn't a new sync (an AI summary, say) isn't announced
+    time.sleep(0.01)  # make sure the file's mtime moves
+    write(hub.db_path, "CREATE TABLE summaries (x)")
+    time.sleep(0.1)
+    assert subscriber.empty()
+
+    sync["version"] = 8
+    time.sleep(0.01)
+    write(hub.db_path, "CREATE TABLE t (x)")
+    assert subscriber.get(timeout=5) == format_event("data-changed", {"version": 8})
+
+    hub.unsubscribe(subscriber)
+    # The polling thread stops once nobody is listening
+    assert wait_for(lambda: hub._thread is None)
+
+def test_hub_limits_open_streams(tmp_path):
+    hub = make_hub(tmp_path, max_subscribers=1)
+    first = hub.subscribe()
+    with pytest.raises(TooManySubscribers):
+        hub.subscribe()
+    hub.unsubscribe(first)
+    hub.unsubscribe(hub.subscribe())
+
+def test_stream_sends_initial_events_then_heartbeats(tmp_path):
+    hub = make_hub(tmp_path)
+    subscriber = hub.subscribe()
+    stream = hub.stream(subscriber, [("data-version", {"version": 7})], heartbeat=0.01, max_duration=5)
+
+    assert next(stream) == "retry: 5000\n\n"
+    assert next(stream) == format_event("data-version", {"version": 7})
+    assert next(stream) == ": keep-alive\n\n"
+    stream.close()
+    assert hub.subscriber_count() == 0
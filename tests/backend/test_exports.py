@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+
+from backend.exports import ExportManager
+
+
+def wait_until_finished(manager, job, timeout=5):
+    deadline = time.monotonic() + timeout
+    while job.state in ("queued", "running"):
+        assert time.monotonic() < deadline, "export did not finish"
+        time.sleep(0.01)
+    return manager.get(job.id)
+
+def make_manager(tmp_path, run, **kwargs):
+    return ExportManager(str(tmp_path / "exports"), run, workers=1, **kwargs)
+
+def test_export_writes_file_and_reports_progress(tmp_path):
+    updates = []
+
+    def run(job, f):
+        for i in range(3):
+            f.write(f"row {i}\n")
+        manager.progress(job, 3, 3)
+
+    manager = make_manager(tmp_path, run, on_progress=lambda job: updates.append(job.state))
+    job, created = manager.submit("key", "csv", {})
+    assert created
+
+    job = wait_until_finished(manager, job)
+    assert job.state == "done"
+    assert job.rows_written == job.total_rows == 3
+    with open(job.path) as f:
+        assert f.read() == "row 0\nrow 1\nrow 2\n"
+    assert updates[0] == "running" and updates[-1] == "done"
+
+def test_identical_exports_are_deduplicated(tmp_path):
+    release = threading.Event()
+    calls = []
+
+    def slow_run(job, f):
+        calls.append(job.id)
+        release.wait(5)
+
+    manager = make_manager(tmp_path, slow_run)
+    first, _ = manager.submit("key", "csv", {})
+    second, created = manager.submit("key", "csv", {})
+    other, _ = manager.submit("other-key", "csv", {})
+    assert second is first and not created
+    assert other is not first
+
+    release.set()
+    wait_until_finished(manager, first)
+    wait_until_finished(manager, other)
+    assert len(calls) == 2
+    # Finished exports keep serving identical requests
+    assert manager.submit("key", "csv", {})[0] is first
+
+def test_failed_export_is_retried(tmp_path):
+    def failing_run(job, f):
+        raise RuntimeError("disk full")
+
+    manager = make_manager(tmp_path, failing_run)
+    job = wait_until_finished(manager, manager.submit("key", "csv", {})[0])
+    assert job.state == "failed"
+    assert job.error == "disk full"
+    assert os.listdir(manager.directory) == []
+    assert manager.submit("key", "csv", {})[1]
+
+def test_expired_and_oversized_exports_are_evicted(tmp_path):
+    manager = make_manager(tmp_path, lambda job, f: f.write("x" * 100), max_bytes=250)
+    jobs = [wait_until_finished(manager, manager.submit(k, "csv", {})[0]) for k in ("a", "b", "c")]
+
+    # Only two 100-byte files fit; the oldest one went first
+    assert manager.get(jobs[0].id) is None
+    assert not os.path.exists(jobs[0].path)
+    assert manager.get(jobs[2].id) is not None
+
+    manager.ttl = 0
+    time.sleep(0.01)
+    assert manager.get(jobs[2].id) is None
+    assert os.listdir(manager.directory) == []
+
+def test_exports_being_downloaded_are_not_evicted(tmp_path):
+    manager = make_manager(tmp_path, lambda job, f: f.write("x" * 100), max_bytes=150)
+    first = wait_until_finished(manager, manager.submit("a", "csv", {})[0])
+    job, f = manager.open(first.id)
+    assert job is first
+
+    # Over the size limit, so the next export goes instead of the one being sent
+    second, _ = manager.submit("b", "csv", {})
+    assert wait_until_finished(manager, second) is None
+    # And past its TTL, but still being sent
+    manager.ttl = 0
+    time.sleep(0.01)
+    assert manager.get(first.id) is first
+    assert f.read() == b"x" * 100
+
+    f.close()
+    assert manager.get(first.id) is None
+    assert os.listdir(manager.directory) == []
@@ -0,0 +1,126 @@
+import os
+import sqlite3
+import numpy as np
+import pytest
+
+from backend.grades import SQL_GROUP_STATS, GradeEngine, ScoreArrays, group_stats, edit_weight, load_score_arrays, parse_weight
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'backend')
+
+
+def make_rows(*rows):
+    keys = ('score', 'weight', 'outcome_name', 'course_code', 'course_title', 'term_title')
+    return [dict(zip(keys, row), assessment_id=i) for i, row in enumerate(rows, start=1)]
+
+
+def test_parse_weight():
+    assert parse_weight('8x') == 8.0
+    assert parse_weight(None) == 1.0
+    assert parse_weight('heavy') == 1.0
+
+
+def test_edit_weight():
+    assert edit_weight(1, '2x') == 2.0
+    assert edit_weight(1, 0.5) == 0.5
+    for weight in ('-3x', 0, 'heavy', float('inf'), True, [2]):
+        with pytest.raises(ValueError):
+            edit_weight(1, weight)
+
+
+def test_group_stats_weighted():
+    stats = group_stats(np.array([0, 0, 1]), 3, np.array([2.0, 5.0, 4.0]), np.array([1.0, 2.0, 1.0]))
+    assert list(stats['count']) == [2, 1, 0]
+    assert stats['weighted_mean'][0] == pytest.approx(4.0)
+    # (1 * (2 - 4)^2 + 2 * (5 - 4)^2) / 3
+    assert stats['variance'][0] == pytest.approx(2.0)
+    assert stats['variance'][1] == 0
+    assert np.isnan(stats['mean'][2])
+
+
+def test_engine_groups_and_filters():
+    engine = GradeEngine(ScoreArrays.from_rows(make_rows(
+        (2, '1x', '#hc1', 'CS110', 'Course', 'Fall'),
+        (5, '2x', '#hc1', 'CS110', 'Course', 'Spring'),
+        (4, None, 'CS111-lo1', 'CS111', 'Other', 'Fall'),
+    )))
+    grades = engine.grades()
+    assert grades['total']['count'] == 3
+    assert [(g['outcome_name'], g['weighted_mean']) for g in grades['hc']] == [('#hc1', pytest.approx(4.0))]
+    assert [g['outcome_name'] for g in grades['lo']] == ['CS111-lo1']
+    assert [(g['course_code'], g['course_title']) for g in grades['course']] == [('CS110', 'Course'), ('CS111', 'Other')]
+
+    fall = engine.grades(('term',), terms=['Fall'], min_score=3)
+    assert fall['total']['count'] == 1
+    assert [(g['term_title'], g['count']) for g in fall['term']] == [('Fall', 1)]
+
+
+def test_engine_matches_sql(tmp_path):
+    path = str(tmp_path / "data.db")
+    conn = sqlite3.connect(path)
+    with open(os.path.join(BACKEND_DIR, "schema.sql")) as f:
+        conn.executescript(f.read())
+    conn.execute("INSERT INTO colleges VALUES (1, 'CS', 'Computational Sciences', NULL)")
+    conn.execute("INSERT INTO terms VALUES (1, 'Fall 2024', NULL)")
+    conn.execute("INSERT INTO courses VALUES (1, 'Course', 'CS110', 1, 1, 'active', NULL)")
+    conn.execute("INSERT INTO learning_outcomes VALUES (1, 1, 'desc', '#hc1', NULL)")
+    conn.execute("INSERT INTO learning_outcomes VALUES (2, 1, 'desc', 'CS110-lo1', NULL)")
+    conn.execute("INSERT INTO assignments_data VALUES ('7', '1', 's', 'Essay', '8x', NULL, NULL)")
+    for i, (outcome, score, kind) in enumerate([(1, 3, 'class'), (1, 5, 'assignment'), (2, 2, 'class'),
+                                                (2, 4, 'assignment'), (2, None, 'class')]):
+        conn.execute("""
+            INSERT INTO outcome_assessments (assessment_id, outcome_id, score, type, assignment_id)
+            VALUES (?, ?, ?, ?, ?)
+        """, (i, outcome, score, kind, '7' if kind == 'assignment' else None))
+    with open(os.path.join(BACKEND_DIR, "views.sql")) as f:
+        conn.executescript(f.read())
+    conn.commit()
+    conn.row_factory = sqlite3.Row
+
+    engine = GradeEngine(load_score_arrays(conn.cursor()))
+    grades = engine.grades()
+    sql = {row['value']: row for row in conn.execute(SQL_GROUP_STATS.format(column='outcome_name'))}
+    conn.close()
+
+    for item in grades['hc'] + grades['lo']:
+        row = sql[item['outcome_name']]
+        assert item['count'] == row['count']
+        assert item['weighted_mean'] == pytest.approx(row['weighted_mean'])
+        assert item['variance'] == pytest.approx(row['variance'])
+    # The 8x assignment dominates: (3 + 8 * 5) / 9
+    assert grades['hc'][0]['weighted_mean'] == pytest.approx(43 / 9)
+
+
+def test_simulate_matches_recomputing():
+    rows = make_rows(
+        (2, '1x', '#hc1', 'CS110', 'Course', 'Fall'),
+        (5, '2x', '#hc1', 'CS110', 'Course', 'Spring'),
+        (4, None, 'CS111-lo1', 'CS111', 'Other', 'Fall'),
+    )
+    engine = GradeEngine(ScoreArrays.from_rows(rows))
+    added = {'outcome': '#hc1', 'course': 'CS111', 'score': 3, 'weight': '4x'}
+    changed = {'assessment_id': 2, 'score': 1}
+    results = engine.simulate([[added], [changed], []])
+
+    expected_added = GradeEngine(ScoreArrays.from_rows(rows + make_rows((3, '4x', '#hc1', 'CS111', 'Other', 'Fall'))))
+    rows[1] = dict(rows[1], score=1)
+    expected_changed = GradeEngine(ScoreArrays.from_rows(rows))
+
+    for result, expected in ((results[0], expected_added.grades()), (results[1], expected_changed.grades())):
+        for grouping, key in (('hc', 'outcome_name'), ('course', 'course_code')):
+            projected = {item[key]: item['after'] for item in result[grouping]}
+            for item in expected[grouping]:
+                if item[key] in projected:
+                    assert projected[item[key]]['count'] == item['count']
+                    assert projected[item[key]]['weighted_mean'] == pytest.approx(item['weighted_mean'])
+                    assert projected[item[key]]['variance'] == pytest.approx(item['variance'])
+
+    # Adding to CS111 touches #hc1 and CS111 only; the change touches #hc1 and CS110
+    assert [item['course_code'] for item in results[0]['course']] == ['CS111']
+    assert results[0]['hc'][0]['before']['count'] == 2
+    assert [item['course_code'] for item in results[1]['course']] == ['CS110']
+    assert results[2] == {'hc': [], 'lo': [], 'course': []}
+
+    with pytest.raises(ValueError):
+        engine.simulate([[{'outcome': '#hc9', 'course': 'CS110', 'score': 3}]])
+    with pytest.raises(ValueError):
+        engine.simulate([[{'assessment_id': 2, 'score': 7}]])
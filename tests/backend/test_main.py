@@ -52,3 +52,67 @@ def test_fetch_data_from_api_failure(mock_get):
 
     result = main.fetch_data_from_api("http://fake.url", headers={})
     assert result is None
+
+def test_outcome_assessment_sync_records_changes(tmp_path):
+    db_file = str(tmp_path / "test.db")
+    schema_file = os.path.join(os.path.dirname(main.__file__), "schema.sql")
+    main.initialize_database(db_file, schema_file)
+    conn = sqlite3.connect(db_file)
+    cursor = conn.cursor()
+
+    main.insert_outcome_assessments(cursor, [{"id": 1, "score": 3}, {"id": 2, "score": 4}, {"score": 5}])
+    cursor.execute("INSERT INTO sync_runs (version) VALUES (1)")
+
+    # Second sync: 1 is unchanged, 2 is regraded, 3 is new and the missing id-less row never existed
+    outcomes = [{"id": 1, "score": 3}, {"id": 2, "score": 2}, {"id": 3, "score": 5}]
+    main.insert_outcome_assessments(cursor, outcomes)
+    assert main.prune_outcome_assessments(cursor, outcomes[1:], max_fraction=0.5) == 1
+    conn.commit()
+
+    changes = dict(cursor.execute("SELECT assessment_id, change FROM score_changes WHERE version = 2"))
+    assert changes == {1: "delete", 2: "update", 3: "insert"}
+    assert cursor.execute("SELECT COUNT(*) FROM outcome_assessments").fetchone()[0] == 2
+    conn.close()
+
+def test_prune_refuses_to_remove_too_many_assessments(tmp_path, monkeypatch):
+    db_file = str(tmp_path / "test.db")
+    main.initialize_database(db_file, os.path.join(os.path.dirname(main.__file__), "schema.sql"))
+    conn = sqlite3.connect(db_file)
+    cursor = conn.cursor()
+    main.insert_outcome_assessments(cursor, [{"id": i, "score": 3} for i in range(1, 11)])
+
+    # A truncated response missing 2 of 10 assessments is over the default 10%
+    truncated = [{"id": i, "score": 3} for i in range(1, 9)]
+    assert main.prune_outcome_assessments(cursor, truncated) == 0
+    assert cursor.execute("SELECT COUNT(*) FROM outcome_assessments").fetchone()[0] == 10
+    monkeypatch.setenv("SYNC_PRUNE_MAX_FRACTION", "0.2")
+    assert main.prune_outcome_assessments(cursor, truncated) == 2
+    conn.close()
+
+def test_changed_courses_and_assignments_mark_their_assessments(tmp_path):
+    db_file = str(tmp_path / "test.db")
+    main.initialize_database(db_file, os.path.join(os.path.dirname(main.__file__), "schema.sql"))
+    conn = sqlite3.connect(db_file)
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO learning_outcomes (outcome_id, course_id, description, name) VALUES (1, 10, '', '#hc1')")
+    main.insert_outcome_assessments(cursor, [{"id": 1, "score": 3, "learning-outcome": 1, "assignment-id": 7},
+                                             {"id": 2, "score": 4, "learning-outcome": 1}])
+    lo_trees = [{"course": {"id": 10, "title": "Course", "course-code": "CS110", "term": 1}}]
+    main.insert_courses(cursor, lo_trees)
+    main.insert_assignment_data(cursor, {"id": 7, "title": "Essay", "weight": "2x"})
+    # Within the sync that inserted them, the assessments stay inserts
+    assert dict(cursor.execute("SELECT assessment_id, change FROM score_changes")) == {1: "insert", 2: "insert"}
+    cursor.execute("INSERT INTO sync_runs (version) VALUES (1)")
+
+    # Next sync: unchanged rows mark nothing; a renamed course and a reweighted assignment do
+    main.insert_courses(cursor, lo_trees)
+    main.insert_assignment_data(cursor, {"id": 7, "title": "Essay", "weight": "2x"})
+    assert cursor.execute("SELECT COUNT(*) FROM score_changes WHERE version = 2").fetchone()[0] == 0
+    main.insert_assignment_data(cursor, {"id": 7, "title": "Essay", "weight": "4x"})
+    assert dict(cursor.execute("SELECT assessment_id, change FROM score_changes WHERE version = 2")) == {1: "update"}
+    lo_trees[0]["course"]["title"] = "Renamed course"
+    main.insert_courses(cursor, lo_trees)
+    assert dict(cursor.execute("SELECT assessment_id, change FROM score_changes WHERE version = 2")) == {
+        1: "update", 2: "update"}
+    assert cursor.execute("SELECT course_title FROM courses").fetchone()[0] == "Renamed course"
+    conn.close()
@@ -0,0 +1,51 @@
+import sqlite3
+import pytest
+
+from backend import metrics
+from backend.metrics import Counter, Histogram, Registry
+from backend.queries import run_query
+
+
+def test_counter_renders_labels():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests.", ("route",))
+    requests.inc(route="/api/feedback")
+    requests.inc(2, route="/api/feedback")
+
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{route="/api/feedback"} 3' in text
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.register(Histogram("latency_seconds", "Latency.", ("query",), (0.1, 1.0)))
+    latency.observe(0.05, query="q")
+    latency.observe(0.5, query="q")
+    latency.observe(5, query="q")
+
+    text = registry.render()
+    assert 'latency_seconds_bucket{query="q",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{query="q",le="1"} 2' in text
+    assert 'latency_seconds_bucket{query="q",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{query="q"} 3' in text
+
+def test_label_values_are_escaped():
+    counter = Counter("c_total", "C.", ("name",))
+    counter.inc(name='say "hi"\n')
+    assert list(counter.samples()) == ['c_total{name="say \\"hi\\"\\n"} 1']
+
+def test_run_query_records_rows_and_errors():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.executemany("INSERT INTO t VALUES (?)", [(1,), (2,), (3,)])
+    cursor = conn.cursor()
+
+    before = metrics.DB_QUERY_LATENCY.count(query="test_rows")
+    rows = run_query(cursor, "test_rows", "SELECT x FROM t WHERE x >= ?", (2,))
+    assert [r[0] for r in rows] == [2, 3]
+    assert metrics.DB_QUERY_LATENCY.count(query="test_rows") == before + 1
+
+    errors = metrics.DB_QUERY_ERRORS.value(query="test_error")
+    with pytest.raises(sqlite3.OperationalError):
+        run_query(cursor, "test_error", "SELECT * FROM missing_table")
+    assert metrics.DB_QUERY_ERRORS.value(query="test_error") == errors + 1
@@ -0,0 +1,52 @@
+import sqlite3
+import pytest
+
+from backend.pool import ConnectionPool, PoolTimeout
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    path = tmp_path / "data.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE terms (term_id INTEGER PRIMARY KEY, term_title TEXT)")
+    conn.execute("INSERT INTO terms VALUES (1, 'Fall 2024')")
+    conn.commit()
+    conn.close()
+    return str(path)
+
+def test_pool_reuses_connections(db_file):
+    pool = ConnectionPool(db_file, size=2)
+
+    conn = pool.acquire()
+    raw = conn.raw
+    conn.close()
+
+    # The same connection should come back after being released
+    again = pool.acquire()
+    assert again.raw is raw
+    again.close()
+
+def test_pool_connections_are_read_only(db_file):
+    pool = ConnectionPool(db_file, size=1)
+    with pool.acquire() as conn:
+        row = conn.execute("SELECT term_title FROM terms").fetchone()
+        assert row["term_title"] == "Fall 2024"
+
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("INSERT INTO terms VALUES (2, 'Spring 2025')")
+
+def test_pool_times_out_when_exhausted(db_file):
+    pool = ConnectionPool(db_file, size=1, timeout=0.05)
+    held = pool.acquire()
+
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+
+    held.close()
+    pool.acquire().close()
+
+def test_pool_tunes_cache_and_mmap(db_file):
+    pool = ConnectionPool(db_file, size=1, cache_size_kib=4096, mmap_size=1024 * 1024)
+    with pool.acquire() as conn:
+        assert conn.execute("PRAGMA cache_size").fetchone()[0] == -4096
+        assert conn.execute("PRAGMA query_only").fetchone()[0] == 1
@@ -0,0 +1,49 @@
+import sqlite3
+import pytest
+
+from backend import queries
+from backend.queries import Deadline, QueryTimeout, ClientDisconnected, run_query
+
+# Counts to a very large number so it only finishes if nothing interrupts it
+SLOW_SQL = """
+    WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 100000000)
+    SELECT COUNT(*) FROM n
+"""
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    yield conn
+    queries.set_deadline(None)
+    conn.close()
+
+def test_deadline_interrupts_long_query(conn):
+    deadline = Deadline(0.05)
+    queries.set_deadline(deadline)
+    deadline.attach(conn)
+
+    with pytest.raises(QueryTimeout) as exc_info:
+        run_query(conn.cursor(), "slow_count", SLOW_SQL)
+    assert exc_info.value.status_code == 504
+
+def test_disconnected_client_cancels_query(conn):
+    deadline = Deadline(60, is_disconnected=lambda: True)
+    queries.set_deadline(deadline)
+    deadline.attach(conn)
+
+    with pytest.raises(ClientDisconnected):
+        run_query(conn.cursor(), "slow_count", SLOW_SQL)
+
+def test_query_within_deadline_completes(conn):
+    deadline = Deadline(60)
+    queries.set_deadline(deadline)
+    deadline.attach(conn)
+
+    rows = run_query(conn.cursor(), "quick", "SELECT 1")
+    assert rows[0][0] == 1
+
+def test_other_errors_are_not_converted(conn):
+    queries.set_deadline(Deadline(60))
+    with pytest.raises(sqlite3.OperationalError):
+        run_query(conn.cursor(), "missing", "SELECT * FROM missing_table")
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+from backend import queries
+from backend.singleflight import SingleFlight
+
+
+def run_concurrently(flight, key, fn, callers):
+    results = [None] * callers
+    errors = [None] * callers
+
+    def call(i):
+        try:
+            results[i] = flight.do(key, fn)
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+    for t in threads:
+        t.start()
+    return threads, results, errors
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow_query():
+        calls.append(1)
+        release.wait(5)
+        return b"rows"
+
+    threads, results, errors = run_concurrently(flight, "all_scores", slow_query, callers=5)
+    # Give every caller time to join the in-flight call before it finishes
+    deadline = time.time() + 5
+    while flight.stats()["followers"] < 4 and time.time() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert all(result[0] == b"rows" for result in results)
+    assert sorted(result[1] for result in results) == [False, True, True, True, True]
+    assert flight.stats()["coalescing_rate"] == 0.8
+    assert flight.in_flight() == 0
+
+def test_errors_are_shared_and_key_is_released():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def failing_query():
+        release.wait(5)
+        raise RuntimeError("database is locked")
+
+    threads, results, errors = run_concurrently(flight, "q", failing_query, callers=3)
+    deadline = time.time() + 5
+    while flight.stats()["followers"] < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert all(isinstance(e, RuntimeError) for e in errors)
+    # A later call runs again instead of reusing the failure
+    assert flight.do("q", lambda: "ok") == ("ok", False)
+
+def test_different_keys_run_independently():
+    flight = SingleFlight()
+    assert flight.do("a", lambda: 1) == (1, False)
+    assert flight.do("b", lambda: 2) == (2, False)
+    assert flight.stats()["followers"] == 0
+
+@pytest.mark.parametrize("deadline, error", [
+    (queries.Deadline(0.1), queries.QueryTimeout),
+    (queries.Deadline(30, is_disconnected=lambda: True), queries.ClientDisconnected),
+])
+def test_followers_stop_waiting_at_their_own_deadline(deadline, error):
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def slow_query():
+        release.wait(5)
+        return b"rows"
+
+    threads, results, errors = run_concurrently(flight, "q", slow_query, callers=1)
+    while flight.in_flight() == 0:
+        time.sleep(0.01)
+    queries.set_deadline(deadline)
+    try:
+        with pytest.raises(error):
+            flight.do("q", slow_query)
+    finally:
+        queries.set_deadline(None)
+
+    # The leader isn't affected
+    release.set()
+    threads[0].join()
+    assert results[0] == (b"rows", False)
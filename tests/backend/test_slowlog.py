@@ -0,0 +1,53 @@
+import json
+import sqlite3
+import pytest
+
+from backend import slowlog
+from backend.queries import run_many, run_query
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / "slow.log"
+    original = slowlog.threshold_ms
+    slowlog.configure(path=str(path), threshold=0)
+    yield path
+    slowlog.configure(path=str(tmp_path / "unused.log"), threshold=original)
+
+@pytest.fixture
+def cursor():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE scores (outcome_name TEXT, score REAL)")
+    conn.executemany("INSERT INTO scores VALUES (?, ?)", [("#hc1", 4.0), ("#hc2", 3.0)])
+    return conn.cursor()
+
+def test_slow_query_logged_with_plan(log_file, cursor):
+    run_query(cursor, "scores_by_outcome", "SELECT score FROM scores WHERE outcome_name = ?", ("#hc1",))
+
+    entry = json.loads(log_file.read_text().strip().splitlines()[-1])
+    assert entry["query"] == "scores_by_outcome"
+    assert entry["sql"] == "SELECT score FROM scores WHERE outcome_name = ?"
+    assert entry["params"] == ["#hc1"]
+    assert entry["rows"] == 1
+    assert entry["duration_ms"] >= 0
+    assert any("SCAN scores" in line for line in entry["plan"])
+
+def test_slow_batch_logged_with_first_row(log_file, cursor):
+    rows = ((f"#hc{i}", float(i)) for i in range(3, 6))
+    assert run_many(cursor, "scores_insert", "INSERT INTO scores VALUES (?, ?)", rows) == 3
+
+    entry = json.loads(log_file.read_text().strip().splitlines()[-1])
+    assert entry["query"] == "scores_insert"
+    assert entry["params"] == ["#hc3", "3.0"]
+    assert entry["rows"] == 3
+    assert cursor.execute("SELECT COUNT(*) FROM scores").fetchone()[0] == 5
+
+def test_fast_query_not_logged(log_file, cursor):
+    slowlog.threshold_ms = 60_000
+    run_query(cursor, "fast", "SELECT 1")
+    assert not log_file.exists() or log_file.read_text() == ""
+
+def test_long_params_are_truncated(log_file, cursor):
+    run_query(cursor, "long_param", "SELECT ?", ("x" * 1000,))
+    entry = json.loads(log_file.read_text().strip().splitlines()[-1])
+    assert entry["params"][0].endswith("(1000 chars)")
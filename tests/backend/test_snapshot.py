@@ -0,0 +1,178 @@
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from backend.pool import ConnectionPool
+from backend.snapshot import (
+    CARRIED_TABLES, SnapshotError, begin_snapshot, count_rows, discard_snapshot, publish_snapshot,
+    record_sync_run, summarize_changes, validate_snapshot,
+)
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'backend')
+
+
+def build_database(path, assessments):
+    conn = sqlite3.connect(path)
+    with open(os.path.join(BACKEND_DIR, "schema.sql")) as f:
+        conn.executescript(f.read())
+    conn.execute("INSERT OR IGNORE INTO colleges VALUES (1, 'CS', 'Computational Sciences', NULL)")
+    conn.execute("INSERT OR IGNORE INTO terms VALUES (1, 'Fall 2024', NULL)")
+    conn.execute("INSERT OR IGNORE INTO courses VALUES (1, 'Course', 'CS110', 1, 1, 'active', NULL)")
+    conn.execute("INSERT OR IGNORE INTO learning_outcomes VALUES (1, 1, 'desc', '#hc1', NULL)")
+    for assessment_id in assessments:
+        conn.execute("""
+            INSERT OR IGNORE INTO outcome_assessments (assessment_id, outcome_id, score, type)
+            VALUES (?, 1, 4, 'class')
+        """, (assessment_id,))
+    with open(os.path.join(BACKEND_DIR, "views.sql")) as f:
+        conn.executescript(f.read())
+    conn.commit()
+    conn.close()
+
+def count_assessments(conn):
+    return conn.execute("SELECT COUNT(*) FROM all_scores").fetchone()[0]
+
+def test_begin_snapshot_copies_live_database(tmp_path):
+    live = str(tmp_path / "data.db")
+    build_database(live, [1, 2])
+
+    build = begin_snapshot(live)
+    assert build != live
+    conn = sqlite3.connect(build)
+    assert count_assessments(conn) == 2
+    conn.close()
+
+def test_validate_rejects_missing_views(tmp_path):
+    path = str(tmp_path / "broken.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE outcome_assessments (assessment_id INTEGER)")
+    conn.close()
+
+    with pytest.raises(SnapshotError) as exc_info:
+        validate_snapshot(path)
+    assert "view all_scores" in str(exc_info.value)
+
+def test_publish_swaps_in_new_data_for_open_pool(tmp_path):
+    live = str(tmp_path / "data.db")
+    build_database(live, [1])
+
+    pool = ConnectionPool(live, size=2)
+    with pool.acquire() as conn:
+        assert count_assessments(conn) == 1
+
+    build = begin_snapshot(live)
+    build_database(build, [2, 3])
+    validate_snapshot(build)
+    publish_snapshot(build, live)
+
+    assert not os.path.exists(build)
+    # The pooled connection to the old file is replaced on the next checkout
+    with pool.acquire() as conn:
+        assert count_assessments(conn) == 3
+
+def test_request_in_flight_during_swap_finishes_on_old_snapshot(tmp_path):
+    live = str(tmp_path / "data.db")
+    build_database(live, [1])
+    pool = ConnectionPool(live, size=2)
+
+    in_flight = pool.acquire()
+    build = begin_snapshot(live)
+    build_database(build, [2])
+    publish_snapshot(build, live)
+
+    # Still reads the snapshot it started with, and is retired when handed back
+    assert count_assessments(in_flight) == 1
+    in_flight.close()
+    with pool.acquire() as conn:
+        assert count_assessments(conn) == 2
+
+def test_discard_removes_build_files(tmp_path):
+    build = str(tmp_path / "data.db.next")
+    open(build, "w").close()
+    open(build + "-journal", "w").close()
+    discard_snapshot(build)
+    assert not os.path.exists(build)
+    assert not os.path.exists(build + "-journal")
+
+def test_sync_run_records_changed_rows(tmp_path):
+    live = str(tmp_path / "data.db")
+    build_database(live, [1])
+
+    build = begin_snapshot(live)
+    before = count_rows(build)
+    build_database(build, [2, 3])
+    summary = summarize_changes(before, count_rows(build))
+    version = record_sync_run(build, "2024-10-01T00:00:00+00:00", summary)
+
+    assert summary["outcome_assessments"] == {"rows": 3, "delta": 2}
+    assert summary["courses"] == {"rows": 1, "delta": 0}
+    assert record_sync_run(build, None, {}) == version + 1
+
+def test_publish_keeps_summaries_written_during_the_sync(tmp_path):
+    live = str(tmp_path / "data.db")
+    build_database(live, [1])
+    conn = sqlite3.connect(live)
+    conn.execute("CREATE TABLE all_scores_ai_summaries (outcome_name TEXT PRIMARY KEY, strengths_text TEXT)")
+    conn.execute("CREATE INDEX idx_summaries_strengths ON all_scores_ai_summaries (strengths_text)")
+    conn.execute("INSERT INTO all_scores_ai_summaries VALUES ('#hc1', 'before the sync')")
+    conn.commit()
+
+    build = begin_snapshot(live)
+    # Written to the live file while the sync is still ingesting
+    conn.execute("UPDATE all_scores_ai_summaries SET strengths_text = 'during the sync'")
+    conn.execute("INSERT INTO all_scores_ai_summaries VALUES ('#hc2', 'during the sync')")
+    conn.commit()
+    conn.close()
+    build_database(build, [2])
+    validate_snapshot(build)
+    publish_snapshot(build, live)
+
+    conn = sqlite3.connect(live)
+    assert conn.execute("SELECT * FROM all_scores_ai_summaries ORDER BY outcome_name").fetchall() == [
+        ("#hc1", "during the sync"), ("#hc2", "during the sync")]
+    assert conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name = 'idx_summaries_strengths'"
+                        ).fetchall() == [("idx_summaries_strengths",)]
+    assert count_assessments(conn) == 2
+    conn.close()
+    assert "ai_summary_usage" in CARRIED_TABLES
+
+def test_writer_blocked_by_publish_writes_to_the_new_file(tmp_path, monkeypatch):
+    from backend import snapshot
+    from backend.summaries import store_slice_summary
+    live = str(tmp_path / "data.db")
+    build_database(live, [1])
+    build = begin_snapshot(live)
+    build_database(build, [2])
+
+    writers = []
+    real_carry_forward = snapshot.carry_forward
+
+    def carry_forward_while_a_summary_is_stored(live_path, build_path, tables):
+        # An on-demand summary finishes while publish is copying the carried tables
+        writer = threading.Thread(target=store_slice_summary, args=(
+            live_path, "#hc1", "CS110", "", 1, "desc", "Strong", "Weak", "hash"))
+        writer.start()
+        writers.append(writer)
+        time.sleep(0.2)
+        assert writer.is_alive()  # waiting for the lock
+        real_carry_forward(live_path, build_path, tables)
+
+    monkeypatch.setattr(snapshot, "carry_forward", carry_forward_while_a_summary_is_stored)
+    publish_snapshot(build, live)
+    writers[0].join(5)
+
+    conn = sqlite3.connect(live)
+    assert conn.execute("SELECT outcome_name, course_code, strengths_text FROM all_scores_ai_summary_slices"
+                        ).fetchall() == [("#hc1", "CS110", "Strong")]
+    assert count_assessments(conn) == 2
+    conn.close()
+
+def test_write_lock_times_out(tmp_path):
+    from backend.snapshot import write_lock
+    live = str(tmp_path / "data.db")
+    with write_lock(live):
+        with pytest.raises(SnapshotError):
+            publish_snapshot(str(tmp_path / "missing.next"), live, lock_timeout=0.1)
@@ -0,0 +1,164 @@
+import sqlite3
+import threading
+import time
+from unittest.mock import Mock
+
+import openai
+import pytest
+
+from backend.summaries import SummaryManager, UsageLedger, generate_slice, store_slice_summary, store_summary_usage
+from prompt import Comment
+
+ANSWER = "Strengths:\nYou demonstrated A\nYour work shows B\n\nAreas for Improvement:\nPractice C\nFocus on D\nStrengthen E"
+
+
+def wait_until_finished(job, timeout=5):
+    deadline = time.monotonic() + timeout
+    while job.state in ("queued", "running"):
+        assert time.monotonic() < deadline, "summary did not finish"
+        time.sleep(0.01)
+    return job
+
+def test_stream_replays_tokens_for_late_watchers():
+    def run(job, emit):
+        for piece in ("Strengths:", " A"):
+            emit(piece)
+        return {"strengths_text": "A"}
+
+    manager = SummaryManager(run, workers=1)
+    job, created = manager.submit("key", {"outcome": "#hc1"})
+    assert created
+    wait_until_finished(job)
+
+    body = "".join(manager.stream(job))
+    assert body.startswith("retry:")
+    assert body.index('"text": "Strengths:"') < body.index('"text": " A"') < body.index("event: summary-done")
+    assert job.text == "Strengths: A"
+    assert job.to_dict()["summary"] == {"strengths_text": "A"}
+
+def test_identical_requests_share_one_job():
+    release = threading.Event()
+    calls = []
+
+    def run(job, emit):
+        calls.append(job.params)
+        release.wait(5)
+        emit("done")
+        return {}
+
+    manager = SummaryManager(run, workers=2)
+    first, created = manager.submit(("#hc1", "", ""), {"outcome": "#hc1"})
+    second, created_again = manager.submit(("#hc1", "", ""), {"outcome": "#hc1"})
+    other, _ = manager.submit(("#hc2", "", ""), {"outcome": "#hc2"})
+    assert created and not created_again
+    assert second is first and other is not first
+
+    # Two clients follow the same job while it runs
+    bodies = []
+    readers = [threading.Thread(target=lambda: bodies.append("".join(manager.stream(first)))) for _ in range(2)]
+    for reader in readers:
+        reader.start()
+    release.set()
+    for reader in readers:
+        reader.join(5)
+    wait_until_finished(other)
+
+    assert len(calls) == 2
+    assert len(bodies) == 2 and all("event: summary-done" in body for body in bodies)
+
+def test_failed_job_reports_error_and_is_retried():
+    attempts = []
+
+    def run(job, emit):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ValueError("No comments")
+        return {}
+
+    manager = SummaryManager(run, workers=1)
+    job, _ = manager.submit("key", {})
+    wait_until_finished(job)
+    assert job.state == "failed"
+    assert 'event: summary-failed\ndata: {"error": "No comments"}' in "".join(manager.stream(job))
+
+    retry, created = manager.submit("key", {})
+    assert created and retry is not job
+    assert wait_until_finished(retry).state == "done"
+
+def test_generate_slice_streams_model_answer():
+    client = Mock()
+    client.ChatCompletion.create.return_value = iter(
+        [{"choices": [{"delta": {"role": "assistant"}}]}] +
+        [{"choices": [{"delta": {"content": ANSWER[i:i + 10]}}]} for i in range(0, len(ANSWER), 10)])
+    pieces = []
+
+    strengths, improvement, summary_hash = generate_slice(
+        client, "openai", "#hc1", "desc", [Comment("Solid work on the evidence.", 4, "2024-01-01")], pieces.append)
+
+    assert "".join(pieces) == ANSWER
+    assert strengths == "You demonstrated A\nYour work shows B"
+    assert improvement == "Practice C\nFocus on D\nStrengthen E"
+    assert client.ChatCompletion.create.call_args.kwargs["stream"] is True
+    assert summary_hash
+
+def test_generate_slice_waits_for_the_limiter_on_every_attempt():
+    client = Mock()
+    client.ChatCompletion.create.side_effect = [
+        openai.error.RateLimitError("Slow down", headers={"retry-after": "0"}),
+        iter([{"choices": [{"delta": {"content": ANSWER}}]}]),
+    ]
+    limiter = Mock()
+
+    strengths, _, _ = generate_slice(client, "openai", "#hc1", "desc",
+                                     [Comment("Solid work on the evidence.", 4, "2024-01-01")], lambda text: None,
+                                     limiter=limiter)
+
+    assert strengths == "You demonstrated A\nYour work shows B"
+    assert client.ChatCompletion.create.call_count == 2
+    assert limiter.acquire.call_count == 2
+    assert limiter.acquire.call_args.args[0] > 800  # the prompt plus the longest answer
+    limiter.back_off.assert_called_once_with(0.0)
+
+def test_generate_slice_without_comments():
+    with pytest.raises(ValueError):
+        generate_slice(Mock(), "extractive", "#hc1", "desc", [], lambda text: None)
+
+def test_store_slice_summary_tables(tmp_path):
+    path = str(tmp_path / "data.db")
+    store_slice_summary(path, "#hc1", "", "", 1, "desc", "S", "I", "h1")
+    store_slice_summary(path, "#hc1", "CS110", "Fall 2024", 1, "desc", "S2", "I2", "h2")
+    store_slice_summary(path, "#hc1", "CS110", "Fall 2024", 1, "desc", "S3", "I3", "h3")
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT outcome_name, strengths_text, input_hash FROM all_scores_ai_summaries").fetchall() == \
+        [("#hc1", "S", "h1")]
+    assert conn.execute("SELECT course_code, term_title, strengths_text FROM all_scores_ai_summary_slices").fetchall() == \
+        [("CS110", "Fall 2024", "S3")]
+    conn.close()
+
+def test_generation_usage_is_stored(tmp_path):
+    client = Mock()
+    client.ChatCompletion.create.side_effect = [
+        openai.error.RateLimitError("Slow down", headers={"retry-after": "0"}),
+        iter([{"choices": [{"delta": {"content": ANSWER}}]}]),
+    ]
+    ledger = UsageLedger()
+    ledger.start_run("api-job")
+
+    strengths, improvement, summary_hash = generate_slice(
+        client, "openai", "#hc1", "desc", [Comment("Solid work on the evidence.", 4, "2024-01-01")], lambda text: None,
+        ledger=ledger)
+    path = str(tmp_path / "data.db")
+    store_slice_summary(path, "#hc1", "CS110", "", 1, "desc", strengths, improvement, summary_hash,
+                        usage=ledger.drain())
+    store_summary_usage(path, [("api-failed", "#hc2", "summary", "gpt-3.5-turbo", None, None, 10.0, 0,
+                                "AuthenticationError", 0.0, "2025-01-01 10:00:00")])
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT run_id, outcome, request, retries, status, completion_tokens > 0 "
+                        "FROM ai_summary_usage ORDER BY id").fetchall() == [
+        ("api-job", "#hc1", "summary", 0, "RateLimitError", None),
+        ("api-job", "#hc1", "summary", 1, "ok", 1),
+        ("api-failed", "#hc2", "summary", 0, "AuthenticationError", None),
+    ]
+    conn.close()